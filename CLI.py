@@ -4,9 +4,13 @@ NYC Metro Route Planner - 交互式命令行版本
 Interactive Command-Line Version
 """
 
-import pickle
 import os
-from Dijkstra import dijkstra
+from Dijkstra import find_route, tree_cache_stats, ROUTING_ALGORITHMS, DEFAULT_ALGORITHM
+from GraphStore import load_graph, load_station_names
+from StationIndex import StationIndex
+from DistanceMatrix import get_matrix
+from Raptor import earliest_arrival, journey_path, describe_legs
+from Timetable import parse_clock, parse_date, format_clock
 from datetime import datetime
 
 
@@ -14,26 +18,29 @@ class MetroRoutePlannerCLI:
     def __init__(self):
         self.graph = None
         self.station_names = {}
+        self.station_index = None
         self.history = []
+        self.algorithm = DEFAULT_ALGORITHM
         self.load_graph()
     
     def load_graph(self):
         """加载图数据"""
         try:
-            with open('metro_graph.pkl', 'rb') as f:
-                self.graph = pickle.load(f)
+            self.graph = load_graph()
             print(f"✓ 图加载成功！共 {len(self.graph)} 个站点\n")
         except FileNotFoundError:
-            print("✗ 错误：找不到 metro_graph.pkl")
+            print("✗ 错误：找不到 metro_graph.csr 或 metro_graph.pkl")
             print("请先运行 Dataprocess.py 生成图文件\n")
             exit(1)
         
+        # 有预计算的耗时矩阵时直接查表
+        if get_matrix(self.graph) is not None:
+            self.algorithm = 'matrix'
+            print("✓ 已加载全站点对耗时矩阵，默认使用查表\n")
+        
         # 加载站点名称
-        try:
-            with open('station_names.pkl', 'rb') as f:
-                self.station_names = pickle.load(f)
-        except:
-            self.station_names = {sid: sid for sid in self.graph.keys()}
+        self.station_names = load_station_names(self.graph)
+        self.station_index = StationIndex(self.graph.keys(), self.station_names)
     
     def display_banner(self):
         """显示欢迎横幅"""
@@ -44,15 +51,8 @@ class MetroRoutePlannerCLI:
     
     def list_stations(self, search_term=None):
         """列出所有站点"""
-        stations = sorted(self.graph.keys())
-        
-        if search_term:
-            search_term = search_term.lower()
-            stations = [
-                s for s in stations 
-                if search_term in s.lower() or 
-                   search_term in self.station_names.get(s, '').lower()
-            ]
+        # 按匹配程度排序：站点ID / 站名完全相同、前缀、单词前缀、其他位置的子串
+        stations = self.station_index.search(search_term or '', None)
         
         if not stations:
             print("✗ 没有找到匹配的站点\n")
@@ -82,7 +82,8 @@ class MetroRoutePlannerCLI:
         
         print(f"\n⏳ 正在计算从 {start} 到 {end} 的最短路线...\n")
         
-        total_time, path = dijkstra(self.graph, start, end)
+        stats = {}
+        total_time, path = find_route(self.graph, start, end, self.algorithm, stats)
         
         if total_time is None or path is None:
             print(f"✗ 无法找到从 {start} 到 {end} 的路线\n")
@@ -98,6 +99,14 @@ class MetroRoutePlannerCLI:
         print(f"终点: {end} - {self.station_names.get(end, end)}")
         print(f"总耗时: {total_time:.0f} 秒 (约 {minutes} 分 {seconds} 秒)")
         print(f"站点数: {len(path)}")
+        print(f"算法: {ROUTING_ALGORITHMS[self.algorithm]}")
+        if 'settled' in stats:
+            print(f"搜索节点数: {stats['settled']}")
+        if 'cache' in stats:
+            cache = tree_cache_stats(self.graph)
+            status = {'hit': '命中', 'resume': '继续之前的搜索', 'miss': '新起点'}[stats['cache']]
+            print(f"最短路径树缓存: {status} (已缓存 {cache['entries']} 个起点, "
+                  f"命中率 {cache['hit_rate']:.0%}, 复用率 {cache['reuse_rate']:.0%})")
         print("=" * 70)
         
         print("\n完整路线:\n")
@@ -121,6 +130,67 @@ class MetroRoutePlannerCLI:
         }
         self.history.append(history_entry)
     
+    def search_journey(self, start, end, departure_text, date_text=''):
+        """按出发时间查询最早到达的路线（使用时刻表，包含候车时间，只乘坐当天运行的车次）"""
+        if start == end:
+            print(f"\n✗ 错误：起点和终点不能相同")
+            return
+        
+        now = datetime.now()
+        try:
+            departure_time = parse_clock(departure_text) if departure_text else (
+                now.hour * 3600 + now.minute * 60 + now.second)
+            service_date = parse_date(date_text) if date_text else now.date()
+        except ValueError as e:
+            print(f"\n✗ 错误：{e}")
+            return
+        
+        print(f"\n⏳ 正在计算 {service_date} {format_clock(departure_time)} 从 {start} 出发到 {end} 的最早到达路线...\n")
+        
+        stats = {}
+        try:
+            arrival_time, legs = earliest_arrival(start, end, departure_time, stats=stats, service_date=service_date)
+        except FileNotFoundError as e:
+            print(f"✗ {e}\n")
+            return
+        except KeyError:
+            print("✗ 错误：时刻表中没有该站点\n")
+            return
+        
+        if arrival_time is None:
+            print(f"✗ {format_clock(departure_time)} 之后无法从 {start} 到达 {end}\n")
+            return
+        
+        total_time = arrival_time - departure_time
+        path = journey_path(start, legs)
+        minutes = int(total_time // 60)
+        seconds = int(total_time % 60)
+        
+        print("✓ 找到最早到达路线！\n")
+        print("=" * 70)
+        print(f"起点: {start} - {self.station_names.get(start, start)}")
+        print(f"终点: {end} - {self.station_names.get(end, end)}")
+        print(f"出发: {format_clock(departure_time)}  到达: {format_clock(arrival_time)}")
+        print(f"总耗时: {total_time} 秒 (约 {minutes} 分 {seconds} 秒，含候车)")
+        print(f"乘车次数: {sum(1 for leg in legs if leg['type'] == 'ride')}")
+        print(f"扫描线路数: {stats['routes_scanned']}")
+        print("=" * 70)
+        
+        print("\n行程:\n")
+        for line in describe_legs(legs, self.station_names):
+            print(f"  {line}")
+        
+        print("\n" + "=" * 70 + "\n")
+        
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.history.append({
+            'time': timestamp,
+            'start': start,
+            'end': end,
+            'duration': total_time,
+            'path': path
+        })
+    
     def show_history(self):
         """显示查询历史"""
         if not self.history:
@@ -170,6 +240,28 @@ class MetroRoutePlannerCLI:
         except Exception as e:
             print(f"\n✗ 导出失败: {e}\n")
     
+    def choose_algorithm(self):
+        """选择路线计算算法"""
+        names = list(ROUTING_ALGORITHMS)
+        print("\n可用算法:\n")
+        for i, name in enumerate(names, 1):
+            marker = " (当前)" if name == self.algorithm else ""
+            print(f"  {i}. {name:12s} - {ROUTING_ALGORITHMS[name]}{marker}")
+        print()
+        
+        try:
+            idx = int(input("输入算法编号: ").strip())
+        except ValueError:
+            print("\n✗ 无效的编号\n")
+            return
+        
+        if idx < 1 or idx > len(names):
+            print("\n✗ 无效的编号\n")
+            return
+        
+        self.algorithm = names[idx - 1]
+        print(f"\n✓ 已切换到: {ROUTING_ALGORITHMS[self.algorithm]}\n")
+    
     def show_help(self):
         """显示帮助"""
         print("""
@@ -192,6 +284,12 @@ class MetroRoutePlannerCLI:
 │  5. 显示帮助                                                     │
 │     显示此帮助信息                                               │
 │                                                                   │
+│  6. 切换算法                                                     │
+│     选择计算路线使用的最短路径算法                               │
+│                                                                   │
+│  7. 按出发时间查询                                               │
+│     根据真实时刻表计算最早到达路线 (含候车时间)                 │
+│                                                                   │
 │  0. 退出                                                          │
 │     退出程序                                                     │
 │                                                                   │
@@ -215,10 +313,12 @@ class MetroRoutePlannerCLI:
                 print("  3. 查看历史")
                 print("  4. 导出结果")
                 print("  5. 显示帮助")
+                print("  6. 切换算法")
+                print("  7. 按出发时间查询")
                 print("  0. 退出")
                 print()
                 
-                choice = input("请输入选项 (0-5): ").strip()
+                choice = input("请输入选项 (0-7): ").strip()
                 
                 if choice == '1':
                     start = input("\n输入起点站点ID: ").strip().upper()
@@ -246,12 +346,22 @@ class MetroRoutePlannerCLI:
                 elif choice == '5':
                     self.show_help()
                 
+                elif choice == '6':
+                    self.choose_algorithm()
+                
+                elif choice == '7':
+                    start = input("\n输入起点站点ID: ").strip().upper()
+                    end = input("输入终点站点ID: ").strip().upper()
+                    departure = input("输入出发时间 (HH:MM，直接回车为现在): ").strip()
+                    date = input("输入日期 (YYYY-MM-DD，直接回车为今天): ").strip()
+                    self.search_journey(start, end, departure, date)
+                
                 elif choice == '0':
                     print("\n👋 再见！祝您旅途愉快!\n")
                     break
                 
                 else:
-                    print("\n✗ 无效选项，请输入 0-5\n")
+                    print("\n✗ 无效选项，请输入 0-7\n")
             
             except KeyboardInterrupt:
                 print("\n\n👋 程序已中断，再见!\n")
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+连接扫描算法 (CSA: Connection Scan Algorithm)
+Earliest-arrival and profile queries over the sorted connection array
+
+Dataprocess.py 把时刻表中每一段 "某车次从 A 站出发、到达下一站 B" 记为一个连接，
+全部按出发时刻排好序写入 metro_timetable.bin。查询时不需要优先队列：
+
+  最早到达: 二分找到第一个出发时刻 >= 出发时间的连接，按顺序扫描，
+            能赶上的连接就更新到达站的最早时刻，扫到出发时刻不早于终点已知到达时刻时停止。
+  时刻剖面: 从最晚的连接倒序扫描，为每个站点维护 (出发时刻, 到达终点时刻) 的帕累托集合，
+            一次扫描得到一段时间内任意时刻出发的最早到达时刻。
+时刻表带有运营日历时，与 Raptor.py 一样跳过查询日期当天不运行的车次的连接，
+凌晨出发时也考虑前一运营日跨过午夜的车次。
+
+使用方法:
+    python3 ConnectionScan.py 起点ID 终点ID 出发时间(HH:MM) [日期(YYYY-MM-DD)]
+    python3 ConnectionScan.py 起点ID 终点ID 最早出发(HH:MM) 最晚出发(HH:MM) [日期(YYYY-MM-DD)]
+"""
+
+import datetime
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+from Timetable import get_timetable, parse_clock, parse_date, format_clock
+from Raptor import INF, NOT_REACHED, RIDE, WALK, describe_legs, shift_legs
+
+
+class ConnectionScan:
+    """在一份时刻表上执行连接扫描查询"""
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        self.scanned = 0  # 最近一次查询扫描的连接数
+
+    def search(self, source, target, departure_time, active=None):
+        """返回 (最早到达时刻, 行程段列表)，不可达时返回 (None, None)
+
+        active: 只乘坐标记为 1 的车次 (Timetable.active_trips)，None 为全部车次。
+        """
+        tt = self.timetable
+        n = len(tt)
+        dep_stop, arr_stop = tt.conn_dep_stop, tt.conn_arr_stop
+        dep_time, arr_time, conn_trip = tt.conn_dep_time, tt.conn_arr_time, tt.conn_trip
+        transfer_offsets, transfer_targets, transfer_times = (
+            tt.transfer_offsets, tt.transfer_targets, tt.transfer_times)
+
+        earliest = array('i', [INF]) * n
+        # 到达标记: 方式 / 上一站 / 本段出发时刻 / 乘车段的上车与下车连接
+        kind = array('B', [NOT_REACHED]) * n
+        from_stop = array('i', [-1]) * n
+        leg_departure = array('i', [INF]) * n
+        enter_conn = array('i', [-1]) * n
+        exit_conn = array('i', [-1]) * n
+        # 到达各站点时已乘坐的车次数
+        rides = array('H', [0]) * n
+        # 每个车次在哪个连接上车 (-1 为还上不了车)，以及上车前已乘坐的车次数
+        boarded = array('i', [-1]) * tt.trip_count()
+        boarded_rides = array('H', [0]) * tt.trip_count()
+
+        def walk_from(p, t):
+            for j in range(transfer_offsets[p], transfer_offsets[p + 1]):
+                q = transfer_targets[j]
+                if t + transfer_times[j] < earliest[q]:
+                    earliest[q] = t + transfer_times[j]
+                    kind[q] = WALK
+                    from_stop[q] = p
+                    leg_departure[q] = t
+                    rides[q] = rides[p]
+
+        earliest[source] = departure_time
+        walk_from(source, departure_time)
+
+        first = bisect_left(dep_time, departure_time)
+        c = first
+        for c in range(first, len(dep_time)):
+            d = dep_time[c]
+            if d >= earliest[target]:
+                break
+            trip = conn_trip[c]
+            if active is not None and not active[trip]:
+                continue
+            p = dep_stop[c]
+            if earliest[p] <= d and (boarded[trip] < 0 or rides[p] < boarded_rides[trip]):
+                # 能在这里上车；已经在车上时，换成乘车次数更少的上车点
+                # （到达时刻相同，但避免先坐反方向再换乘回来这类绕路）
+                boarded[trip] = c
+                boarded_rides[trip] = rides[p]
+            elif boarded[trip] < 0:
+                continue
+            q, a = arr_stop[c], arr_time[c]
+            if a < earliest[q]:
+                earliest[q] = a
+                kind[q] = RIDE
+                enter_conn[q] = boarded[trip]
+                exit_conn[q] = c
+                rides[q] = boarded_rides[trip] + 1
+                walk_from(q, a)
+        self.scanned = c - first
+
+        if earliest[target] == INF:
+            return None, None
+        return earliest[target], self._legs(source, target, kind, from_stop, leg_departure,
+                                            enter_conn, exit_conn, earliest)
+
+    def _legs(self, source, target, kind, from_stop, leg_departure, enter_conn, exit_conn, earliest):
+        """从终点沿到达标记回溯，得到与 Raptor.py 相同格式的行程段"""
+        tt = self.timetable
+        legs = []
+        p = target
+        while p != source:
+            if kind[p] == WALK:
+                q = from_stop[p]
+                legs.append({
+                    'type': 'walk',
+                    'from': tt.stop_ids[q],
+                    'to': tt.stop_ids[p],
+                    'departure': leg_departure[p],
+                    'arrival': earliest[p],
+                })
+            else:
+                enter, exit = enter_conn[p], exit_conn[p]
+                q = tt.conn_dep_stop[enter]
+                trip = tt.conn_trip[enter]
+                legs.append({
+                    'type': 'ride',
+                    'trip': tt.trip_ids[trip],
+                    'from': tt.stop_ids[q],
+                    'to': tt.stop_ids[p],
+                    'departure': tt.conn_dep_time[enter],
+                    'arrival': tt.conn_arr_time[exit],
+                    'stops': tt.trip_stops(trip, tt.conn_position[enter], tt.conn_position[exit] + 1),
+                })
+            p = q
+        legs.reverse()
+        return legs
+
+    def profile(self, source, target, start_time, end_time, active=None):
+        """start_time 到 end_time 之间出发的时刻剖面
+
+        返回按出发时刻升序的 [(出发时刻, 最早到达时刻), ...]，只保留帕累托最优的组合：
+        任意时刻 T 出发的最早到达时刻就是第一个出发时刻 >= T 的组合的到达时刻。
+        active: 与 search 相同的车次运行标记。
+        """
+        tt = self.timetable
+        n = len(tt)
+        dep_stop, arr_stop = tt.conn_dep_stop, tt.conn_arr_stop
+        dep_time, arr_time, conn_trip = tt.conn_dep_time, tt.conn_arr_time, tt.conn_trip
+        transfer_offsets, transfer_targets, transfer_times = (
+            tt.transfer_offsets, tt.transfer_targets, tt.transfer_times)
+
+        # 从各站点步行到终点的时间
+        walk_to_target = {target: 0}
+        for p in range(n):
+            for j in range(transfer_offsets[p], transfer_offsets[p + 1]):
+                if transfer_targets[j] == target and p != target:
+                    walk_to_target[p] = min(walk_to_target.get(p, INF), transfer_times[j])
+
+        # 每个站点的剖面: 出发时刻递减追加（存相反数以便二分），到达时刻随之严格递减
+        neg_departures = [[] for _ in range(n)]
+        arrivals = [[] for _ in range(n)]
+        # 坐在车次上不下车能到达终点的最早时刻
+        trip_arrival = array('i', [INF]) * tt.trip_count()
+
+        def evaluate(p, t):
+            """t 时刻在 p 站时到达终点的最早时刻"""
+            i = bisect_right(neg_departures[p], -t) - 1
+            return arrivals[p][i] if i >= 0 else INF
+
+        first = bisect_left(dep_time, start_time)
+        for c in range(len(dep_time) - 1, first - 1, -1):
+            if active is not None and not active[conn_trip[c]]:
+                continue
+            q, a = arr_stop[c], arr_time[c]
+            best = min(a + walk_to_target[q] if q in walk_to_target else INF,
+                       trip_arrival[conn_trip[c]], evaluate(q, a))
+            for j in range(transfer_offsets[q], transfer_offsets[q + 1]):
+                best = min(best, evaluate(transfer_targets[j], a + transfer_times[j]))
+            if best == INF:
+                continue
+            trip_arrival[conn_trip[c]] = best
+
+            p, d = dep_stop[c], dep_time[c]
+            if not arrivals[p] or best < arrivals[p][-1]:
+                if neg_departures[p] and neg_departures[p][-1] == -d:
+                    arrivals[p][-1] = best
+                else:
+                    neg_departures[p].append(-d)
+                    arrivals[p].append(best)
+        self.scanned = len(dep_time) - first
+
+        # 起点本身的剖面，加上先步行到相邻站台再出发的组合
+        candidates = [(-nd, arr) for nd, arr in zip(neg_departures[source], arrivals[source])]
+        for j in range(transfer_offsets[source], transfer_offsets[source + 1]):
+            q, w = transfer_targets[j], transfer_times[j]
+            candidates.extend((-nd - w, arr) for nd, arr in zip(neg_departures[q], arrivals[q]))
+
+        return _pareto_profile(candidates, start_time, end_time)
+
+
+def _pareto_profile(candidates, start_time, end_time):
+    """(出发时刻, 到达时刻) 组合中帕累托最优、且在 start_time 到 end_time 之间出发的部分，按出发时刻升序"""
+    result = []
+    for departure, arrival in sorted(candidates, key=lambda pair: (-pair[0], pair[1])):
+        # 出发时刻相同的组合中第一个到达最早，后面的都会被过滤掉；
+        # end_time 之后出发的组合也参与比较（在它之前出发的人可以等这一班）
+        if start_time <= departure and (not result or arrival < result[-1][1]):
+            result.append((departure, arrival))
+    result.reverse()
+    return [(departure, arrival) for departure, arrival in result if departure <= end_time]
+
+
+def _open(timetable):
+    if timetable is None:
+        timetable = get_timetable()
+        if timetable is None:
+            raise FileNotFoundError("找不到时刻表文件 metro_timetable.bin，请先运行 Dataprocess.py")
+    return timetable
+
+
+def earliest_arrival_csa(start_node, end_node, departure_time, stats=None, timetable=None, service_date=None):
+    """与 Raptor.earliest_arrival 接口相同的连接扫描版本，返回 (最早到达时刻, 行程段列表)"""
+    timetable = _open(timetable)
+    source, target = timetable.index[start_node], timetable.index[end_node]
+    scan = ConnectionScan(timetable)
+    result = (None, None)
+    scanned = 0
+    # 凌晨出发时另外在前一运营日的车次中查询 (Timetable.service_days)，取到达较早的结果
+    for active, offset in timetable.service_days(service_date, departure_time):
+        arrival_time, legs = scan.search(source, target, departure_time + offset, active)
+        scanned += scan.scanned
+        if arrival_time is not None and (result[0] is None or arrival_time - offset < result[0]):
+            result = (arrival_time - offset, shift_legs(legs, offset))
+    if stats is not None:
+        stats['connections_scanned'] = scanned
+    return result
+
+
+def arrival_profile(start_node, end_node, start_time, end_time, stats=None, timetable=None, service_date=None):
+    """start_time 到 end_time 之间出发的 [(出发时刻, 最早到达时刻), ...]
+
+    service_date: 运营日 (datetime.date)，只乘坐当天运行的车次；None 为不按日历筛选。
+    凌晨的时段同时使用前一运营日跨过午夜的车次，两天的剖面合并后再取帕累托最优。
+    """
+    timetable = _open(timetable)
+    source, target = timetable.index[start_node], timetable.index[end_node]
+    scan = ConnectionScan(timetable)
+    days = timetable.service_days(service_date, start_time)
+    if len(days) == 1:
+        result = scan.profile(source, target, start_time, end_time, days[0][0])
+        scanned = scan.scanned
+    else:
+        # 各天都不截断结束时刻，合并时较晚出发的组合仍能淘汰另一天中较早出发的组合
+        candidates = []
+        scanned = 0
+        for active, offset in days:
+            pairs = scan.profile(source, target, start_time + offset, INF, active)
+            candidates.extend((departure - offset, arrival - offset) for departure, arrival in pairs)
+            scanned += scan.scanned
+        result = _pareto_profile(candidates, start_time, end_time)
+    if stats is not None:
+        stats['connections_scanned'] = scanned
+    return result
+
+
+def main():
+    args = sys.argv[1:]
+    # 最后一个参数不是时刻 (HH:MM) 时当作日期
+    service_date = parse_date(args.pop()) if len(args) in (4, 5) and ':' not in args[-1] else datetime.date.today()
+    if len(args) not in (3, 4):
+        print("用法: python3 ConnectionScan.py 起点ID 终点ID 出发时间(HH:MM) [最晚出发(HH:MM)] [日期(YYYY-MM-DD)]")
+        sys.exit(1)
+    start, end = args[0], args[1]
+    departure_time = parse_clock(args[2])
+
+    stats = {}
+    try:
+        if len(args) == 4:
+            pairs = arrival_profile(start, end, departure_time, parse_clock(args[3]), stats,
+                                    service_date=service_date)
+            print(f"{start} → {end} {service_date} 时刻剖面 (扫描 {stats['connections_scanned']} 个连接):")
+            for departure, arrival in pairs:
+                print(f"  {format_clock(departure)} 出发 → {format_clock(arrival)} 到达 "
+                      f"({arrival - departure} 秒)")
+            return
+        arrival_time, legs = earliest_arrival_csa(start, end, departure_time, stats, service_date=service_date)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        return
+    except KeyError as e:
+        print(f"错误: 时刻表中没有站点 {e}")
+        return
+
+    if arrival_time is None:
+        print(f"{format_clock(departure_time)} 之后无法从 {start} 到达 {end}。")
+        return
+    print(f"{service_date} 出发 {format_clock(departure_time)}，最早 {format_clock(arrival_time)} 到达 "
+          f"(用时 {arrival_time - departure_time} 秒，扫描 {stats['connections_scanned']} 个连接)")
+    for line in describe_legs(legs):
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
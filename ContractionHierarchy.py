@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+收缩层次 (Contraction Hierarchies) 预处理与查询
+Contraction hierarchies: offline node ordering + fast exact queries
+
+离线步骤（在 Dataprocess.py 之后运行一次）:
+    python3 ContractionHierarchy.py
+
+按 "边差" 启发式给站点排序，依次收缩：删除站点 v 时，对每对邻居 u -> v -> w，
+如果不存在绕开 v 且不更长的 "见证路径"，就加入捷径 u -> w。
+所有原始边和捷径按两端的层级分成向上图和向下图，保存到 metro_ch.bin。
+
+查询时只需从起点在向上图中、从终点在向下图的反向上各做一次 Dijkstra，
+两边都只往层级更高的站点走，搜索空间通常只有几十个站点；
+最后把捷径递归展开，还原为原始站点路径。结果仍然是精确最短时间。
+
+文件中保存计算时图的指纹 (CSRGraph.fingerprint)；重新运行 Dataprocess.py 后即使站点数、边数不变，
+只要耗时变了指纹就不同，收缩层次自动停用，需要重新运行本脚本。
+"""
+
+import heapq
+import weakref
+from array import array
+
+from GraphStore import load_graph, read_sections, write_sections
+from Dijkstra import dijkstra_bidirectional, get_kernel
+
+CH_FILE = 'metro_ch.bin'
+
+# 见证搜索最多出队的站点数：超过后直接加入捷径（捷径多一些不影响正确性）
+WITNESS_SETTLE_LIMIT = 200
+
+
+class Hierarchy:
+    """收缩后的图
+
+    向上图: up_targets[up_offsets[u]:up_offsets[u+1]] 是 u 出发、通往更高层级站点的边；
+    向下图: down_sources[down_offsets[v]:down_offsets[v+1]] 是从更高层级站点进入 v 的边。
+    *_middle 为捷径所跳过的站点，原始边为 -1。
+    """
+
+    def __init__(self, rank, up, down, node_count, edge_count, fingerprint=None):
+        self.rank = rank
+        self.up_offsets, self.up_targets, self.up_weights, self.up_middle = up
+        self.down_offsets, self.down_sources, self.down_weights, self.down_middle = down
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.fingerprint = fingerprint
+
+    def matches(self, graph):
+        """收缩层次是否是为这张图计算的（文件中的图重新生成或被原地修改后捷径不再正确，需要重新预处理）"""
+        return (self.node_count == len(graph) and self.edge_count == graph.edge_count() and not graph.modified
+                and self.fingerprint == graph.fingerprint())
+
+    def shortcut_count(self):
+        return (sum(1 for m in self.up_middle if m != -1)
+                + sum(1 for m in self.down_middle if m != -1))
+
+    def edge_middle(self, u, v):
+        """边 u -> v 跳过的站点（原始边返回 -1）"""
+        if self.rank[u] < self.rank[v]:
+            for e in range(self.up_offsets[u], self.up_offsets[u + 1]):
+                if self.up_targets[e] == v:
+                    return self.up_middle[e]
+        else:
+            for e in range(self.down_offsets[v], self.down_offsets[v + 1]):
+                if self.down_sources[e] == u:
+                    return self.down_middle[e]
+        raise KeyError((u, v))
+
+    def unpack(self, u, v, path):
+        """把边 u -> v 展开成原始站点序列，追加到 path（不含 u）"""
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            m = self.edge_middle(a, b)
+            if m == -1:
+                path.append(b)
+            else:
+                stack.append((m, b))
+                stack.append((a, m))
+
+
+def _witness_distance(out_edges, source, skip, limit, max_settled=WITNESS_SETTLE_LIMIT):
+    """绕开 skip 的局部 Dijkstra，返回 {站点: 距离}，只搜索距离不超过 limit 的范围"""
+    distance = {source: 0}
+    pq = [(0, source)]
+    settled = 0
+    while pq and settled < max_settled:
+        d, u = heapq.heappop(pq)
+        if d > distance[u]:
+            continue
+        settled += 1
+        for v, w in out_edges[u].items():
+            nd = d + w[0]
+            if v == skip or nd > limit:
+                continue
+            if nd < distance.get(v, nd + 1):
+                distance[v] = nd
+                heapq.heappush(pq, (nd, v))
+    return distance
+
+
+def _shortcuts(out_edges, in_edges, v):
+    """收缩 v 时需要加入的捷径 [(u, w, 长度)]"""
+    result = []
+    outgoing = out_edges[v]
+    if not outgoing:
+        return result
+    max_out = max(w for w, _ in outgoing.values())
+    for u, (w_uv, _) in in_edges[v].items():
+        if u == v:
+            continue
+        reached = _witness_distance(out_edges, u, v, w_uv + max_out)
+        for w, (w_vw, _) in outgoing.items():
+            if w == u or w == v:
+                continue
+            length = w_uv + w_vw
+            if reached.get(w, length + 1) > length:
+                result.append((u, w, length))
+    return result
+
+
+def build_hierarchy(graph):
+    """为 CSRGraph 计算收缩层次
+
+    站点优先级 = 需加入的捷径数 - 删除的边数 + 已收缩的邻居数，
+    每次取优先级最低的站点收缩（取出时重新计算，过期则放回堆中）。
+    """
+    n = len(graph)
+    offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+
+    # 剩余图: out_edges[u][v] = (长度, 中间站点)，平行边只保留最短的一条，自环丢弃
+    out_edges = [{} for _ in range(n)]
+    in_edges = [{} for _ in range(n)]
+    for u in range(n):
+        for e in range(offsets[u], offsets[u + 1]):
+            v, w = targets[e], weights[e]
+            if u != v and (v not in out_edges[u] or w < out_edges[u][v][0]):
+                out_edges[u][v] = (w, -1)
+                in_edges[v][u] = (w, -1)
+
+    contracted_neighbors = array('I', [0]) * n
+
+    def priority(v):
+        removed = len(out_edges[v]) + len(in_edges[v])
+        return len(_shortcuts(out_edges, in_edges, v)) - removed + contracted_neighbors[v]
+
+    pq = [(priority(v), v) for v in range(n)]
+    heapq.heapify(pq)
+
+    rank = array('I', [0]) * n
+    # 收缩过程中删掉的边（两端层级已确定）：(u, v, 长度, 中间站点)
+    final_edges = []
+    level = 0
+    while pq:
+        _, v = heapq.heappop(pq)
+        current = priority(v)
+        if pq and current > pq[0][0]:
+            heapq.heappush(pq, (current, v))
+            continue
+
+        for u, w, length in _shortcuts(out_edges, in_edges, v):
+            existing = out_edges[u].get(w)
+            if existing is None or length < existing[0]:
+                out_edges[u][w] = (length, v)
+                in_edges[w][u] = (length, v)
+
+        rank[v] = level
+        level += 1
+        for w, (length, middle) in out_edges[v].items():
+            final_edges.append((v, w, length, middle))
+            del in_edges[w][v]
+            contracted_neighbors[w] += 1
+        for u, (length, middle) in in_edges[v].items():
+            final_edges.append((u, v, length, middle))
+            del out_edges[u][v]
+            contracted_neighbors[u] += 1
+        out_edges[v] = {}
+        in_edges[v] = {}
+
+    # 按层级方向拆成向上图 (以起点分组) 和向下图 (以终点分组)
+    up = [[] for _ in range(n)]
+    down = [[] for _ in range(n)]
+    for u, v, length, middle in final_edges:
+        if rank[u] < rank[v]:
+            up[u].append((v, length, middle))
+        else:
+            down[v].append((u, length, middle))
+
+    def to_csr(adjacency):
+        csr_offsets = array('I', [0])
+        csr_nodes, csr_weights, csr_middle = array('I'), array('I'), array('i')
+        for edges in adjacency:
+            for node, length, middle in sorted(edges):
+                csr_nodes.append(node)
+                csr_weights.append(length)
+                csr_middle.append(middle)
+            csr_offsets.append(len(csr_nodes))
+        return csr_offsets, csr_nodes, csr_weights, csr_middle
+
+    return Hierarchy(rank, to_csr(up), to_csr(down), n, graph.edge_count(), graph.fingerprint())
+
+
+def save_hierarchy(hierarchy, filename=CH_FILE):
+    write_sections(filename, {
+        'rank': hierarchy.rank,
+        'up_offsets': hierarchy.up_offsets,
+        'up_targets': hierarchy.up_targets,
+        'up_weights': hierarchy.up_weights,
+        'up_middle': hierarchy.up_middle,
+        'down_offsets': hierarchy.down_offsets,
+        'down_sources': hierarchy.down_sources,
+        'down_weights': hierarchy.down_weights,
+        'down_middle': hierarchy.down_middle,
+        'shape': array('Q', [hierarchy.node_count, hierarchy.edge_count]),
+        'fingerprint': hierarchy.fingerprint,
+    })
+
+
+def open_hierarchy(filename=CH_FILE):
+    """用 mmap 打开收缩层次文件"""
+    s = read_sections(filename)
+    node_count, edge_count = s['shape']
+    return Hierarchy(
+        s['rank'],
+        (s['up_offsets'], s['up_targets'], s['up_weights'], s['up_middle']),
+        (s['down_offsets'], s['down_sources'], s['down_weights'], s['down_middle']),
+        node_count, edge_count,
+        # 没有指纹的旧文件无法确认是为哪张图计算的，视为过期
+        bytes(s['fingerprint']) if 'fingerprint' in s else None,
+    )
+
+
+_loaded = weakref.WeakKeyDictionary()
+
+
+def get_hierarchy(graph, filename=CH_FILE):
+    """第一次使用时加载与该图匹配的收缩层次，文件不存在或已过期时返回 None"""
+    if graph not in _loaded:
+        try:
+            hierarchy = open_hierarchy(filename)
+        except (OSError, ValueError, KeyError):
+            hierarchy = None
+        _loaded[graph] = hierarchy
+    hierarchy = _loaded[graph]
+    # 图被修改后可能不再匹配，每次都重新检查
+    if hierarchy is None or not hierarchy.matches(graph):
+        return None
+    return hierarchy
+
+
+class CHQuery:
+    """收缩层次上的双向向上搜索（一个实例只能被一个线程使用）"""
+
+    def __init__(self, graph):
+        n = len(graph)
+        self.graph = graph
+        self.hierarchy = get_hierarchy(graph)
+        self.dist_f = array('q', [0]) * n
+        self.dist_b = array('q', [0]) * n
+        self.prev_f = array('i', [-1]) * n
+        self.prev_b = array('i', [-1]) * n
+        self.stamp_f = array('I', [0]) * n
+        self.stamp_b = array('I', [0]) * n
+        self.generation = 0
+        self.meeting_node = -1
+        self.settled = 0
+
+    def search(self, source, target):
+        """返回 source 到 target 的最短时间，不可达时返回 None"""
+        h = self.hierarchy
+        self.generation += 1
+        if self.generation > 0xFFFFFFFF:
+            n = len(self.stamp_f)
+            self.stamp_f = array('I', [0]) * n
+            self.stamp_b = array('I', [0]) * n
+            self.generation = 1
+        gen = self.generation
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        sides = (
+            (self.dist_f, self.prev_f, self.stamp_f, self.dist_b, self.stamp_b,
+             h.up_offsets, h.up_targets, h.up_weights),
+            (self.dist_b, self.prev_b, self.stamp_b, self.dist_f, self.stamp_f,
+             h.down_offsets, h.down_sources, h.down_weights),
+        )
+        for (dist, prev, stamp, *_), start in zip(sides, (source, target)):
+            dist[start] = 0
+            prev[start] = -1
+            stamp[start] = gen
+        queues = ([(0, source)], [(0, target)])
+
+        best = 0 if source == target else None
+        meet = source if source == target else -1
+        settled = 0
+        while queues[0] or queues[1]:
+            # 两边各自的堆顶不小于 best 时，该方向不可能再改进结果
+            if best is not None:
+                for pq in queues:
+                    if pq and pq[0][0] >= best:
+                        pq.clear()
+                if not queues[0] and not queues[1]:
+                    break
+            side = 0 if queues[0] and (not queues[1] or queues[0][0][0] <= queues[1][0][0]) else 1
+            pq = queues[side]
+            dist, prev, stamp, other_dist, other_stamp, offs, nodes, lengths = sides[side]
+
+            d, u = heappop(pq)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if other_stamp[u] == gen and (best is None or d + other_dist[u] < best):
+                best = d + other_dist[u]
+                meet = u
+            for e in range(offs[u], offs[u + 1]):
+                v = nodes[e]
+                nd = d + lengths[e]
+                if stamp[v] != gen:
+                    stamp[v] = gen
+                elif nd >= dist[v]:
+                    continue
+                dist[v] = nd
+                prev[v] = u
+                heappush(pq, (nd, v))
+
+        self.settled = settled
+        self.meeting_node = meet
+        return best
+
+    def path_to(self, target):
+        """把向上/向下两段路径上的捷径展开成原始站点路径"""
+        h = self.hierarchy
+        upward = []
+        v = self.meeting_node
+        while v != -1:
+            upward.append(v)
+            v = self.prev_f[v]
+        upward.reverse()
+
+        path = [upward[0]]
+        for a, b in zip(upward, upward[1:]):
+            h.unpack(a, b, path)
+        v = self.meeting_node
+        while self.prev_b[v] != -1:
+            h.unpack(v, self.prev_b[v], path)
+            v = self.prev_b[v]
+        return path
+
+
+def ch_search(graph, start_node, end_node, stats=None):
+    """收缩层次点到点查询；没有预处理文件时退化为双向 Dijkstra"""
+    if get_hierarchy(graph) is None:
+        return dijkstra_bidirectional(graph, start_node, end_node, stats)
+    source = graph.index[start_node]
+    target = graph.index[end_node]
+    kernel = get_kernel(graph, CHQuery)
+    total_time = kernel.search(source, target)
+    if stats is not None:
+        stats['settled'] = kernel.settled
+    if total_time is None:
+        return None, None
+    return total_time, [graph.stop_ids[i] for i in kernel.path_to(target)]
+
+
+def main():
+    print("正在加载地铁网络图...")
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    print(f"图加载成功！总节点数: {len(graph)}, 总边数: {graph.edge_count()}")
+
+    print("\n正在计算站点顺序并收缩...")
+    hierarchy = build_hierarchy(graph)
+    save_hierarchy(hierarchy)
+
+    print(f"加入捷径: {hierarchy.shortcut_count()} 条")
+    print(f"已保存到: {CH_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,127 +1,936 @@
 import pandas as pd
+import numpy as np
 from collections import defaultdict
 import datetime
+import os
 import pickle
+import sys
+from array import array
+from multiprocessing import Pool
+import GraphStore
+import Timetable
 
 # 定义你的 GTFS 数据文件夹路径
 # 注意末尾的正斜杠 /
 gtfs_path = 'C:/Users/Funzhou/Downloads/gtfs_subway/' # 根据你的实际路径修改
 
-# 加载我们需要的文件
-try:
-    stops = pd.read_csv(f'{gtfs_path}stops.txt')
-    stop_times = pd.read_csv(f'{gtfs_path}stop_times.txt')
-    transfers = pd.read_csv(f'{gtfs_path}transfers.txt')
-except FileNotFoundError as e:
-    print(f"文件未找到: {e}. 请确保 GTFS 文件在正确的路径下。")
-    exit()
-
-print("数据加载成功！")
-print(f"总共有 {len(stops)} 个站台。")
-print(f"总共有 {len(stop_times)} 条停靠记录。")
-print(f"总共有 {len(transfers)} 条换乘规则。")
-graph = defaultdict(list)
-for stop_id in stops['stop_id']:
-    graph[stop_id] = []
+# 平行乘车边的合并方式
+# 同一对相邻站点之间，每一趟车都会产生一条边，合并后每对站点只保留一条边
+#   'all'    - 不合并，保留每一趟车的边 (旧版行为，图非常大)
+#   'min'    - 取最短行驶时间
+#   'median' - 取行驶时间的中位数
+#   'p90'    - 取第 90 百分位数 (可以换成 p50、p75、p95 等任意 0-100 的整数)
+EDGE_AGGREGATE = 'min'
+
+# 乘车边的构建方式
+#   'vectorized' - 整列向量化计算 (快，默认)
+#   'loop'       - 逐趟车、逐站的 Python 循环 (旧版实现，用于对比)
+RIDE_EDGE_BUILDER = 'vectorized'
+
+# stop_times.txt 的读取方式
+#   None - 一次读入整个文件 (默认)
+#   整数 - 每次读取这么多行，按块构建乘车边，只保留窄类型的紧凑列，
+#          大型数据源 (如完整的 MTA 时刻表) 的内存峰值明显降低；不支持 'all' 合并方式
+#          (为了生成时刻表仍要保留全部记录，内存随行数增长，见 BUILD_TIMETABLE)
+STOP_TIMES_CHUNK_ROWS = None
+
+# 是否生成时刻表 metro_timetable.bin (按出发时间查询使用)
+# 流式读取时设为 False 则不保留 stop_times 的记录，'min' 合并方式下内存只取决于块大小、
+# 车次数和站点对数，与文件行数无关
+BUILD_TIMETABLE = True
+
+# 构建乘车边与换乘边的进程数 (也可以运行 python3 Dataprocess.py 进程数)
+#   1    - 单进程 (默认)
+#   None - 使用全部 CPU 核
+# 乘车边按 trip_id 的哈希、同站步行换乘按 parent_station 的哈希分给各进程，结果与单进程完全相同
+BUILD_PROCESSES = 1
+
+# 定义要保存的文件名
+graph_filename = 'metro_graph.pkl'
+# 供各前端 mmap 加载的 CSR 二进制图文件
+csr_filename = 'metro_graph.csr'
+# 按出发时间查询 (Raptor.py) 使用的时刻表文件
+timetable_filename = 'metro_timetable.bin'
+
+
 # 时间字符串（HH:MM:SS）转为秒的辅助函数
 def time_to_seconds(time_str):
     try:
         # 有些GTFS数据时间会超过24:00:00，例如 25:10:00
         h, m, s = map(int, time_str.split(':'))
         return h * 3600 + m * 60 + s
-    except (ValueError, TypeError):
+    except (ValueError, TypeError, AttributeError):
         return 0
 
-print("开始构建乘车边...")
-
-# 对 stop_times 按 trip_id 分组，并按 stop_sequence 排序
-# 这样可以保证我们处理的是同一趟车、并且是按顺序的站点
-stop_times_sorted = stop_times.sort_values(by=['trip_id', 'stop_sequence'])
-
-# 使用 groupby 来高效处理每一趟行程
-for trip_id, trip_group in stop_times_sorted.groupby('trip_id'):
-    # 将每一趟行程的停靠点转换为列表
-    trip_stops = trip_group.to_dict('records')
-    
-    # 遍历行程中的每一站，除了最后一站
-    for i in range(len(trip_stops) - 1):
-        from_stop = trip_stops[i]
-        to_stop = trip_stops[i+1]
-        
-        # 获取出发和到达站的 ID
-        from_stop_id = from_stop['stop_id']
-        to_stop_id = to_stop['stop_id']
-        
-        # 计算权重（时间）
-        departure_time_sec = time_to_seconds(from_stop['departure_time'])
-        arrival_time_sec = time_to_seconds(to_stop['arrival_time'])
-        
-        # 处理跨天的情况
-        if arrival_time_sec < departure_time_sec:
-            # 这种情况在实际数据中较少，但最好处理
-            # 简单处理，可以假设是隔夜，但更精确的需要日历数据
-            # 这里我们先假设不会出现或差异极小
-            pass
-
-        travel_time = arrival_time_sec - departure_time_sec
-        
-        # 确保旅行时间是正数
-        if travel_time > 0:
-            # 添加边到图中
-            graph[from_stop_id].append((to_stop_id, travel_time))
-
-print(f"乘车边构建完成！图中添加了大量连接。")
-print("开始构建换乘边...")
-
-# 1. 处理 transfers.txt 中的显式换乘
-for index, row in transfers.iterrows():
-    from_stop_id = row['from_stop_id']
-    to_stop_id = row['to_stop_id']
-    
-    # 我们只关心可以换乘的情况 (transfer_type != 3)
-    if row['transfer_type'] != 3:
-        # 权重是 min_transfer_time
-        # 如果没有提供时间，给一个默认值，比如2分钟 (120秒)
-        transfer_time = row['min_transfer_time'] if pd.notna(row['min_transfer_time']) else 120
-        graph[from_stop_id].append((to_stop_id, transfer_time))
-
-# 2. 处理基于 parent_station 的隐式换乘 (非常重要！)
-# 首先，筛选出有 parent_station 的站台
-stops_with_parent = stops[stops['parent_station'].notna()]
-# 按 parent_station 分组
-for parent_station_id, group in stops_with_parent.groupby('parent_station'):
-    station_stop_ids = group['stop_id'].tolist()
-    
-    # 在同一个父站下的所有站台之间，创建双向的换乘边
-    if len(station_stop_ids) > 1:
-        for i in range(len(station_stop_ids)):
-            for j in range(i + 1, len(station_stop_ids)):
-                from_stop_id = station_stop_ids[i]
-                to_stop_id = station_stop_ids[j]
-                
-                # 给一个默认的站内步行换乘时间，比如3分钟 (180秒)
-                transfer_time = 180 
-                
-                # 添加双向边
-                graph[from_stop_id].append((to_stop_id, transfer_time))
-                graph[to_stop_id].append((from_stop_id, transfer_time))
-
-print("换乘边构建完成！")
-total_nodes = len(graph)
-total_edges = sum(len(edges) for edges in graph.values())
-print(f"\n图构建完成！")
-print(f"总节点数: {total_nodes}")
-print(f"总边数: {total_edges}")
 
-# 定义要保存的文件名
-graph_filename = 'metro_graph.pkl'
+def times_to_seconds(times):
+    """把一整列 HH:MM:SS 字符串转成整数秒的 NumPy 数组（与 time_to_seconds 结果一致）"""
+    if pd.api.types.is_integer_dtype(times):
+        # 已经是整数秒（流式读取时读入即转为 int32），不再复制
+        return np.asarray(times)
+    # 一天最多只有几万种不同的时刻，先去重，只解析不重复的字符串，再按编码取回
+    codes, uniques = pd.factorize(times)
+    seconds = np.fromiter((time_to_seconds(t) for t in uniques.tolist()), dtype=np.int64, count=len(uniques))
+    # 缺失值的编码是 -1，与 time_to_seconds 一样记为 0
+    return np.where(codes >= 0, seconds[codes], 0)
+
+
+def parse_aggregate(aggregate):
+    """解析合并方式，返回 ('all' | 'min' | 'median' | 'percentile', 百分位数)"""
+    if aggregate is None or aggregate == 'all':
+        return 'all', None
+    if aggregate in ('min', 'median'):
+        return aggregate, None
+    if isinstance(aggregate, str) and aggregate.startswith('p') and aggregate[1:].isdigit():
+        percent = int(aggregate[1:])
+        if 0 <= percent <= 100:
+            return 'percentile', percent
+    raise ValueError(f"不支持的合并方式: {aggregate!r} (可选 'all', 'min', 'median', 'p0'-'p100')")
+
+
+def aggregate_travel_times(times, aggregate):
+    """把同一对站点之间的多个行驶时间合并成一个整数秒权重
+
+    百分位数取排序后第 (n-1)*p/100 个值（向下取整），中位数在偶数个样本时取
+    中间两个值的平均并四舍五入到偶数，保证各种构建路径得到完全相同的结果。
+    """
+    kind, percent = parse_aggregate(aggregate)
+    if kind == 'min':
+        return min(times)
+    values = sorted(times)
+    n = len(values)
+    if kind == 'median':
+        return int(round((values[(n - 1) // 2] + values[n // 2]) / 2))
+    return values[(n - 1) * percent // 100]
+
+
+def load_gtfs(path):
+    """加载我们需要的 GTFS 文件"""
+    stops = pd.read_csv(f'{path}stops.txt')
+    stop_times = pd.read_csv(f'{path}stop_times.txt')
+    transfers = pd.read_csv(f'{path}transfers.txt')
+    return stops, stop_times, transfers
+
+
+def load_service_calendar(path):
+    """加载运营日历 (trips.txt 的 service_id、calendar.txt、calendar_dates.txt)，缺少的文件返回 None"""
+    def read(name, columns, dtypes):
+        try:
+            return pd.read_csv(f'{path}{name}', usecols=columns, dtype=dtypes)
+        except FileNotFoundError:
+            return None
+    weekdays = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    trips = read('trips.txt', ['trip_id', 'service_id'], {'trip_id': str, 'service_id': str})
+    calendar = read('calendar.txt', ['service_id', *weekdays, 'start_date', 'end_date'], {'service_id': str})
+    calendar_dates = read('calendar_dates.txt', ['service_id', 'date', 'exception_type'], {'service_id': str})
+    return trips, calendar, calendar_dates
+
+
+def build_ride_edges(stop_times):
+    """按行程顺序生成乘车边列表 [(from_stop_id, to_stop_id, travel_time), ...]"""
+    edges = []
+
+    # 对 stop_times 按 trip_id 分组，并按 stop_sequence 排序
+    # 这样可以保证我们处理的是同一趟车、并且是按顺序的站点
+    stop_times_sorted = stop_times.sort_values(by=['trip_id', 'stop_sequence'])
+
+    # 使用 groupby 来高效处理每一趟行程
+    for trip_id, trip_group in stop_times_sorted.groupby('trip_id'):
+        # 将每一趟行程的停靠点转换为列表
+        trip_stops = trip_group.to_dict('records')
+
+        # 遍历行程中的每一站，除了最后一站
+        for i in range(len(trip_stops) - 1):
+            from_stop = trip_stops[i]
+            to_stop = trip_stops[i+1]
+
+            # 计算权重（时间）
+            departure_time_sec = time_to_seconds(from_stop['departure_time'])
+            arrival_time_sec = time_to_seconds(to_stop['arrival_time'])
+
+            # 跨天的情况（arrival < departure）需要日历数据才能精确处理，
+            # 这里直接被下面的正数检查过滤掉
+            travel_time = arrival_time_sec - departure_time_sec
+
+            # 确保旅行时间是正数
+            if travel_time > 0:
+                edges.append((from_stop['stop_id'], to_stop['stop_id'], travel_time))
+
+    return edges
+
+
+def collapse_parallel_edges(edges, aggregate):
+    """把同一 (from, to) 之间的平行边合并为一条，结果按 (from, to) 排序"""
+    if parse_aggregate(aggregate)[0] == 'all':
+        return edges
+
+    grouped = defaultdict(list)
+    for from_stop_id, to_stop_id, travel_time in edges:
+        grouped[(from_stop_id, to_stop_id)].append(travel_time)
+
+    return [
+        (from_stop_id, to_stop_id, aggregate_travel_times(times, aggregate))
+        for (from_stop_id, to_stop_id), times in sorted(grouped.items())
+    ]
+
+
+def build_ride_edges_vectorized(stop_times, aggregate):
+    """向量化构建乘车边，结果与 build_ride_edges + collapse_parallel_edges 完全相同"""
+    kind, percent = parse_aggregate(aggregate)
+    edges = _trip_edge_frame(stop_times)
+    if kind == 'all':
+        return _edge_list(edges)
+    return _aggregate_edge_frame(edges, kind, percent)
+
+
+def _trip_edge_frame(stop_times, with_trip_ids=False):
+    """按行程顺序生成未合并的乘车边表 (DataFrame)，with_trip_ids 时附带每条边所属的 trip_id"""
+    # 与循环版本使用同样的排序，保证 'all' 模式下边的顺序也一致
+    stop_times_sorted = stop_times.sort_values(by=['trip_id', 'stop_sequence'])
+    trip_ids = stop_times_sorted['trip_id'].to_numpy()
+    stop_ids = stop_times_sorted['stop_id'].to_numpy()
+    departure = times_to_seconds(stop_times_sorted['departure_time'])
+    arrival = times_to_seconds(stop_times_sorted['arrival_time'])
+
+    # 相邻两行属于同一趟车时，构成一条 "本站 -> 下一站" 的边
+    travel_time = arrival[1:] - departure[:-1]
+    keep = (trip_ids[:-1] == trip_ids[1:]) & (travel_time > 0)
+    edges = pd.DataFrame({
+        'from_stop_id': stop_ids[:-1][keep],
+        'to_stop_id': stop_ids[1:][keep],
+        'travel_time': travel_time[keep],
+    })
+    if with_trip_ids:
+        edges['trip_id'] = trip_ids[:-1][keep]
+    return edges
+
+
+def _edge_list(edges):
+    """边表 (DataFrame) -> [(from_stop_id, to_stop_id, travel_time), ...]"""
+    return list(zip(edges['from_stop_id'], edges['to_stop_id'], edges['travel_time'].tolist()))
+
+
+def _aggregate_edge_frame(edges, kind, percent):
+    """按 (from_stop_id, to_stop_id) 合并边表 (DataFrame)，返回按站点对排序的边列表"""
+    keys = ['from_stop_id', 'to_stop_id']
+    if kind == 'min':
+        result = edges.groupby(keys, sort=True)['travel_time'].min()
+    elif kind == 'median':
+        result = np.rint(edges.groupby(keys, sort=True)['travel_time'].median()).astype(np.int64)
+    else:
+        # 百分位数：组内排序后直接按位置取值，避免浮点插值带来的误差
+        edges = edges.sort_values(by=keys + ['travel_time'])
+        sizes = edges.groupby(keys, sort=True).size()
+        counts = sizes.to_numpy()
+        starts = np.cumsum(counts) - counts
+        values = edges['travel_time'].to_numpy()[starts + (counts - 1) * percent // 100]
+        result = pd.Series(values, index=sizes.index)
+
+    return [
+        (from_stop_id, to_stop_id, travel_time)
+        for (from_stop_id, to_stop_id), travel_time in zip(result.index, result.tolist())
+    ]
+
+
+# 流式读取时 stop_times.txt 只读取这些列，并使用窄类型
+STOP_TIMES_COLUMNS = ['trip_id', 'arrival_time', 'departure_time', 'stop_id', 'stop_sequence']
+STOP_TIMES_DTYPES = {
+    'trip_id': 'category',
+    'arrival_time': 'category',
+    'departure_time': 'category',
+    'stop_id': 'category',
+    'stop_sequence': np.int32,
+}
+
+
+class _CodeTable:
+    """把各块中的分类值映射为全局统一的整数编号（按第一次出现的顺序）"""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, column):
+        """分类列 -> int32 全局编号数组"""
+        categories = column.cat.categories.tolist()
+        mapping = np.empty(len(categories), dtype=np.int32)
+        for i, value in enumerate(categories):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            mapping[i] = code
+        return mapping[column.cat.codes.to_numpy()]
+
+
+def _grow(values, size, fill):
+    """需要时把按编号索引的数组扩大到至少 size 个元素"""
+    if len(values) >= size:
+        return values
+    grown = np.full(max(size, 2 * len(values)), fill, dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+def load_stop_times_streaming(path, aggregate=EDGE_AGGREGATE, chunk_rows=100000, keep_stop_times=True):
+    """分块读取 stop_times.txt，返回 (紧凑的 stop_times, 合并后的乘车边列表)
+
+    每块读入后立即转成窄类型的整数列 (车次 / 站点编号 int32、时刻秒数 int32、stop_sequence int32)，
+    并在块内按 (车次, stop_sequence) 排序构建乘车边。每趟车最后读到的一站 (stop_sequence、站点、
+    出发时刻) 保留到下一块，与该车次在下一块中的第一站连成一条边，所以块的边界可以落在行程中间。
+    'min' 合并方式下每块处理完就把边合并到每对站点一条，其他方式保留每条边 12 字节的整数数组。
+
+    内存并不是与文件大小无关的：默认保留全部记录的紧凑列（每行 20 字节，供 build_timetable 使用），
+    只是比一次读入的字符串列小得多。keep_stop_times=False 时不保留记录，返回的 stop_times 为 None，
+    不能再生成时刻表；这时 'min' 合并方式的内存只取决于块大小、车次数和站点对数。
+
+    同一趟车的记录在文件中不是按 stop_sequence 递增出现时（例如文件被打乱），
+    改为在全部读完后对紧凑的整数列排序再构建乘车边，结果相同；keep_stop_times=False 时
+    没有保留记录可以排序，抛出 ValueError。
+    返回的 stop_times 中 trip_id / stop_id 为分类列，arrival_time / departure_time 为整数秒，
+    可直接交给 build_graph / build_timetable。
+    """
+    kind, percent = parse_aggregate(aggregate)
+    if kind == 'all':
+        raise ValueError("流式读取不支持 'all' 合并方式，请使用 STOP_TIMES_CHUNK_ROWS = None")
+
+    trips, stops = _CodeTable(), _CodeTable()
+    columns = {name: [] for name in ('trip', 'stop', 'sequence', 'arrival', 'departure')}
+    # 每趟车已读到的最后一站（按车次编号索引）
+    last_sequence = np.full(0, -1, dtype=np.int64)
+    last_stop = np.zeros(0, dtype=np.int32)
+    last_departure = np.zeros(0, dtype=np.int32)
+    edge_parts = []
+    in_order = True
+
+    reader = pd.read_csv(f'{path}stop_times.txt', usecols=STOP_TIMES_COLUMNS,
+                         dtype=STOP_TIMES_DTYPES, chunksize=chunk_rows)
+    for chunk in reader:
+        trip = trips.encode(chunk['trip_id'])
+        stop = stops.encode(chunk['stop_id'])
+        sequence = chunk['stop_sequence'].to_numpy()
+        arrival = times_to_seconds(chunk['arrival_time']).astype(np.int32)
+        departure = times_to_seconds(chunk['departure_time']).astype(np.int32)
+        del chunk
+        if keep_stop_times:
+            for name, values in zip(columns, (trip, stop, sequence, arrival, departure)):
+                columns[name].append(values)
+        if not in_order:
+            continue
+
+        order = np.lexsort((sequence, trip))
+        trip, stop, sequence = trip[order], stop[order], sequence[order]
+        arrival, departure = arrival[order], departure[order]
+        first = np.r_[True, trip[1:] != trip[:-1]]
+        last = np.r_[first[1:], True]
+
+        last_sequence = _grow(last_sequence, len(trips.values), -1)
+        last_stop = _grow(last_stop, len(trips.values), 0)
+        last_departure = _grow(last_departure, len(trips.values), 0)
+
+        # 与上一块中同一趟车的最后一站相连
+        first_rows = np.flatnonzero(first)
+        first_trips = trip[first_rows]
+        carried = last_sequence[first_trips] >= 0
+        if (last_sequence[first_trips][carried] >= sequence[first_rows][carried]).any():
+            if not keep_stop_times:
+                raise ValueError("stop_times.txt 中同一趟车的记录不是按 stop_sequence 顺序出现，"
+                                 "不保留记录时无法分块构建乘车边，请设置 BUILD_TIMETABLE = True")
+            in_order = False
+            edge_parts = []
+            continue
+        carry_time = arrival[first_rows] - last_departure[first_trips]
+        keep = carried & (carry_time > 0)
+        edge_parts.append((last_stop[first_trips][keep], stop[first_rows][keep], carry_time[keep]))
+
+        # 块内同一趟车的相邻两站
+        travel_time = arrival[1:] - departure[:-1]
+        keep = ~first[1:] & (travel_time > 0)
+        edge_parts.append((stop[:-1][keep], stop[1:][keep], travel_time[keep]))
+
+        last_trips = trip[last]
+        last_sequence[last_trips] = sequence[last]
+        last_stop[last_trips] = stop[last]
+        last_departure[last_trips] = departure[last]
+
+        if kind == 'min' and len(edge_parts) > 2:
+            edge_parts = [_min_edges(edge_parts)]
+
+    trip_values, stop_values = _infer_values(trips.values), _infer_values(stops.values)
+    if not keep_stop_times:
+        return None, _stream_edge_list(edge_parts, stop_values, kind, percent)
+
+    # 逐列拼接并立即释放各块，避免同时保留两份
+    values = {}
+    for name in list(columns):
+        parts = columns.pop(name)
+        values[name] = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int32)
+        del parts
+    stop_times = pd.DataFrame({
+        'trip_id': _sorted_categorical(values['trip'], trip_values),
+        'arrival_time': values['arrival'],
+        'departure_time': values['departure'],
+        'stop_id': _sorted_categorical(values['stop'], stop_values),
+        'stop_sequence': values['sequence'],
+    }, copy=False)
+    del values
+
+    if not in_order:
+        print("stop_times.txt 中同一趟车的记录不是按 stop_sequence 顺序出现，读完后再构建乘车边。")
+        return stop_times, build_ride_edges_vectorized(stop_times, aggregate)
+    return stop_times, _stream_edge_list(edge_parts, stop_values, kind, percent)
+
+
+def _stream_edge_list(edge_parts, stop_values, kind, percent):
+    """流式读取得到的各段 (起点编号, 终点编号, 耗时) 合并为乘车边列表"""
+    from_codes, to_codes, travel_time = _concat_edges(edge_parts)
+    stop_names = stop_values.to_numpy()
+    edges = pd.DataFrame({
+        'from_stop_id': stop_names[from_codes],
+        'to_stop_id': stop_names[to_codes],
+        'travel_time': travel_time.astype(np.int64),
+    })
+    return _aggregate_edge_frame(edges, kind, percent)
+
+
+def _concat_edges(edge_parts):
+    """[(起点编号, 终点编号, 耗时), ...] 各段拼接为三个数组"""
+    if not edge_parts:
+        return (np.zeros(0, dtype=np.int32),) * 3
+    return tuple(np.concatenate(column) for column in zip(*edge_parts))
+
+
+def _min_edges(edge_parts):
+    """把若干段 (起点编号, 终点编号, 耗时) 合并为每对站点只保留最短耗时"""
+    from_codes, to_codes, travel_time = _concat_edges(edge_parts)
+    pairs = pd.DataFrame({'from': from_codes, 'to': to_codes, 'time': travel_time})
+    result = pairs.groupby(['from', 'to'], sort=False)['time'].min().reset_index()
+    return (result['from'].to_numpy(np.int32), result['to'].to_numpy(np.int32),
+            result['time'].to_numpy(np.int32))
+
+
+def _infer_values(values):
+    """分类列读入的都是字符串；与 read_csv 默认的类型推断一致，全部是数字时转为数字"""
+    values = pd.Index(values, dtype=object)
+    try:
+        return pd.Index(pd.to_numeric(values))
+    except (ValueError, TypeError):
+        return values
+
+
+def _sorted_categorical(codes, values):
+    """按出现顺序编号的值 -> 类别有序排列的 pandas 分类列（sort_values 结果与直接读入时相同）"""
+    order = values.argsort(kind='stable')
+    rank = np.empty(len(values), dtype=np.int32)
+    rank[order] = np.arange(len(values), dtype=np.int32)
+    return pd.Categorical.from_codes(rank[codes], values[order])
+
+
+def load_gtfs_streaming(path, aggregate=EDGE_AGGREGATE, chunk_rows=100000, keep_stop_times=True):
+    """与 load_gtfs 相同，但分块读取 stop_times.txt；返回 (stops, stop_times, transfers, 乘车边)
+
+    keep_stop_times=False 时 stop_times 为 None（见 load_stop_times_streaming）。
+    """
+    stops = pd.read_csv(f'{path}stops.txt')
+    transfers = pd.read_csv(f'{path}transfers.txt')
+    stop_times, ride_edges = load_stop_times_streaming(path, aggregate, chunk_rows, keep_stop_times)
+    return stops, stop_times, transfers, ride_edges
+
+
+def build_transfer_edges(stops, transfers, kinds=None):
+    """生成换乘边列表 [(from_stop_id, to_stop_id, transfer_time), ...]
+
+    kinds: 可选的列表，按边的顺序追加每条边的类型
+           (GraphStore.EDGE_TRANSFER 显式换乘 / GraphStore.EDGE_WALK 同站台间步行)。
+    """
+    # 1. 处理 transfers.txt 中的显式换乘
+    edges = explicit_transfer_edges(transfers, kinds)
+
+    # 2. 处理基于 parent_station 的隐式换乘 (非常重要！)
+    for _, station_stop_ids in station_groups(stops):
+        walk_edges = station_walk_edges(station_stop_ids)
+        edges.extend(walk_edges)
+        if kinds is not None:
+            kinds.extend([GraphStore.EDGE_WALK] * len(walk_edges))
+
+    return edges
+
+
+def explicit_transfer_edges(transfers, kinds=None):
+    """transfers.txt 中的显式换乘边"""
+    edges = []
+    for index, row in transfers.iterrows():
+        # 我们只关心可以换乘的情况 (transfer_type != 3)
+        if row['transfer_type'] != 3:
+            # 权重是 min_transfer_time
+            # 如果没有提供时间，给一个默认值，比如2分钟 (120秒)
+            transfer_time = int(row['min_transfer_time']) if pd.notna(row['min_transfer_time']) else 120
+            edges.append((row['from_stop_id'], row['to_stop_id'], transfer_time))
+            if kinds is not None:
+                kinds.append(GraphStore.EDGE_TRANSFER)
+    return edges
+
+
+def station_groups(stops):
+    """[(parent_station, 站台ID列表), ...]，按 parent_station 排序"""
+    # 首先，筛选出有 parent_station 的站台
+    stops_with_parent = stops[stops['parent_station'].notna()]
+    # 按 parent_station 分组
+    return [(parent_station_id, group['stop_id'].tolist())
+            for parent_station_id, group in stops_with_parent.groupby('parent_station')]
+
+
+def station_walk_edges(station_stop_ids):
+    """同一个父站下所有站台之间的双向步行换乘边"""
+    edges = []
+    for i in range(len(station_stop_ids)):
+        for j in range(i + 1, len(station_stop_ids)):
+            from_stop_id = station_stop_ids[i]
+            to_stop_id = station_stop_ids[j]
+
+            # 给一个默认的站内步行换乘时间，比如3分钟 (180秒)
+            transfer_time = 180
+
+            # 添加双向边
+            edges.append((from_stop_id, to_stop_id, transfer_time))
+            edges.append((to_stop_id, from_stop_id, transfer_time))
+    return edges
+
+
+# 子进程中的 stop_times、每行所属的分区、排序后的全部站点ID、各父站的站台列表及所属分区
+# (见 _build_worker_init)
+_worker_stop_times = None
+_worker_trip_partition = None
+_worker_stop_values = None
+_worker_stations = None
+_worker_station_partition = None
+
+
+def _partition(values, partitions):
+    """按值的哈希（与进程无关，每次运行都相同）分区，返回每个值的分区号"""
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy() % partitions
+
+
+def _build_worker_init(stop_times, trip_partition, stop_values, stations, station_partition):
+    """子进程初始化：保存整份输入，各任务只处理属于自己分区的部分"""
+    global _worker_stop_times, _worker_trip_partition, _worker_stop_values
+    global _worker_stations, _worker_station_partition
+    _worker_stop_times = stop_times
+    _worker_trip_partition = trip_partition
+    _worker_stop_values = stop_values
+    _worker_stations = stations
+    _worker_station_partition = station_partition
+
+
+def _ride_edges_worker(task):
+    """分区内行程的乘车边表；'min' 时已在分区内按站点对去重
+
+    站点ID换成在排序后全部站点ID中的序号：传回主进程的数据少，主进程合并时也只需对整数排序，
+    且序号与站点ID的顺序一致，合并结果的顺序不变。
+    """
+    partition, kind = task
+    edges = _trip_edge_frame(_worker_stop_times[_worker_trip_partition == partition],
+                             with_trip_ids=kind == 'all')
+    for column in ('from_stop_id', 'to_stop_id'):
+        edges[column] = pd.Categorical(edges[column], categories=_worker_stop_values).codes
+    if kind == 'min':
+        edges = edges.groupby(['from_stop_id', 'to_stop_id'], sort=False)['travel_time'].min().reset_index()
+    return edges
+
+
+def _walk_edges_worker(partition):
+    """分区内各父站的步行换乘边 {父站序号: 边列表}"""
+    return {
+        k: station_walk_edges(_worker_stations[k])
+        for k in np.flatnonzero(_worker_station_partition == partition).tolist()
+    }
+
+
+def build_edges_parallel(stops, stop_times, transfers, aggregate, processes=None, ride_edges=None,
+                         transfer_kinds=None):
+    """多进程构建乘车边与换乘边，返回 (乘车边, 换乘边)，与单进程构建的结果及顺序完全相同
+
+    乘车边按 trip_id 的哈希分成 processes 份（同一趟车的所有记录在同一份中），各进程构建
+    自己那份的边（'min' 时先在进程内去重），合并后再按站点对统一合并；'all' 时按 trip_id
+    稳定排序，恢复单进程的边顺序。同站步行换乘按 parent_station 的哈希分配，
+    合并后按父站顺序排列。ride_edges 已给出（流式读取）时只并行构建换乘边。
+    """
+    kind, percent = parse_aggregate(aggregate)
+    processes = processes or os.cpu_count()
+    groups = station_groups(stops)
+    stations = [station_stop_ids for _, station_stop_ids in groups]
+    station_partition = _partition([parent_station_id for parent_station_id, _ in groups], processes)
+    trip_partition = stop_values = None
+    if ride_edges is None:
+        trip_partition = _partition(stop_times['trip_id'], processes)
+        stop_values = pd.Index(stop_times['stop_id'].unique()).sort_values().to_numpy()
+
+    with Pool(processes, _build_worker_init,
+              (stop_times if ride_edges is None else None, trip_partition, stop_values,
+               stations, station_partition)) as pool:
+        ride_parts = None
+        if ride_edges is None:
+            ride_parts = pool.map_async(_ride_edges_worker, [(p, kind) for p in range(processes)])
+        walk_parts = pool.map(_walk_edges_worker, range(processes))
+        if ride_parts is not None:
+            edges = pd.concat(ride_parts.get(), ignore_index=True)
+            if kind == 'all':
+                edges = _edge_list(edges.sort_values(by='trip_id', kind='stable'))
+            else:
+                edges = _aggregate_edge_frame(edges, kind, percent)
+            ride_edges = [(stop_values[u], stop_values[v], travel_time) for u, v, travel_time in edges]
+
+    # 显式换乘只有几百条，直接在本进程中处理
+    transfer_edges = explicit_transfer_edges(transfers, transfer_kinds)
+    walk_edges = {}
+    for part in walk_parts:
+        walk_edges.update(part)
+    for k in range(len(stations)):
+        transfer_edges.extend(walk_edges[k])
+        if transfer_kinds is not None:
+            transfer_kinds.extend([GraphStore.EDGE_WALK] * len(walk_edges[k]))
+    return ride_edges, transfer_edges
+
+
+def assemble_graph(stop_ids, ride_edges, transfer_edges, aggregate, transfer_kinds=None, edge_kinds=None):
+    """把乘车边和换乘边放进邻接表 graph[from] = [(to, weight), ...]
+
+    transfer_kinds: build_transfer_edges() 输出的换乘边类型列表，缺省时都记为显式换乘。
+    edge_kinds: 可选的 dict，填入 {from: [每条出边的类型, ...]}，顺序与 graph[from] 一致。
+    """
+    if transfer_kinds is None:
+        transfer_kinds = [GraphStore.EDGE_TRANSFER] * len(transfer_edges)
+
+    # 同一个站点ID只使用一个对象（第一次出现的那个）：pickle 只写一次，
+    # 文件更小，且与边来自单进程还是多进程构建无关
+    canonical = {}
+    same = canonical.setdefault
+
+    # 先连同边类型一起放进邻接表 typed[from] = [(to, weight, kind), ...]
+    typed = defaultdict(list)
+    for stop_id in stop_ids:
+        typed[same(stop_id, stop_id)] = []
+    for from_stop_id, to_stop_id, weight in ride_edges:
+        typed[same(from_stop_id, from_stop_id)].append((same(to_stop_id, to_stop_id), weight, GraphStore.EDGE_RIDE))
+    for (from_stop_id, to_stop_id, weight), kind in zip(transfer_edges, transfer_kinds):
+        typed[same(from_stop_id, from_stop_id)].append((same(to_stop_id, to_stop_id), weight, kind))
+
+    if parse_aggregate(aggregate)[0] != 'all':
+        # 合并模式下，乘车边和换乘边可能连接同一对站点：乘车边与换乘 / 步行边各保留最快的一条，
+        # 换乘边只在比乘车边更快时保留（否则耗时不短、换乘还多一次，被乘车边支配）。
+        # 不能只留最快的一条，否则乘车边被更快的步行边替换后，Pareto.py 会多算一次换乘
+        for from_stop_id, edges in typed.items():
+            best = {}
+            for to_stop_id, weight, kind in edges:
+                slot = (to_stop_id, kind == GraphStore.EDGE_RIDE)
+                if slot not in best or weight < best[slot][0]:
+                    best[slot] = (weight, kind)
+            kept = [(to_stop_id, weight, kind) for (to_stop_id, is_ride), (weight, kind) in best.items()
+                    if is_ride or (to_stop_id, True) not in best or weight < best[(to_stop_id, True)][0]]
+            if len(kept) < len(edges):
+                typed[from_stop_id] = kept
+
+    graph = defaultdict(list)
+    for from_stop_id, edges in typed.items():
+        graph[from_stop_id] = [(to_stop_id, weight) for to_stop_id, weight, _ in edges]
+        if edge_kinds is not None:
+            edge_kinds[from_stop_id] = [kind for _, _, kind in edges]
+    return graph
+
+
+def stop_coordinates(stops):
+    """从 stops.txt 提取 {stop_id: (lat, lon)}，没有坐标列时返回 None"""
+    if 'stop_lat' not in stops.columns or 'stop_lon' not in stops.columns:
+        return None
+    return {
+        stop_id: (float(lat), float(lon))
+        for stop_id, lat, lon in zip(stops['stop_id'], stops['stop_lat'], stops['stop_lon'])
+    }
+
+
+def _to_array(typecode, values):
+    """NumPy 数组转为 array.array（连续内存，可直接写入 mmap 文件）"""
+    dtype = {'i': np.int32, 'I': np.uint32}[typecode]
+    return array(typecode, np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+
+def _split_overtaking(trips, departure, arrival, length):
+    """把同一停站序列的行程（已按首站出发时间排序）分成若干组，组内后一趟车在每一站都不早于前一趟
+
+    trips: 各行程在排序后 stop_times 中的起始行号。
+    """
+    groups = []
+    for start in trips:
+        dep = departure[start:start + length]
+        arr = arrival[start:start + length]
+        for group in groups:
+            last = group[-1]
+            if (departure[last:last + length] <= dep).all() and (arrival[last:last + length] <= arr).all():
+                group.append(start)
+                break
+        else:
+            groups.append([start])
+    return groups
+
+
+def build_service_sections(trip_names, trips, calendar=None, calendar_dates=None):
+    """时刻表的运营日历区段（见 Timetable.py）
+
+    trip_names: 时刻表中按编号排列的 trip_id；trips / calendar / calendar_dates 为 load_service_calendar 的结果。
+    trips.txt 中找不到的车次记为日历编号 len(service_ids)，视为每天运行。
+    """
+    trip_service_ids = dict(zip(trips['trip_id'].astype(str), trips['service_id'].astype(str)))
+    service_ids = sorted(set(trip_service_ids.values()))
+    if calendar is not None:
+        service_ids = sorted(set(service_ids) | set(calendar['service_id'].astype(str)))
+    if calendar_dates is not None:
+        service_ids = sorted(set(service_ids) | set(calendar_dates['service_id'].astype(str)))
+    index = {service_id: s for s, service_id in enumerate(service_ids)}
+    missing = len(service_ids)
+    trip_service = array('I', (index.get(trip_service_ids.get(name), missing) for name in trip_names))
+
+    weekdays = array('B', [0]) * len(service_ids)
+    start = array('I', [0]) * len(service_ids)
+    end = array('I', [0]) * len(service_ids)
+    if calendar is not None:
+        days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        for row in calendar.itertuples(index=False):
+            s = index[str(row.service_id)]
+            weekdays[s] = sum(1 << bit for bit, day in enumerate(days) if int(getattr(row, day)) == 1)
+            start[s], end[s] = int(row.start_date), int(row.end_date)
+
+    exception_services, exception_dates, exception_types = array('I'), array('I'), array('B')
+    if calendar_dates is not None:
+        for service_id, date, exception_type in zip(
+                calendar_dates['service_id'], calendar_dates['date'], calendar_dates['exception_type']):
+            exception_services.append(index[str(service_id)])
+            exception_dates.append(int(date))
+            exception_types.append(int(exception_type))
+
+    return {
+        'service_ids': '\n'.join(service_ids).encode('utf-8'),
+        'trip_service': trip_service,
+        'cal_weekdays': weekdays,
+        'cal_start': start,
+        'cal_end': end,
+        'cal_exc_service': exception_services,
+        'cal_exc_date': exception_dates,
+        'cal_exc_type': exception_types,
+    }
+
+
+def build_timetable(stops, stop_times, transfers, trips=None, calendar=None, calendar_dates=None):
+    """把 stop_times 整理成 Timetable.py 描述的平铺数组 {区段名: array}
+
+    停靠站序列相同的行程归为一条线路；同一序列中如果有超车（后出发的车先到），
+    拆成多条线路，保证每条线路内的行程在每一站都按时间排序。
+    另外输出按出发时刻排序的全部连接，供 ConnectionScan.py 使用。
+    trips / calendar / calendar_dates: 运营日历（见 load_service_calendar），给出 trips 时写入日历区段，
+    查询时只使用当天运行的车次。
+    """
+    stop_ids = sorted(set(stops['stop_id']) | set(stop_times['stop_id']))
+    index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+    stop_times_sorted = stop_times.sort_values(by=['trip_id', 'stop_sequence'])
+    trip_ids = stop_times_sorted['trip_id'].to_numpy()
+    stop_index = stop_times_sorted['stop_id'].map(index).to_numpy(dtype=np.int64)
+    departure = times_to_seconds(stop_times_sorted['departure_time'])
+    arrival = times_to_seconds(stop_times_sorted['arrival_time'])
+
+    # 每趟车在排序后数组中的 [start, end) 区间
+    starts = np.flatnonzero(np.r_[True, trip_ids[1:] != trip_ids[:-1]])
+    ends = np.r_[starts[1:], len(trip_ids)]
+
+    # 时刻倒流（在站出发早于到达，或下一站到达早于本站出发）的行程是脏数据，整趟不收录，
+    # RAPTOR 的线路与 CSA 的连接来自同一批车次，两个引擎的结果保持一致
+    backwards = departure < arrival
+    backwards[:-1] |= (trip_ids[1:] == trip_ids[:-1]) & (arrival[1:] < departure[:-1])
+    trip_backwards = np.logical_or.reduceat(backwards, starts) if len(starts) else backwards
+
+    # 按停靠站序列分组
+    patterns = defaultdict(list)
+    for start, end, skip in zip(starts.tolist(), ends.tolist(), trip_backwards.tolist()):
+        if end - start >= 2 and not skip:
+            patterns[tuple(stop_index[start:end].tolist())].append(start)
+
+    route_stop_offsets = array('I', [0])
+    route_stops = array('I')
+    route_trip_offsets = array('I', [0])
+    route_time_offsets = array('I', [0])
+    arrival_out = array('i')
+    departure_out = array('i')
+    trip_names = []
+    # 排序后 stop_times 每一行所属的时刻表车次编号 (-1 为未收录的单站行程或时刻倒流的行程)
+    row_trip = np.full(len(trip_ids), -1, dtype=np.int64)
+    for pattern, pattern_trips in patterns.items():
+        length = len(pattern)
+        pattern_trips.sort(key=lambda start: (departure[start], trip_ids[start]))
+        for group in _split_overtaking(pattern_trips, departure, arrival, length):
+            route_stops.extend(pattern)
+            route_stop_offsets.append(len(route_stops))
+            for start in group:
+                row_trip[start:start + length] = len(trip_names)
+                trip_names.append(str(trip_ids[start]))
+                arrival_out.extend(arrival[start:start + length].tolist())
+                departure_out.extend(departure[start:start + length].tolist())
+            route_trip_offsets.append(len(trip_names))
+            route_time_offsets.append(len(arrival_out))
+
+    # 每个站点经过的 (线路, 位置)
+    stop_route_lists = [[] for _ in stop_ids]
+    for r in range(len(route_stop_offsets) - 1):
+        for position in range(route_stop_offsets[r + 1] - route_stop_offsets[r]):
+            stop_route_lists[route_stops[route_stop_offsets[r] + position]].append((r, position))
+
+    # 步行换乘与静态图使用同样的规则
+    transfer_lists = [[] for _ in stop_ids]
+    for from_stop_id, to_stop_id, transfer_time in build_transfer_edges(stops, transfers):
+        if from_stop_id != to_stop_id and from_stop_id in index and to_stop_id in index:
+            transfer_lists[index[from_stop_id]].append((index[to_stop_id], transfer_time))
+
+    def flatten(lists, typecodes):
+        offsets = array('I', [0])
+        columns = [array(typecode) for typecode in typecodes]
+        for items in lists:
+            for item in sorted(items):
+                for column, value in zip(columns, item):
+                    column.append(value)
+            offsets.append(len(columns[0]))
+        return (offsets, *columns)
+
+    stop_route_offsets, stop_routes, stop_route_positions = flatten(stop_route_lists, 'II')
+    transfer_offsets, transfer_targets, transfer_times = flatten(transfer_lists, 'II')
+
+    # 连接 (Connection Scan 使用): 同一车次相邻两站之间的一段行驶，按出发时刻排序
+    rows = np.arange(len(trip_ids))
+    row_position = rows - np.repeat(starts, ends - starts)
+    keep = (row_trip[:-1] >= 0) & (row_trip[:-1] == row_trip[1:])
+    connection_rows = rows[:-1][keep]
+    order = np.lexsort((row_trip[connection_rows], arrival[connection_rows + 1], departure[connection_rows]))
+    connection_rows = connection_rows[order]
+
+    sections = {
+        'stop_ids': '\n'.join(map(str, stop_ids)).encode('utf-8'),
+        'trip_ids': '\n'.join(trip_names).encode('utf-8'),
+        'route_stop_offs': route_stop_offsets,
+        'route_stops': route_stops,
+        'route_trip_offs': route_trip_offsets,
+        'route_time_offs': route_time_offsets,
+        'arrival': arrival_out,
+        'departure': departure_out,
+        'stop_route_offs': stop_route_offsets,
+        'stop_routes': stop_routes,
+        'stop_route_pos': stop_route_positions,
+        'transfer_offsets': transfer_offsets,
+        'transfer_targets': transfer_targets,
+        'transfer_times': transfer_times,
+        'conn_dep_stop': _to_array('I', stop_index[connection_rows]),
+        'conn_arr_stop': _to_array('I', stop_index[connection_rows + 1]),
+        'conn_dep_time': _to_array('i', departure[connection_rows]),
+        'conn_arr_time': _to_array('i', arrival[connection_rows + 1]),
+        'conn_trip': _to_array('I', row_trip[connection_rows]),
+        'conn_position': _to_array('I', row_position[connection_rows]),
+    }
+    if trips is not None:
+        sections.update(build_service_sections(trip_names, trips, calendar, calendar_dates))
+    return sections
+
+
+def build_graph(stops, stop_times, transfers, aggregate=EDGE_AGGREGATE, builder=RIDE_EDGE_BUILDER,
+                edge_kinds=None, ride_edges=None, processes=1):
+    """从 GTFS 数据构建完整的地铁网络图
+
+    edge_kinds: 可选的 dict，填入每条边的类型（见 assemble_graph）。
+    ride_edges: 已经构建好的乘车边（流式读取时由 load_gtfs_streaming 得到），此时不再从 stop_times 构建。
+    processes: 构建乘车边与换乘边的进程数（见 build_edges_parallel），1 为单进程，None 为全部 CPU 核。
+    """
+    parse_aggregate(aggregate)
+
+    if processes != 1:
+        print(f"开始用 {processes or os.cpu_count()} 个进程构建乘车边与换乘边...")
+        transfer_kinds = []
+        ride_edges, transfer_edges = build_edges_parallel(
+            stops, stop_times, transfers, aggregate, processes, ride_edges, transfer_kinds)
+        print(f"构建完成！乘车边 {len(ride_edges)} 条（合并方式: '{aggregate}'），换乘边 {len(transfer_edges)} 条。")
+        return assemble_graph(stops['stop_id'], ride_edges, transfer_edges, aggregate, transfer_kinds, edge_kinds)
+
+    if ride_edges is None:
+        print("开始构建乘车边...")
+        if builder == 'vectorized':
+            ride_edges = build_ride_edges_vectorized(stop_times, aggregate)
+        elif builder == 'loop':
+            ride_edges = collapse_parallel_edges(build_ride_edges(stop_times), aggregate)
+        else:
+            raise ValueError(f"不支持的构建方式: {builder!r} (可选 'vectorized', 'loop')")
+    print(f"乘车边构建完成！共 {len(ride_edges)} 条（合并方式: '{aggregate}'）。")
+
+    print("开始构建换乘边...")
+    transfer_kinds = []
+    transfer_edges = build_transfer_edges(stops, transfers, transfer_kinds)
+    print("换乘边构建完成！")
+
+    return assemble_graph(stops['stop_id'], ride_edges, transfer_edges, aggregate, transfer_kinds, edge_kinds)
+
+
+def save_graph(graph, filename=graph_filename):
+    """把 graph 对象用 pickle 保存到文件"""
+    # 使用 'wb' 模式打开文件，'w' 代表写入, 'b' 代表二进制模式
+    with open(filename, 'wb') as f:
+        pickle.dump(graph, f)
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else BUILD_PROCESSES
+
+    # 加载我们需要的文件
+    ride_edges = None
+    try:
+        if STOP_TIMES_CHUNK_ROWS:
+            stops, stop_times, transfers, ride_edges = load_gtfs_streaming(
+                gtfs_path, EDGE_AGGREGATE, STOP_TIMES_CHUNK_ROWS, keep_stop_times=BUILD_TIMETABLE)
+        else:
+            stops, stop_times, transfers = load_gtfs(gtfs_path)
+    except FileNotFoundError as e:
+        print(f"文件未找到: {e}. 请确保 GTFS 文件在正确的路径下。")
+        exit()
+
+    print("数据加载成功！")
+    print(f"总共有 {len(stops)} 个站台。")
+    if stop_times is not None:
+        print(f"总共有 {len(stop_times)} 条停靠记录。")
+    print(f"总共有 {len(transfers)} 条换乘规则。")
+
+    edge_kinds = {}
+    graph = build_graph(stops, stop_times, transfers, EDGE_AGGREGATE, RIDE_EDGE_BUILDER, edge_kinds, ride_edges,
+                        processes)
+
+    total_nodes = len(graph)
+    total_edges = sum(len(edges) for edges in graph.values())
+    print(f"\n图构建完成！")
+    print(f"总节点数: {total_nodes}")
+    print(f"总边数: {total_edges}")
+
+    # 开始保存 graph 对象
+    print(f"\n正在将构建好的图保存到文件: {graph_filename} ...")
+    save_graph(graph, graph_filename)
+    print(f"正在保存 CSR 格式的图文件: {csr_filename} ...")
+    GraphStore.save_csr(graph, csr_filename, stop_coordinates(stops), edge_kinds)
+    print("保存成功！")
+
+    if not BUILD_TIMETABLE:
+        print(f"\nBUILD_TIMETABLE = False，不生成时刻表 {timetable_filename}。")
+        return
 
-# 开始保存 graph 对象
-print(f"\n正在将构建好的图保存到文件: {graph_filename} ...")
+    print(f"\n正在构建时刻表: {timetable_filename} ...")
+    trips, calendar, calendar_dates = load_service_calendar(gtfs_path)
+    if trips is None:
+        print("没有 trips.txt，时刻表不区分运营日历，所有车次视为每天运行。")
+    timetable = build_timetable(stops, stop_times, transfers, trips, calendar, calendar_dates)
+    Timetable.save_timetable(timetable, timetable_filename)
+    print(f"时刻表保存成功！共 {len(timetable['route_stop_offs']) - 1} 条线路，"
+          f"{timetable['route_trip_offs'][-1]} 趟车次。")
 
-# 使用 'wb' 模式打开文件，'w' 代表写入, 'b' 代表二进制模式
-with open(graph_filename, 'wb') as f:
-    # 使用 pickle.dump 将 graph 对象写入文件 f
-    pickle.dump(graph, f)
 
-print("保存成功！")
\ No newline at end of file
+# 当直接运行这个脚本时，执行 main 函数
+if __name__ == "__main__":
+    main()
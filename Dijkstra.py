@@ -1,5 +1,10 @@
-import pickle
 import heapq
+import math
+import threading
+import weakref
+from array import array
+from collections import OrderedDict
+from GraphStore import load_graph, haversine
 
 # --- Dijkstra 算法实现 ---
 # (这就是你将要专注于编写的部分)
@@ -38,20 +43,574 @@ def dijkstra(graph,start_node,end_node):
         return None, None  
     return distance[end_node],path
 
+
+# --- 整数下标的数组内核 ---
+# 在 CSRGraph 的整数下标上运行，距离/前驱缓冲区只在创建时分配一次。
+# 每次查询只把 "代数" 加一：stamp[v] 不等于当前代数的节点视为未访问，
+# 因此不需要在每次查询前把 |V| 个节点全部重置。
+
+class IndexedDijkstra:
+    """可复用的数组版 Dijkstra 内核（一个实例只能被一个线程使用）"""
+
+    def __init__(self, graph):
+        n = len(graph)
+        self.graph = graph
+        self.distance = array('q', [0]) * n
+        self.previous = array('i', [-1]) * n
+        self.stamp = array('I', [0]) * n
+        self.generation = 0
+        self.settled = 0  # 最近一次查询出队（确定最短距离）的节点数
+
+    def _next_generation(self):
+        self.generation += 1
+        if self.generation > 0xFFFFFFFF:
+            # 代数溢出时才真正清空一次
+            self.stamp = array('I', [0]) * len(self.stamp)
+            self.generation = 1
+        return self.generation
+
+    def search(self, source, target=-1):
+        """从 source 搜索到 target（整数下标），返回最短时间，不可达时返回 None
+
+        target 为 -1 时搜索整个连通范围（一对多），之后可用 distance_to() 读取结果。
+        """
+        generation = self._next_generation()
+        distance, previous, stamp = self.distance, self.previous, self.stamp
+        offsets, targets, weights = self.graph.offsets, self.graph.targets, self.graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        distance[source] = 0
+        previous[source] = -1
+        stamp[source] = generation
+        settled = 0
+        pq = [(0, source)]
+        while pq:
+            current_distance, u = heappop(pq)
+            if current_distance > distance[u]:
+                continue
+            settled += 1
+            if u == target:
+                break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                newtime = current_distance + weights[e]
+                if stamp[v] != generation:
+                    stamp[v] = generation
+                elif newtime >= distance[v]:
+                    continue
+                distance[v] = newtime
+                previous[v] = u
+                heappush(pq, (newtime, v))
+        self.settled = settled
+
+        if target < 0 or stamp[target] != generation:
+            return None
+        return distance[target]
+
+    def search_many(self, source, targets=None, max_time=None):
+        """一次搜索得到 source 到多个站点的最短时间，返回 {下标: 时间}
+
+        targets 为 None 时返回所有可达站点，否则在 targets 全部出队后立即停止；
+        max_time 不为 None 时只搜索耗时不超过 max_time 的范围。
+        """
+        generation = self._next_generation()
+        distance, previous, stamp = self.distance, self.previous, self.stamp
+        offsets, targets_csr, weights = self.graph.offsets, self.graph.targets, self.graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+        remaining = None if targets is None else set(targets)
+
+        distance[source] = 0
+        previous[source] = -1
+        stamp[source] = generation
+        result = {}
+        settled = 0
+        pq = [(0, source)]
+        while pq:
+            current_distance, u = heappop(pq)
+            if current_distance > distance[u]:
+                continue
+            if max_time is not None and current_distance > max_time:
+                break
+            settled += 1
+            if remaining is None:
+                result[u] = current_distance
+            elif u in remaining:
+                result[u] = current_distance
+                remaining.discard(u)
+                if not remaining:
+                    break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets_csr[e]
+                newtime = current_distance + weights[e]
+                if stamp[v] != generation:
+                    stamp[v] = generation
+                elif newtime >= distance[v]:
+                    continue
+                distance[v] = newtime
+                previous[v] = u
+                heappush(pq, (newtime, v))
+        self.settled = settled
+        return result
+
+    def distance_to(self, v):
+        """最近一次查询中 v 的最短时间，未到达时返回 None"""
+        if self.stamp[v] != self.generation:
+            return None
+        return self.distance[v]
+
+    def path_to(self, target):
+        """沿前驱数组回溯最近一次查询的路径（整数下标列表）"""
+        path = []
+        v = target
+        while v != -1:
+            path.append(v)
+            v = self.previous[v]
+        path.reverse()
+        return path
+
+
+class BidirectionalDijkstra:
+    """双向 Dijkstra：正向在原图上搜索，反向在反向邻接表上搜索，两边相遇后拼接路径
+
+    最短时间与 dijkstra() 相同；存在多条等长路线时，返回的路径可能是其中另一条。
+    """
+
+    def __init__(self, graph):
+        n = len(graph)
+        self.graph = graph
+        self.forward = IndexedDijkstra(graph)
+        self.backward = IndexedDijkstra(graph)
+        self.settled_forward = array('I', [0]) * n
+        self.settled_backward = array('I', [0]) * n
+        self.meeting_node = -1
+        self.settled = 0
+
+    def search(self, source, target):
+        """返回 source 到 target 的最短时间，不可达时返回 None"""
+        graph = self.graph
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+        rev_offsets, rev_sources, rev_edges = graph.reverse()
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        fwd, bwd = self.forward, self.backward
+        gen_f, gen_b = fwd._next_generation(), bwd._next_generation()
+        dist_f, prev_f, stamp_f, done_f = fwd.distance, fwd.previous, fwd.stamp, self.settled_forward
+        dist_b, prev_b, stamp_b, done_b = bwd.distance, bwd.previous, bwd.stamp, self.settled_backward
+
+        dist_f[source] = 0
+        prev_f[source] = -1
+        stamp_f[source] = gen_f
+        dist_b[target] = 0
+        prev_b[target] = -1
+        stamp_b[target] = gen_b
+        pq_f = [(0, source)]
+        pq_b = [(0, target)]
+
+        # best: 目前找到的最短 source->target 路线长度，meet: 该路线上两边搜索的交汇点
+        best = 0 if source == target else None
+        meet = source if source == target else -1
+        settled = 0
+        while pq_f and pq_b:
+            # 两边堆顶之和已经不小于 best 时，best 就是最短距离
+            if best is not None and pq_f[0][0] + pq_b[0][0] >= best:
+                break
+
+            # 每次扩展堆顶较小的一边
+            if pq_f[0][0] <= pq_b[0][0]:
+                d, u = heappop(pq_f)
+                if d > dist_f[u]:
+                    continue
+                settled += 1
+                done_f[u] = gen_f
+                for e in range(offsets[u], offsets[u + 1]):
+                    v = targets[e]
+                    newtime = d + weights[e]
+                    if stamp_f[v] != gen_f:
+                        stamp_f[v] = gen_f
+                    elif newtime >= dist_f[v]:
+                        continue
+                    dist_f[v] = newtime
+                    prev_f[v] = u
+                    heappush(pq_f, (newtime, v))
+                    if stamp_b[v] == gen_b and (best is None or newtime + dist_b[v] < best):
+                        best = newtime + dist_b[v]
+                        meet = v
+            else:
+                d, u = heappop(pq_b)
+                if d > dist_b[u]:
+                    continue
+                settled += 1
+                done_b[u] = gen_b
+                for k in range(rev_offsets[u], rev_offsets[u + 1]):
+                    v = rev_sources[k]
+                    newtime = d + weights[rev_edges[k]]
+                    if stamp_b[v] != gen_b:
+                        stamp_b[v] = gen_b
+                    elif newtime >= dist_b[v]:
+                        continue
+                    dist_b[v] = newtime
+                    prev_b[v] = u
+                    heappush(pq_b, (newtime, v))
+                    if stamp_f[v] == gen_f and (best is None or newtime + dist_f[v] < best):
+                        best = newtime + dist_f[v]
+                        meet = v
+
+        self.settled = settled
+        self.meeting_node = meet
+        return best
+
+    def path_to(self, target):
+        """拼接最近一次查询的路径：正向前驱链到交汇点 + 反向前驱链到终点"""
+        path = self.forward.path_to(self.meeting_node)
+        v = self.backward.previous[self.meeting_node]
+        while v != -1:
+            path.append(v)
+            v = self.backward.previous[v]
+        return path
+
+
+class AStarSearch(IndexedDijkstra):
+    """A* 搜索：启发函数 = 到终点的直线距离 / 全网最大速度
+
+    任何一条边的耗时都不小于 "两端直线距离 / 最大速度"，所以启发函数是一致的
+    下界，结果仍然是精确最短时间。图中没有坐标、或有边经过缺少坐标的站点时
+    (max_speed 为 inf) 退化为普通 Dijkstra。
+    子类可以重写 make_estimate() 换用其他下界（例如 Landmarks.py 的 ALT）。
+    """
+
+    def __init__(self, graph):
+        super().__init__(graph)
+        self.heuristic = array('d', [0.0]) * len(graph)
+
+    def make_estimate(self, source, target):
+        """返回 estimate(v) -> 从 v 到 target 耗时的下界；无法估计时返回 None"""
+        graph = self.graph
+        lat, lon, max_speed = graph.lat, graph.lon, graph.max_speed
+        if lat is None or not max_speed or math.isinf(max_speed) or math.isnan(lat[target]):
+            return None
+
+        isnan = math.isnan
+        target_lat, target_lon = lat[target], lon[target]
+        # 略微放大速度，抵消浮点误差，保证启发函数不超过真实耗时
+        speed = max_speed * (1 + 1e-9)
+
+        def estimate(v):
+            if isnan(lat[v]) or isnan(lon[v]):
+                return 0.0
+            return haversine(lat[v], lon[v], target_lat, target_lon) / speed
+
+        return estimate
+
+    def search(self, source, target):
+        estimate = self.make_estimate(source, target)
+        if estimate is None:
+            return super().search(source, target)
+
+        graph = self.graph
+        generation = self._next_generation()
+        distance, previous, stamp, heuristic = self.distance, self.previous, self.stamp, self.heuristic
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        distance[source] = 0
+        previous[source] = -1
+        stamp[source] = generation
+        heuristic[source] = estimate(source)
+        settled = 0
+        pq = [(heuristic[source], 0, source)]
+        while pq:
+            _, current_distance, u = heappop(pq)
+            if current_distance > distance[u]:
+                continue
+            settled += 1
+            if u == target:
+                break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                newtime = current_distance + weights[e]
+                if stamp[v] != generation:
+                    stamp[v] = generation
+                    heuristic[v] = estimate(v)
+                elif newtime >= distance[v]:
+                    continue
+                distance[v] = newtime
+                previous[v] = u
+                heappush(pq, (newtime + heuristic[v], newtime, v))
+        self.settled = settled
+
+        if stamp[target] != generation:
+            return None
+        return distance[target]
+
+
+# --- 按起点缓存的最短路径树 ---
+# 同一个起点（例如车站的查询终端）的多次查询共享一棵最短路径树：
+# 终点已经出队时只需沿前驱回溯；还没出队时从上次暂停的堆继续搜索，而不是从头开始。
+
+# 最多缓存的起点数（按最近最少使用淘汰）
+SPT_CACHE_SIZE = 64
+
+_UNREACHED = 0x7FFFFFFFFFFFFFFF
+
+
+class ResumableSearch:
+    """可以暂停和继续的单源 Dijkstra，保存完整的距离 / 前驱数组和未处理完的堆"""
+
+    def __init__(self, graph, source):
+        n = len(graph)
+        self.graph = graph
+        self.source = source
+        self.distance = array('q', [_UNREACHED]) * n
+        self.previous = array('i', [-1]) * n
+        self.done = bytearray(n)
+        self.distance[source] = 0
+        self.pq = [(0, source)]
+        self.lock = threading.Lock()
+
+    def settle(self, target):
+        """继续搜索直到 target 出队或整个连通范围搜索完，返回本次出队的节点数"""
+        done = self.done
+        if done[target]:
+            return 0
+        distance, previous, pq = self.distance, self.previous, self.pq
+        offsets, targets, weights = self.graph.offsets, self.graph.targets, self.graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+        settled = 0
+        while pq:
+            current_distance, u = heappop(pq)
+            if done[u]:
+                continue
+            done[u] = 1
+            settled += 1
+            # 暂停前先松弛 u 的出边，继续搜索时堆的状态与一直搜索下去相同
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                newtime = current_distance + weights[e]
+                if newtime < distance[v]:
+                    distance[v] = newtime
+                    previous[v] = u
+                    heappush(pq, (newtime, v))
+            if u == target:
+                break
+        return settled
+
+    def distance_to(self, v):
+        """v 已出队时返回最短时间，否则返回 None"""
+        return self.distance[v] if self.done[v] else None
+
+    def path_to(self, target):
+        path = []
+        v = target
+        while v != -1:
+            path.append(v)
+            v = self.previous[v]
+        path.reverse()
+        return path
+
+
+class SearchTreeCache:
+    """一张图上按起点缓存的 ResumableSearch（LRU），图被修改后整个清空"""
+
+    def __init__(self, graph, size=SPT_CACHE_SIZE):
+        self.graph = graph
+        self.size = size
+        self.version = graph.version
+        self.trees = OrderedDict()
+        self.hits = 0       # 终点已在树中，直接回溯路径
+        self.resumed = 0    # 起点已缓存，继续之前暂停的搜索
+        self.misses = 0     # 新的起点，从头搜索
+        self.lock = threading.Lock()
+
+    def _tree(self, source):
+        """返回 (source 的搜索树, 是否已缓存)"""
+        with self.lock:
+            if self.version != self.graph.version:
+                self.trees.clear()
+                self.version = self.graph.version
+            tree = self.trees.get(source)
+            if tree is not None:
+                self.trees.move_to_end(source)
+                return tree, True
+            tree = self.trees[source] = ResumableSearch(self.graph, source)
+            while len(self.trees) > self.size:
+                self.trees.popitem(last=False)
+            return tree, False
+
+    def search(self, source, target):
+        """返回 (最短时间, 整数下标路径, 本次出队节点数, 'hit' / 'resume' / 'miss')"""
+        tree, cached = self._tree(source)
+        with tree.lock:
+            settled = tree.settle(target)
+            total_time = tree.distance_to(target)
+            path = tree.path_to(target) if total_time is not None else None
+        status = 'miss' if not cached else ('resume' if settled else 'hit')
+        with self.lock:
+            if status == 'hit':
+                self.hits += 1
+            elif status == 'resume':
+                self.resumed += 1
+            else:
+                self.misses += 1
+        return total_time, path, settled, status
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.resumed + self.misses
+            return {
+                'entries': len(self.trees),
+                'size': self.size,
+                'hits': self.hits,
+                'resumed': self.resumed,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None,
+                'reuse_rate': (self.hits + self.resumed) / total if total else None,
+            }
+
+
+_tree_caches = weakref.WeakKeyDictionary()
+_tree_caches_lock = threading.Lock()
+
+
+def get_tree_cache(graph):
+    """返回该图的最短路径树缓存（每张图一个，所有线程共享）"""
+    with _tree_caches_lock:
+        cache = _tree_caches.get(graph)
+        if cache is None:
+            cache = _tree_caches[graph] = SearchTreeCache(graph)
+        return cache
+
+
+def cached_dijkstra(graph, start_node, end_node, stats=None):
+    """使用按起点缓存的最短路径树查询；stats['cache'] 为 'hit' / 'resume' / 'miss'"""
+    total_time, path, settled, status = get_tree_cache(graph).search(
+        graph.index[start_node], graph.index[end_node])
+    if stats is not None:
+        stats['settled'] = settled
+        stats['cache'] = status
+    if total_time is None:
+        return None, None
+    return total_time, [graph.stop_ids[i] for i in path]
+
+
+def tree_cache_stats(graph):
+    """最短路径树缓存的命中统计（没有使用过时各计数为 0）"""
+    return get_tree_cache(graph).stats()
+
+
+_thread_local = threading.local()
+
+
+def get_kernel(graph, kernel_class=IndexedDijkstra):
+    """返回当前线程在该图上的内核实例（按线程、按图、按内核类型缓存）
+
+    图被修改 (graph.version 改变) 后重新创建，内核中根据旧边构建的结构随之丢弃。
+    """
+    kernels = getattr(_thread_local, 'kernels', None)
+    if kernels is None:
+        kernels = _thread_local.kernels = weakref.WeakKeyDictionary()
+    version, graph_kernels = kernels.get(graph, (None, None))
+    if version != graph.version:
+        graph_kernels = {}
+        kernels[graph] = (graph.version, graph_kernels)
+    kernel = graph_kernels.get(kernel_class)
+    if kernel is None:
+        kernel = graph_kernels[kernel_class] = kernel_class(graph)
+    return kernel
+
+
+def run_kernel(graph, start_node, end_node, kernel_class, stats=None):
+    """在整数下标内核上查询，返回 (总时间, stop_id 路径) 或 (None, None)"""
+    source = graph.index[start_node]
+    target = graph.index[end_node]
+    kernel = get_kernel(graph, kernel_class)
+    total_time = kernel.search(source, target)
+    if stats is not None:
+        stats['settled'] = kernel.settled
+    if total_time is None:
+        return None, None
+    return total_time, [graph.stop_ids[i] for i in kernel.path_to(target)]
+
+
+def dijkstra_indexed(graph, start_node, end_node, stats=None):
+    """与 dijkstra() 结果完全相同，但在 CSRGraph 的整数下标上运行"""
+    return run_kernel(graph, start_node, end_node, IndexedDijkstra, stats)
+
+
+def dijkstra_bidirectional(graph, start_node, end_node, stats=None):
+    """双向 Dijkstra 点到点查询"""
+    return run_kernel(graph, start_node, end_node, BidirectionalDijkstra, stats)
+
+
+def astar(graph, start_node, end_node, stats=None):
+    """以地理直线距离为下界的 A* 点到点查询"""
+    return run_kernel(graph, start_node, end_node, AStarSearch, stats)
+
+
+def one_to_many(graph, start_node, end_nodes=None, max_time=None):
+    """一次搜索计算从 start_node 出发的最短时间，返回 {stop_id: 秒}
+
+    end_nodes 为 None 时返回所有可达站点 (一对全部)，否则只返回其中可达的站点，
+    并在它们全部确定后提前结束；max_time 限制最长耗时 (等时圈)。
+    """
+    index = graph.index
+    targets = None if end_nodes is None else [index[stop_id] for stop_id in end_nodes]
+    times = get_kernel(graph).search_many(index[start_node], targets, max_time)
+    stop_ids = graph.stop_ids
+    return {stop_ids[v]: t for v, t in times.items()}
+
+
+# --- 算法选择 ---
+# 各前端 (CLI / Web / GUI) 通过 find_route() 按名称选择算法
+ROUTING_ALGORITHMS = {
+    'array': '数组内核 Dijkstra (默认)',
+    'dict': '经典 Dijkstra (字典实现)',
+    'cached': '数组内核 Dijkstra + 按起点缓存最短路径树',
+    'bidirectional': '双向 Dijkstra',
+    'astar': 'A* (地理距离启发)',
+    'alt': 'ALT (地标 + 三角不等式，需先运行 Landmarks.py)',
+    'ch': '收缩层次 (需先运行 ContractionHierarchy.py)',
+    'matrix': '全站点对矩阵查表 (需先运行 DistanceMatrix.py)',
+}
+DEFAULT_ALGORITHM = 'array'
+
+
+def find_route(graph, start_node, end_node, algorithm=DEFAULT_ALGORITHM, stats=None):
+    """按名称选择算法计算最短路线，返回 (总时间, 路径)，找不到时返回 (None, None)
+
+    传入 stats 字典时，支持的算法会写入 stats['settled']（出队的节点数）。
+    """
+    if algorithm == 'array':
+        return dijkstra_indexed(graph, start_node, end_node, stats)
+    if algorithm == 'dict':
+        return dijkstra(graph, start_node, end_node)
+    if algorithm == 'cached':
+        return cached_dijkstra(graph, start_node, end_node, stats)
+    if algorithm == 'bidirectional':
+        return dijkstra_bidirectional(graph, start_node, end_node, stats)
+    if algorithm == 'astar':
+        return astar(graph, start_node, end_node, stats)
+    if algorithm == 'alt':
+        # 地标表只在第一次使用 ALT 时加载
+        from Landmarks import alt_search
+        return alt_search(graph, start_node, end_node, stats)
+    if algorithm == 'ch':
+        from ContractionHierarchy import ch_search
+        return ch_search(graph, start_node, end_node, stats)
+    if algorithm == 'matrix':
+        from DistanceMatrix import matrix_route
+        return matrix_route(graph, start_node, end_node, stats)
+    raise ValueError(f"未知的算法: {algorithm}")
+
 # --- 主程序逻辑 ---
 def main():
-    graph_filename = 'metro_graph.pkl'
-    
-    print(f"正在从 {graph_filename} 加载地铁网络图...")
+    print("正在加载地铁网络图...")
     try:
-        # 使用 'rb' 模式打开文件, 'r' 代表读取, 'b' 代表二进制
-        with open(graph_filename, 'rb') as f:
-            # 使用 pickle.load 从文件 f 中读取并恢复 graph 对象
-            graph = pickle.load(f)
+        # 优先用 mmap 打开 metro_graph.csr，没有时读取 metro_graph.pkl
+        graph = load_graph()
         print("图加载成功！")
         print(f"总节点数: {len(graph)}")
     except FileNotFoundError:
-        print(f"错误: 找不到图文件 '{graph_filename}'。")
+        print("错误: 找不到图文件 'metro_graph.csr' 或 'metro_graph.pkl'。")
         print("请先运行 Dataprocess.py 来生成该文件。")
         return # 退出程序
 
@@ -62,7 +621,7 @@ def main():
     
     print(f"\n正在计算从 {start_station} 到 {end_station} 的最短路径...")
     
-    total_time, path = dijkstra(graph, start_station, end_station)
+    total_time, path = find_route(graph, start_station, end_station)
     
     # 这里可以添加代码来打印结果
     if total_time is None:
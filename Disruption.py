@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+线路中断与临时调整 - 在已加载的图上原地修改，不需要重新运行 Dataprocess.py
+Incremental graph updates for service disruptions
+
+支持封闭 / 重新开放站点，删除 / 恢复 / 新增边，以及修改或增加某段的耗时。
+修改通过 CSRGraph.set_weights / rebuild_edges 完成（只重建 CSR 数组，O(边数)），
+依赖这张图的结构按 graph.version / modified / shortened 自动失效或继续使用:
+
+    反向图 (reverse / transpose)     修改后丢弃，下次使用时重新构建
+    各线程的搜索内核 (get_kernel)     版本号改变后重新创建
+    A* 速度上限 max_speed            只根据变快的边就地提高
+    地标表 (Landmarks.py)            只升高耗时 / 删除边时下界仍然有效，继续使用；否则停用
+    收缩层次、耗时矩阵               任何修改后停用，查询自动退化为不需要预处理的算法
+
+中断文件为文本格式，每行一条命令，# 之后为注释:
+
+    close_stop   站点ID                  封闭站点（删除所有进出该站的边）
+    reopen_stop  站点ID                  重新开放站点（恢复因封闭该站而删除的边）
+    close_edge   起点ID 终点ID           删除一段边
+    reopen_edge  起点ID 终点ID           恢复 close_edge 删除的边（两端站点仍封闭时等站点重新开放）
+    add_edge     起点ID 终点ID 秒数 [ride|transfer|walk]   新增一段边（如临时接驳）
+    set_time     起点ID 终点ID 秒数      修改一段的耗时
+    delay        起点ID 终点ID 秒数      在原耗时上增加若干秒
+    reset                                撤销所有修改
+
+使用方法:
+    python3 Disruption.py 中断文件 [起点ID 终点ID]
+"""
+
+import sys
+import weakref
+
+from GraphStore import load_graph, EDGE_RIDE, EDGE_TRANSFER, EDGE_WALK
+
+EDGE_KINDS = {'ride': EDGE_RIDE, 'transfer': EDGE_TRANSFER, 'walk': EDGE_WALK}
+
+# 边被关闭的原因: close_edge 单独关闭记为 CLOSED_BY_EDGE，close_stop 记为站点下标
+CLOSED_BY_EDGE = -1
+
+
+class DisruptionState:
+    """一张图上当前生效的中断（用于重新开放时恢复原来的边）"""
+
+    def __init__(self):
+        self.closed_stops = set()
+        # 被删除的边: {(起点下标, 终点下标): [(耗时, 类型), ...]}
+        self.closed_edges = {}
+        # 每对站点被关闭的原因: {(起点下标, 终点下标): {CLOSED_BY_EDGE 或站点下标, ...}}，
+        # 所有原因都撤销后才恢复
+        self.closed_reasons = {}
+        # 自文件中的图以来被修改过的所有 (起点下标, 终点下标)，reset 时用于修复最短路径树
+        self.touched = set()
+
+    def describe(self, graph):
+        stop_ids = graph.stop_ids
+        return {
+            'version': graph.version,
+            'closed_stops': sorted(stop_ids[u] for u in self.closed_stops),
+            'closed_edges': sorted((stop_ids[u], stop_ids[v]) for u, v in self.closed_edges),
+        }
+
+
+_states = weakref.WeakKeyDictionary()
+
+
+def get_state(graph):
+    state = _states.get(graph)
+    if state is None:
+        state = _states[graph] = DisruptionState()
+    return state
+
+
+def _stop(graph, stop_id):
+    if stop_id not in graph.index:
+        raise ValueError(f"未知的站点: {stop_id}")
+    return graph.index[stop_id]
+
+
+def _edges(graph, from_stop, to_stop):
+    u, v = _stop(graph, from_stop), _stop(graph, to_stop)
+    edges = graph.edges_between(u, v)
+    if not edges:
+        raise ValueError(f"{from_stop} 与 {to_stop} 之间没有边")
+    return u, v, edges
+
+
+def _touch(graph, pairs):
+    """记录被修改的 (起点下标, 终点下标)，返回 pairs"""
+    get_state(graph).touched.update(pairs)
+    return pairs
+
+
+def _remove(graph, state, edges, reason):
+    """删除 edges（边下标列表），并连同关闭原因记录下来以便恢复；返回受影响的站点对"""
+    kinds = graph.kinds
+    pairs = []
+    for e in edges:
+        u, v = graph.edge_source(e), graph.targets[e]
+        kind = kinds[e] if kinds is not None else EDGE_RIDE
+        state.closed_edges.setdefault((u, v), []).append((graph.weights[e], kind))
+        state.closed_reasons.setdefault((u, v), set()).add(reason)
+        pairs.append((u, v))
+    if edges:
+        graph.rebuild_edges(removed=edges)
+    return _touch(graph, pairs)
+
+
+def _release(state, pairs, reason):
+    """撤销 pairs 的关闭原因 reason，返回已没有任何关闭原因、可以恢复的站点对"""
+    released = []
+    for pair in pairs:
+        reasons = state.closed_reasons[pair]
+        reasons.discard(reason)
+        if not reasons:
+            released.append(pair)
+    return released
+
+
+def _restore(graph, state, pairs):
+    """恢复 pairs 中被删除的边（调用方保证这些站点对已没有关闭原因）
+
+    恢复的边耗时与删除时相同，不会比那时的图更快，地标下界仍然有效。
+    """
+    added = []
+    for u, v in pairs:
+        del state.closed_reasons[(u, v)]
+        added.extend((u, v, weight, kind) for weight, kind in state.closed_edges.pop((u, v)))
+    if added:
+        graph.rebuild_edges(added=added, shortened=False)
+    return _touch(graph, [(u, v) for u, v, _, _ in added])
+
+
+def close_stop(graph, stop_id):
+    u = _stop(graph, stop_id)
+    state = get_state(graph)
+    state.closed_stops.add(u)
+    # 之前已经关闭的相关边也记上本站这个原因，单独重新开放这些边时不会恢复
+    for pair, reasons in state.closed_reasons.items():
+        if u in pair:
+            reasons.add(u)
+    offsets = graph.offsets
+    rev_offsets, rev_sources, rev_edges = graph.reverse()
+    edges = set(range(offsets[u], offsets[u + 1]))
+    edges.update(rev_edges[k] for k in range(rev_offsets[u], rev_offsets[u + 1]))
+    return _remove(graph, state, sorted(edges), u)
+
+
+def reopen_stop(graph, stop_id):
+    """重新开放站点：只恢复因本站封闭而删除的边，仍被单独关闭或另一端站点仍封闭的边保持删除"""
+    u = _stop(graph, stop_id)
+    state = get_state(graph)
+    state.closed_stops.discard(u)
+    pairs = [pair for pair, reasons in state.closed_reasons.items() if u in reasons]
+    return _restore(graph, state, _release(state, pairs, u))
+
+
+def close_edge(graph, from_stop, to_stop):
+    pair = (_stop(graph, from_stop), _stop(graph, to_stop))
+    state = get_state(graph)
+    if pair in state.closed_reasons:
+        # 已经因站点封闭而删除：只记录单独关闭，站点重新开放后仍保持关闭
+        state.closed_reasons[pair].add(CLOSED_BY_EDGE)
+        return []
+    _, _, edges = _edges(graph, from_stop, to_stop)
+    return _remove(graph, state, edges, CLOSED_BY_EDGE)
+
+
+def reopen_edge(graph, from_stop, to_stop):
+    """撤销 close_edge；两端站点仍封闭时边保持删除，待 reopen_stop 时恢复"""
+    pair = (_stop(graph, from_stop), _stop(graph, to_stop))
+    state = get_state(graph)
+    if CLOSED_BY_EDGE not in state.closed_reasons.get(pair, ()):
+        raise ValueError(f"{from_stop} → {to_stop} 没有被单独关闭")
+    return _restore(graph, state, _release(state, [pair], CLOSED_BY_EDGE))
+
+
+def add_edge(graph, from_stop, to_stop, seconds, kind=EDGE_TRANSFER):
+    u, v = _stop(graph, from_stop), _stop(graph, to_stop)
+    graph.rebuild_edges(added=[(u, v, seconds, kind)])
+    return _touch(graph, [(u, v)])
+
+
+def set_time(graph, from_stop, to_stop, seconds):
+    u, v, edges = _edges(graph, from_stop, to_stop)
+    graph.set_weights({e: seconds for e in edges})
+    return _touch(graph, [(u, v)])
+
+
+def delay(graph, from_stop, to_stop, seconds):
+    u, v, edges = _edges(graph, from_stop, to_stop)
+    graph.set_weights({e: max(0, graph.weights[e] + seconds) for e in edges})
+    return _touch(graph, [(u, v)])
+
+
+def reset(graph):
+    """撤销所有修改，恢复为文件中的图"""
+    state = _states.pop(graph, None)
+    graph.restore()
+    return sorted(state.touched) if state is not None else []
+
+
+def _seconds(text):
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"无效的秒数: {text}") from None
+
+
+# 命令名 -> (参数个数范围, 处理函数)；处理函数返回被修改的 (起点下标, 终点下标) 列表
+COMMANDS = {
+    'close_stop': ((1, 1), lambda g, a: close_stop(g, a[0])),
+    'reopen_stop': ((1, 1), lambda g, a: reopen_stop(g, a[0])),
+    'close_edge': ((2, 2), lambda g, a: close_edge(g, a[0], a[1])),
+    'reopen_edge': ((2, 2), lambda g, a: reopen_edge(g, a[0], a[1])),
+    'add_edge': ((3, 4), lambda g, a: add_edge(g, a[0], a[1], _seconds(a[2]),
+                                               EDGE_KINDS[a[3]] if len(a) > 3 else EDGE_TRANSFER)),
+    'set_time': ((3, 3), lambda g, a: set_time(g, a[0], a[1], _seconds(a[2]))),
+    'delay': ((3, 3), lambda g, a: delay(g, a[0], a[1], _seconds(a[2]))),
+    'reset': ((0, 0), lambda g, a: reset(g)),
+}
+
+
+def parse_disruptions(text):
+    """解析中断文件内容，返回 [(行号, 命令, 参数列表), ...]；格式错误时抛出 ValueError"""
+    commands = []
+    for number, line in enumerate(text.splitlines(), 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        name, args = words[0].lower(), words[1:]
+        if name not in COMMANDS:
+            raise ValueError(f"第 {number} 行: 未知的命令 {name}")
+        low, high = COMMANDS[name][0]
+        if not low <= len(args) <= high:
+            raise ValueError(f"第 {number} 行: {name} 需要 {low}-{high} 个参数")
+        if name == 'add_edge' and len(args) > 3 and args[3] not in EDGE_KINDS:
+            raise ValueError(f"第 {number} 行: 未知的边类型 {args[3]}")
+        commands.append((number, name, args))
+    return commands
+
+
+def apply_disruptions(graph, text, changed=None):
+    """把中断文件内容应用到已加载的图上，返回执行的命令数
+
+    先解析整份文件，有格式错误时不做任何修改；执行中遇到未知站点等错误时抛出 ValueError
+    （之前的命令已经生效）。changed: 可选的列表，追加被修改的 (起点下标, 终点下标)，
+    可交给 DynamicSSSP.repair_trees() 修复已保存的最短路径树。
+    """
+    commands = parse_disruptions(text)
+    for number, name, args in commands:
+        try:
+            pairs = COMMANDS[name][1](graph, args)
+            if changed is not None:
+                changed.extend(pairs)
+        except ValueError as e:
+            raise ValueError(f"第 {number} 行: {e}") from None
+    return len(commands)
+
+
+def load_disruption_file(graph, filename):
+    with open(filename, encoding='utf-8') as f:
+        return apply_disruptions(graph, f.read())
+
+
+def main():
+    if len(sys.argv) not in (2, 4):
+        print("用法: python3 Disruption.py 中断文件 [起点ID 终点ID]")
+        sys.exit(1)
+    from Dijkstra import find_route
+
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    route = sys.argv[2:4]
+    before = find_route(graph, *route) if route else None
+
+    try:
+        count = load_disruption_file(graph, sys.argv[1])
+    except (OSError, ValueError) as e:
+        print(f"错误: {e}")
+        return
+    state = get_state(graph).describe(graph)
+    print(f"已执行 {count} 条命令: 封闭 {len(state['closed_stops'])} 个站点, "
+          f"删除 {len(state['closed_edges'])} 段边, 当前共 {graph.edge_count()} 条边")
+
+    if route:
+        after = find_route(graph, *route)
+        for label, (total_time, path) in (('修改前', before), ('修改后', after)):
+            if total_time is None:
+                print(f"  {label}: 无法到达")
+            else:
+                print(f"  {label}: {total_time // 60}分{total_time % 60}秒, 经过 {len(path)} 站")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+全站点对耗时矩阵预计算
+All-pairs travel-time matrix with next-hop table
+
+离线步骤（在 Dataprocess.py 之后运行一次）:
+    python3 DistanceMatrix.py [进程数]
+
+对每个终点 t 在反向图上做一次完整 Dijkstra，得到所有站点到 t 的最短时间
+以及最短路径树中 "下一站"。按终点分配到多个进程并行计算，结果写入
+metro_matrix.bin（与 metro_graph.csr 相同的 mmap 区段格式）：
+
+    dist[t * n + s]  站点 s 到 t 的最短时间（uint16，放不下时用 uint32）
+    next[t * n + s]  从 s 去 t 的下一站下标
+
+查询耗时只需读一个数组元素；路径沿下一站一路走到终点即可还原。
+同一终点的所有下一站来自同一棵最短路径树，所以路径不会成环。
+
+文件中保存计算时图的指纹 (CSRGraph.fingerprint)；重新运行 Dataprocess.py 后（例如更新了数据源
+或修改了 EDGE_AGGREGATE）即使站点数、边数不变，指纹也不同，矩阵自动停用，需要重新运行本脚本。
+"""
+
+import os
+import sys
+import time
+import weakref
+from array import array
+from multiprocessing import Pool
+
+from GraphStore import load_graph, read_sections, write_sections, GRAPH_CSR, GRAPH_PICKLE
+from Dijkstra import IndexedDijkstra, dijkstra_indexed
+
+MATRIX_FILE = 'metro_matrix.bin'
+
+# 每个任务计算的终点数
+TARGETS_PER_TASK = 64
+
+
+class DistanceMatrix:
+    """全站点对耗时矩阵（按终点分行存储）"""
+
+    def __init__(self, dist, next_hop, node_count, edge_count, fingerprint=None):
+        self.dist = dist
+        self.next_hop = next_hop
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.fingerprint = fingerprint
+        # 各自类型的最大值表示不可达 / 没有下一站
+        self.unreachable = (1 << (8 * dist.itemsize)) - 1
+        self.no_hop = (1 << (8 * next_hop.itemsize)) - 1
+
+    def matches(self, graph):
+        """矩阵是否是为这张图计算的（文件中的图重新生成或被原地修改后需要重新计算）"""
+        return (self.node_count == len(graph) and self.edge_count == graph.edge_count() and not graph.modified
+                and self.fingerprint == graph.fingerprint())
+
+    def duration(self, source, target):
+        """source 到 target 的最短时间（整数下标），不可达时返回 None"""
+        d = self.dist[target * self.node_count + source]
+        return None if d == self.unreachable else d
+
+    def path(self, source, target):
+        """沿下一站表还原路径（整数下标列表），不可达时返回 None"""
+        if self.duration(source, target) is None:
+            return None
+        row = target * self.node_count
+        path = [source]
+        v = source
+        while v != target:
+            v = self.next_hop[row + v]
+            path.append(v)
+        return path
+
+
+# 子进程中的反向图 Dijkstra 内核
+_worker_kernel = None
+
+
+def _targets_worker_init(csr_filename, pickle_filename):
+    """子进程初始化：每个进程 mmap 打开同一个图文件，共享物理内存页"""
+    global _worker_kernel
+    _worker_kernel = IndexedDijkstra(load_graph(csr_filename, pickle_filename).transpose())
+
+
+def _targets_worker(targets):
+    """计算若干个终点的 (终点, 距离列表, 下一站列表)，不可达为 -1"""
+    kernel = _worker_kernel
+    n = len(kernel.graph)
+    result = []
+    for t in targets:
+        kernel.search(t)
+        dist = [-1] * n
+        next_hop = [-1] * n
+        for s in range(n):
+            d = kernel.distance_to(s)
+            if d is not None:
+                dist[s] = d
+                # 反向图中 s 的前驱就是原图中从 s 去 t 的下一站
+                next_hop[s] = kernel.previous[s]
+        result.append((t, dist, next_hop))
+    return result
+
+
+def build_matrix(graph, processes=None, csr_filename=GRAPH_CSR, pickle_filename=GRAPH_PICKLE):
+    """多进程计算全站点对矩阵
+
+    子进程自行从 csr_filename / pickle_filename 加载图，graph 只用于确定规模和指纹。
+    """
+    n = len(graph)
+    chunks = [range(i, min(i + TARGETS_PER_TASK, n)) for i in range(0, n, TARGETS_PER_TASK)]
+
+    columns = [None] * n
+    with Pool(processes, _targets_worker_init, (csr_filename, pickle_filename)) as pool:
+        for part in pool.imap_unordered(_targets_worker, chunks):
+            for t, dist, next_hop in part:
+                columns[t] = (dist, next_hop)
+
+    # 按实际最大值选择最窄的无符号类型，类型最大值留作 "不可达" 标记
+    max_dist = max((d for dist, _ in columns for d in dist), default=0)
+    dist_type = 'H' if max_dist < 0xFFFF else 'I'
+    hop_type = 'H' if n < 0xFFFF else 'I'
+    unreachable = (1 << (8 * array(dist_type).itemsize)) - 1
+    no_hop = (1 << (8 * array(hop_type).itemsize)) - 1
+
+    dist_all = array(dist_type)
+    next_all = array(hop_type)
+    for dist, next_hop in columns:
+        dist_all.extend(unreachable if d < 0 else d for d in dist)
+        next_all.extend(no_hop if h < 0 else h for h in next_hop)
+    return DistanceMatrix(dist_all, next_all, n, graph.edge_count(), graph.fingerprint())
+
+
+def save_matrix(matrix, filename=MATRIX_FILE):
+    write_sections(filename, {
+        'dist': matrix.dist,
+        'next': matrix.next_hop,
+        'shape': array('Q', [matrix.node_count, matrix.edge_count]),
+        'fingerprint': matrix.fingerprint,
+    })
+
+
+def open_matrix(filename=MATRIX_FILE):
+    """用 mmap 打开耗时矩阵文件，文件损坏时抛出 ValueError 或 KeyError"""
+    sections = read_sections(filename)
+    node_count, edge_count = sections['shape']
+    for name in ('dist', 'next'):
+        if len(sections[name]) != node_count * node_count:
+            raise ValueError(f"{filename} 已损坏（{name} 长度不符）")
+    # 没有指纹的旧文件无法确认是为哪张图计算的，视为过期
+    fingerprint = bytes(sections['fingerprint']) if 'fingerprint' in sections else None
+    return DistanceMatrix(sections['dist'], sections['next'], node_count, edge_count, fingerprint)
+
+
+_loaded = weakref.WeakKeyDictionary()
+
+
+def get_matrix(graph, filename=MATRIX_FILE):
+    """第一次使用时加载与该图匹配的耗时矩阵，文件不存在或已过期时返回 None"""
+    if graph not in _loaded:
+        try:
+            matrix = open_matrix(filename)
+        except (OSError, ValueError, KeyError):
+            matrix = None
+        _loaded[graph] = matrix
+    matrix = _loaded[graph]
+    # 图被修改后可能不再匹配，每次都重新检查
+    if matrix is None or not matrix.matches(graph):
+        return None
+    return matrix
+
+
+def matrix_route(graph, start_node, end_node, stats=None):
+    """查表得到最短时间并沿下一站还原路径；没有矩阵文件时退化为数组内核 Dijkstra"""
+    matrix = get_matrix(graph)
+    if matrix is None:
+        return dijkstra_indexed(graph, start_node, end_node, stats)
+    source = graph.index[start_node]
+    target = graph.index[end_node]
+    if stats is not None:
+        stats['settled'] = 0
+    path = matrix.path(source, target)
+    if path is None:
+        return None, None
+    return matrix.duration(source, target), [graph.stop_ids[i] for i in path]
+
+
+def travel_time(graph, start_node, end_node):
+    """只查询最短时间（秒），不可达时返回 None；有矩阵文件时为 O(1)"""
+    matrix = get_matrix(graph)
+    if matrix is None:
+        return dijkstra_indexed(graph, start_node, end_node)[0]
+    return matrix.duration(graph.index[start_node], graph.index[end_node])
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+
+    print("正在加载地铁网络图...")
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    print(f"图加载成功！总节点数: {len(graph)}")
+
+    print(f"\n正在用 {processes} 个进程计算 {len(graph)} x {len(graph)} 耗时矩阵...")
+    start = time.perf_counter()
+    matrix = build_matrix(graph, processes)
+    save_matrix(matrix)
+
+    size_mb = os.path.getsize(MATRIX_FILE) / 1024 / 1024
+    print(f"完成，耗时 {time.perf_counter() - start:.1f} 秒")
+    print(f"距离类型: uint{8 * matrix.dist.itemsize}, 下一站类型: uint{8 * matrix.next_hop.itemsize}")
+    print(f"已保存到: {MATRIX_FILE} ({size_mb:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+最短路径树的动态修复 (Ramalingam-Reps)
+Dynamic single-source shortest paths after edge changes
+
+ShortestPathTree 保存一次完整单源搜索的结果（各站点的最短时间和前驱）。
+某些边的耗时改变（包括删除 = 变为无穷大、新增 = 从无穷大变小）后，
+不需要重新搜索整张图，只修复受影响的部分:
+
+  变慢: 只有以该边为树边的子树可能变长。把子树中的站点作废，
+        从子树外的入边邻居得到候选时间，只在子树内部重新做 Dijkstra；
+        仍有等长替代路线的站点时间不变，修复很快结束。
+  变快: 如果经过该边能更快到达终点，从终点开始向外做 Dijkstra，
+        只扩展时间确实被改进的站点。
+
+多条边同时改变时一起处理：先作废所有变慢的子树，再从所有候选出发做一次传播。
+
+使用方法:
+    python3 DynamicSSSP.py 起点ID 边起点ID 边终点ID 新耗时(秒)
+"""
+
+import heapq
+import sys
+from array import array
+
+from GraphStore import load_graph
+from Dijkstra import IndexedDijkstra
+
+# 不可达的时间
+INF = 0x7FFFFFFFFFFFFFFF
+
+
+class ShortestPathTree:
+    """从 source 出发的最短路径树（整数下标），可在图修改后增量修复"""
+
+    def __init__(self, graph, source):
+        self.graph = graph
+        self.source = source
+        n = len(graph)
+        self.distance = array('q', [INF]) * n
+        self.parent = array('i', [-1]) * n
+        self.version = -1
+        self.settled = 0   # 最近一次构建或修复出队的节点数
+        self.rebuild()
+
+    def rebuild(self):
+        """完整重新搜索（图被 reset 等无法确定改动范围时使用）"""
+        kernel = IndexedDijkstra(self.graph)
+        kernel.search(self.source)
+        distance, parent = self.distance, self.parent
+        for v in range(len(distance)):
+            d = kernel.distance_to(v)
+            distance[v] = INF if d is None else d
+            parent[v] = kernel.previous[v] if d is not None else -1
+        self.settled = kernel.settled
+        self.version = self.graph.version
+
+    def is_current(self):
+        """树是否对应图的当前版本"""
+        return self.version == self.graph.version
+
+    def distance_to(self, v):
+        d = self.distance[v]
+        return None if d == INF else d
+
+    def path_to(self, v):
+        """沿前驱还原 source 到 v 的路径（整数下标列表），不可达时返回 None"""
+        if self.distance[v] == INF:
+            return None
+        path = []
+        while v != -1:
+            path.append(v)
+            v = self.parent[v]
+        path.reverse()
+        return path
+
+    def _edge_weight(self, u, v):
+        """u 到 v 当前最快的一条边的耗时，没有边时返回 INF"""
+        graph = self.graph
+        weights = graph.weights
+        return min((weights[e] for e in graph.edges_between(u, v)), default=INF)
+
+    def _subtree(self, root, affected):
+        """把 root 在树中的子树（经出边找到前驱为自己的站点）加入 affected"""
+        graph = self.graph
+        offsets, targets, parent = graph.offsets, graph.targets, self.parent
+        stack = [root]
+        affected.add(root)
+        while stack:
+            x = stack.pop()
+            for e in range(offsets[x], offsets[x + 1]):
+                y = targets[e]
+                if parent[y] == x and y not in affected:
+                    affected.add(y)
+                    stack.append(y)
+
+    def repair(self, changed):
+        """图中 changed 里的边 [(起点下标, 终点下标), ...] 已被修改，修复最短时间与前驱
+
+        返回修复中出队的节点数。改动范围未知时请调用 rebuild()。
+        """
+        graph = self.graph
+        distance, parent = self.distance, self.parent
+        pq = []
+
+        # 1. 变慢（或被删除）的树边：作废其子树
+        affected = set()
+        changed = set(changed)
+        for u, v in changed:
+            if parent[v] == u and v not in affected and distance[u] + self._edge_weight(u, v) > distance[v]:
+                self._subtree(v, affected)
+        for v in affected:
+            distance[v] = INF
+            parent[v] = -1
+
+        # 2. 子树中的站点从子树外的入边邻居得到候选时间
+        if affected:
+            rev_offsets, rev_sources, rev_edges = graph.reverse()
+            weights = graph.weights
+            for v in affected:
+                best, best_parent = INF, -1
+                for k in range(rev_offsets[v], rev_offsets[v + 1]):
+                    x = rev_sources[k]
+                    if distance[x] != INF and distance[x] + weights[rev_edges[k]] < best:
+                        best, best_parent = distance[x] + weights[rev_edges[k]], x
+                if best < INF:
+                    distance[v] = best
+                    parent[v] = best_parent
+                    pq.append((best, v))
+
+        # 3. 变快（或新增）的边：起点时间已确定时，终点可能得到更短的时间
+        #    （起点在作废的子树中时，由第 4 步传播到它之后再松弛这条边）
+        for u, v in changed:
+            if distance[u] == INF:
+                continue
+            candidate = distance[u] + self._edge_weight(u, v)
+            if candidate < distance[v]:
+                distance[v] = candidate
+                parent[v] = u
+                pq.append((candidate, v))
+
+        # 4. 只在时间被改变的站点之间传播
+        heapq.heapify(pq)
+        offsets, targets, weights = graph.offsets, graph.targets, graph.weights
+        settled = 0
+        while pq:
+            d, x = heapq.heappop(pq)
+            if d > distance[x]:
+                continue
+            settled += 1
+            for e in range(offsets[x], offsets[x + 1]):
+                y = targets[e]
+                nd = d + weights[e]
+                if nd < distance[y]:
+                    distance[y] = nd
+                    parent[y] = x
+                    heapq.heappush(pq, (nd, y))
+        self.settled = settled
+        self.version = graph.version
+        return settled
+
+
+def repair_trees(trees, changed):
+    """修复一组最短路径树；changed 为 None（改动范围未知）时完整重建"""
+    for tree in trees:
+        if changed is None:
+            tree.rebuild()
+        else:
+            tree.repair(changed)
+
+
+def main():
+    if len(sys.argv) != 5:
+        print("用法: python3 DynamicSSSP.py 起点ID 边起点ID 边终点ID 新耗时(秒)")
+        sys.exit(1)
+    source_id, from_id, to_id, seconds = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    for stop_id in (source_id, from_id, to_id):
+        if stop_id not in graph:
+            print(f"错误: 无效的站点ID {stop_id}")
+            return
+    u, v = graph.index[from_id], graph.index[to_id]
+    edges = graph.edges_between(u, v)
+    if not edges:
+        print(f"错误: {from_id} 与 {to_id} 之间没有边")
+        return
+
+    tree = ShortestPathTree(graph, graph.index[source_id])
+    print(f"从 {source_id} 出发的最短路径树: 出队 {tree.settled} 个节点")
+    graph.set_weights({e: seconds for e in edges})
+    settled = tree.repair([(u, v)])
+    print(f"{from_id} → {to_id} 改为 {seconds} 秒后修复: 出队 {settled} 个节点")
+    fresh = ShortestPathTree(graph, tree.source)
+    same = all(tree.distance_to(w) == fresh.distance_to(w) for w in range(len(graph)))
+    print(f"与完整重新搜索 (出队 {fresh.settled} 个节点) 的结果{'一致' if same else '不一致'}")
+
+
+if __name__ == "__main__":
+    main()
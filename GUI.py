@@ -1,7 +1,7 @@
-import pickle
 import tkinter as tk
 from tkinter import ttk, messagebox
-from Dijkstra import dijkstra
+from Dijkstra import find_route, ROUTING_ALGORITHMS, DEFAULT_ALGORITHM
+from GraphStore import load_graph, load_station_names
 import threading
 import sys
 import os
@@ -29,6 +29,7 @@ class MetroRoutePlannerGUI:
         # 初始化图数据
         self.graph = None
         self.station_names = {}  # 存储 stop_id -> stop_name 的映射
+        self.station_list = []   # 排序后的站点显示文本，加载图时构建一次
         
         # 加载数据
         self.load_graph()
@@ -39,24 +40,20 @@ class MetroRoutePlannerGUI:
     def load_graph(self):
         """加载地铁网络图和站点信息"""
         try:
-            with open('metro_graph.pkl', 'rb') as f:
-                self.graph = pickle.load(f)
+            self.graph = load_graph()
             print(f"✓ 图加载成功！总节点数: {len(self.graph)}")
         except FileNotFoundError:
             messagebox.showerror(
                 "错误",
-                "找不到 metro_graph.pkl 文件。\n请先运行 Dataprocess.py 来生成该文件。"
+                "找不到 metro_graph.csr / metro_graph.pkl 文件。\n请先运行 Dataprocess.py 来生成该文件。"
             )
             self.root.destroy()
             return
         
         # 尝试加载站点信息映射
-        try:
-            with open('station_names.pkl', 'rb') as f:
-                self.station_names = pickle.load(f)
-        except FileNotFoundError:
-            # 如果没有站点名称文件，使用站点ID作为显示名称
-            self.station_names = {stop_id: stop_id for stop_id in self.graph.keys()}
+        # 如果没有站点名称文件，使用站点ID作为显示名称
+        self.station_names = load_station_names(self.graph)
+        self.station_list = self.build_station_list()
     
     def create_widgets(self):
         """创建GUI组件"""
@@ -120,12 +117,27 @@ class MetroRoutePlannerGUI:
         self.end_combo.grid(row=1, column=1, sticky=tk.EW, padx=(10, 0), pady=(0, 10))
         self.end_combo.bind('<<ComboboxSelected>>', lambda e: self.on_station_selected())
         
+        # 算法选择
+        algorithm_label = ttk.Label(input_frame, text="算法 (Algorithm):", font=("Arial", 11))
+        algorithm_label.grid(row=2, column=0, sticky=tk.W, pady=(0, 10))
+        
+        self.algorithm_var = tk.StringVar(value=ROUTING_ALGORITHMS[DEFAULT_ALGORITHM])
+        self.algorithm_combo = ttk.Combobox(
+            input_frame,
+            textvariable=self.algorithm_var,
+            values=list(ROUTING_ALGORITHMS.values()),
+            state="readonly",
+            width=40,
+            font=("Arial", 10)
+        )
+        self.algorithm_combo.grid(row=2, column=1, sticky=tk.EW, padx=(10, 0), pady=(0, 10))
+        
         # 配置列权重
         input_frame.columnconfigure(1, weight=1)
         
         # 按钮区域
         button_frame = ttk.Frame(input_frame)
-        button_frame.grid(row=2, column=0, columnspan=2, sticky=tk.EW, pady=(10, 0))
+        button_frame.grid(row=3, column=0, columnspan=2, sticky=tk.EW, pady=(10, 0))
         
         self.search_button = ttk.Button(
             button_frame,
@@ -207,7 +219,11 @@ class MetroRoutePlannerGUI:
         info_label.pack(anchor=tk.W)
     
     def get_sorted_stations(self):
-        """获取排序后的所有站点，包含名称显示"""
+        """获取排序后的所有站点，包含名称显示（加载图时已构建）"""
+        return self.station_list
+    
+    def build_station_list(self):
+        """构建排序后的站点显示列表"""
         if not self.graph:
             return []
         
@@ -248,6 +264,8 @@ class MetroRoutePlannerGUI:
             messagebox.showwarning("提示", "起点和终点不能相同")
             return
         
+        algorithm = self.get_selected_algorithm()
+        
         # 在后台线程中运行搜索，避免UI冻结
         self.search_button.config(state=tk.DISABLED)
         self.status_label.config(text="正在计算...", foreground="orange")
@@ -255,11 +273,18 @@ class MetroRoutePlannerGUI:
         
         thread = threading.Thread(
             target=self._perform_search,
-            args=(start, end),
+            args=(start, end, algorithm),
             daemon=True
         )
         thread.start()
     
+    def get_selected_algorithm(self):
+        """从算法下拉框的显示文本找回算法名称"""
+        for name, desc in ROUTING_ALGORITHMS.items():
+            if desc == self.algorithm_var.get():
+                return name
+        return DEFAULT_ALGORITHM
+    
     def extract_station_id(self, display_text):
         """从显示文本中提取站点ID"""
         if not display_text:
@@ -271,10 +296,10 @@ class MetroRoutePlannerGUI:
         
         return display_text.strip()
     
-    def _perform_search(self, start, end):
+    def _perform_search(self, start, end, algorithm):
         """执行路线搜索（在后台线程中）"""
         try:
-            total_time, path = dijkstra(self.graph, start, end)
+            total_time, path = find_route(self.graph, start, end, algorithm)
             
             # 在主线程中更新UI
             self.root.after(0, self._display_results, total_time, path, start, end)
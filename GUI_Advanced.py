@@ -3,10 +3,11 @@ NYC Metro Route Planner - Advanced GUI Version
 高级版本，包含更多功能和更好的用户体验
 """
 
-import pickle
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from Dijkstra import dijkstra
+from Dijkstra import find_route, ROUTING_ALGORITHMS, DEFAULT_ALGORITHM
+from GraphStore import load_graph, load_station_names
+from StationIndex import StationIndex
 import threading
 from datetime import datetime
 import csv
@@ -22,6 +23,12 @@ class MetroRoutePlannerAdvanced:
         # 数据
         self.graph = None
         self.station_names = {}
+        self.station_index = None
+        # 站点显示列表及其查找表，每次加载图时构建一次（见 build_station_list）
+        self.station_list = []
+        self.station_keys = []
+        self.display_to_id = {}
+        self.id_to_display = {}
         self.search_history = []
         
         # 加载数据
@@ -54,22 +61,19 @@ class MetroRoutePlannerAdvanced:
     def load_graph(self):
         """加载图数据"""
         try:
-            with open('metro_graph.pkl', 'rb') as f:
-                self.graph = pickle.load(f)
+            self.graph = load_graph()
             print(f"✓ Graph loaded: {len(self.graph)} stations")
         except FileNotFoundError:
-            messagebox.showerror("Error", "metro_graph.pkl not found.\nPlease run Dataprocess.py first.")
+            messagebox.showerror("Error", "metro_graph.csr / metro_graph.pkl not found.\nPlease run Dataprocess.py first.")
             self.root.destroy()
             return
         
-        try:
-            with open('station_names.pkl', 'rb') as f:
-                self.station_names = pickle.load(f)
-        except FileNotFoundError:
-            self.station_names = {sid: sid for sid in self.graph.keys()}
+        self.station_names = load_station_names(self.graph)
+        self.station_index = StationIndex(self.graph.keys(), self.station_names)
+        self.build_station_list()
     
-    def get_sorted_stations(self):
-        """获取排序的站点列表"""
+    def build_station_list(self):
+        """构建排序后的站点显示列表、小写搜索键和 ID / 显示文本的对照表"""
         stations = []
         for stop_id in sorted(self.graph.keys()):
             name = self.station_names.get(stop_id, stop_id)
@@ -78,7 +82,18 @@ class MetroRoutePlannerAdvanced:
             else:
                 display = stop_id
             stations.append((display, stop_id))
-        return stations
+        self.station_list = stations
+        self.station_keys = [display.lower() for display, _ in stations]
+        self.display_to_id = dict(stations)
+        self.id_to_display = {sid: display for display, sid in stations}
+    
+    def station_displays(self):
+        """所有站点的显示文本（下拉框的候选项）"""
+        return [display for display, _ in self.station_list]
+    
+    def get_sorted_stations(self):
+        """获取排序的站点列表 [(显示文本, 站点ID), ...]（加载图时已构建，不要修改）"""
+        return self.station_list
     
     def create_query_widgets(self):
         """创建主查询界面"""
@@ -103,7 +118,7 @@ class MetroRoutePlannerAdvanced:
         self.start_combo = ttk.Combobox(
             input_frame,
             textvariable=self.start_var,
-            values=[s[0] for s in self.get_sorted_stations()],
+            values=self.station_displays(),
             state="readonly",
             width=50,
             font=("Arial", 10)
@@ -118,13 +133,28 @@ class MetroRoutePlannerAdvanced:
         self.end_combo = ttk.Combobox(
             input_frame,
             textvariable=self.end_var,
-            values=[s[0] for s in self.get_sorted_stations()],
+            values=self.station_displays(),
             state="readonly",
             width=50,
             font=("Arial", 10)
         )
         self.end_combo.grid(row=1, column=1, sticky=tk.EW, padx=10, pady=5)
         
+        # 算法
+        ttk.Label(input_frame, text="算法:", font=("Arial", 11)).grid(
+            row=2, column=0, sticky=tk.W, pady=5
+        )
+        self.algorithm_var = tk.StringVar(value=ROUTING_ALGORITHMS[DEFAULT_ALGORITHM])
+        self.algorithm_combo = ttk.Combobox(
+            input_frame,
+            textvariable=self.algorithm_var,
+            values=list(ROUTING_ALGORITHMS.values()),
+            state="readonly",
+            width=50,
+            font=("Arial", 10)
+        )
+        self.algorithm_combo.grid(row=2, column=1, sticky=tk.EW, padx=10, pady=5)
+        
         input_frame.columnconfigure(1, weight=1)
         
         # 按钮框架
@@ -235,6 +265,8 @@ class MetroRoutePlannerAdvanced:
             font=("Arial", 10)
         )
         search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        # 输入时实时过滤，回车或点击 "搜索" 时按匹配程度排序
+        search_entry.bind('<Return>', lambda e: self.browser_search())
         
         ttk.Button(
             search_frame,
@@ -259,6 +291,7 @@ class MetroRoutePlannerAdvanced:
         
         # 初始化站点列表
         self.refresh_station_list()
+        self.browser_search_var.trace_add('write', self.filter_station_list)
     
     def create_about_widgets(self):
         """创建帮助和关于界面"""
@@ -323,28 +356,30 @@ NYC Metro Route Planner
             return
         
         # 提取站点ID
-        stations = {s[0]: s[1] for s in self.get_sorted_stations()}
-        start = stations.get(start_display)
-        end = stations.get(end_display)
+        start = self.display_to_id.get(start_display)
+        end = self.display_to_id.get(end_display)
         
         if start == end:
             messagebox.showwarning("提示", "起点和终点不能相同")
             return
         
+        algorithms = {desc: name for name, desc in ROUTING_ALGORITHMS.items()}
+        algorithm = algorithms.get(self.algorithm_var.get(), DEFAULT_ALGORITHM)
+        
         self.status_var.set("正在计算...")
         self.root.update()
         
         thread = threading.Thread(
             target=self._perform_search,
-            args=(start, end, start_display, end_display),
+            args=(start, end, start_display, end_display, algorithm),
             daemon=True
         )
         thread.start()
     
-    def _perform_search(self, start, end, start_disp, end_disp):
+    def _perform_search(self, start, end, start_disp, end_disp, algorithm):
         """执行搜索（后台线程）"""
         try:
-            total_time, path = dijkstra(self.graph, start, end)
+            total_time, path = find_route(self.graph, start, end, algorithm)
             self.root.after(0, self._display_results, total_time, path, start_disp, end_disp)
             
             # 添加到历史
@@ -485,21 +520,63 @@ NYC Metro Route Planner
             messagebox.showerror("错误", f"导出失败: {str(e)}")
     
     def refresh_station_list(self):
-        """刷新站点列表"""
+        """刷新站点列表（显示全部站点）"""
         self.browser_listbox.delete(0, tk.END)
-        for display, _ in self.get_sorted_stations():
-            self.browser_listbox.insert(tk.END, display)
+        self.browser_listbox.insert(tk.END, *self.station_displays())
+        # 列表框中每一行对应的 station_list 下标；显示排序 / 容错结果时为 None
+        self.browser_rows = list(range(len(self.station_list)))
+        self.browser_keyword = ''
     
-    def browser_search(self):
-        """在浏览器中搜索站点"""
-        keyword = self.browser_search_var.get().lower()
+    def filter_station_list(self, *args):
+        """输入时实时过滤站点列表（显示文本包含关键词的站点）
+
+        关键词是上一次的延长时，结果一定是当前显示的行的子集：只在这些行中继续筛选，
+        并从列表框中删除不再匹配的行，而不是清空后重新插入。
+        没有任何站点包含关键词时改为显示容错匹配的结果。
+        """
+        keyword = self.browser_search_var.get().strip().lower()
+        keys = self.station_keys
+        if self.browser_rows is not None and keyword.startswith(self.browser_keyword):
+            rows = self.browser_rows
+            keep = [keyword in keys[i] for i in rows]
+            if any(keep):
+                # 从后往前成段删除，前面的行号不受影响
+                end = len(rows)
+                while end > 0:
+                    if keep[end - 1]:
+                        end -= 1
+                        continue
+                    begin = end - 1
+                    while begin > 0 and not keep[begin - 1]:
+                        begin -= 1
+                    self.browser_listbox.delete(begin, end - 1)
+                    end = begin
+                self.browser_rows = [i for i, matched in zip(rows, keep) if matched]
+                self.browser_keyword = keyword
+                return
+            matches = []
+        else:
+            matches = [i for i, key in enumerate(keys) if keyword in key]
         
+        if not matches:
+            self.show_ranked_stations(keyword)
+            return
         self.browser_listbox.delete(0, tk.END)
-        
-        for display, sid in self.get_sorted_stations():
-            if keyword in display.lower():
-                self.browser_listbox.insert(tk.END, display)
-
+        self.browser_listbox.insert(tk.END, *(self.station_list[i][0] for i in matches))
+        self.browser_rows = matches
+        self.browser_keyword = keyword
+    
+    def show_ranked_stations(self, keyword):
+        """用共享的站点索引显示按匹配程度排序的结果（找不到时容错匹配，如 "86 st"、"Rectr"）"""
+        self.browser_listbox.delete(0, tk.END)
+        results = self.station_index.search(keyword, None)
+        self.browser_listbox.insert(tk.END, *(self.id_to_display[sid] for sid in results))
+        self.browser_rows = None
+        self.browser_keyword = keyword
+    
+    def browser_search(self):
+        """在浏览器中搜索站点（按匹配程度排序）"""
+        self.show_ranked_stations(self.browser_search_var.get().strip().lower())
 
 def main():
     root = tk.Tk()
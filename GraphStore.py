@@ -0,0 +1,472 @@
+"""
+地铁网络图的存储与加载 - 所有前端共用
+Graph storage and loading shared by every front end
+
+图以 CSR (Compressed Sparse Row) 格式保存在 metro_graph.csr 中：
+站点按 stop_id 排序后编号为 0..n-1，站点 i 的出边是
+targets[offsets[i]:offsets[i+1]] 和 weights[offsets[i]:offsets[i+1]]。
+文件通过 mmap 只读映射，打开几乎不花时间，多个进程共享同一份物理内存页。
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+from array import array
+from bisect import bisect_right
+from collections import defaultdict
+
+GRAPH_PICKLE = 'metro_graph.pkl'
+GRAPH_CSR = 'metro_graph.csr'
+STATION_NAMES = 'station_names.pkl'
+
+# 文件头: 魔数 + 区段数量；随后是区段目录，每项为 名称/类型码/偏移/元素个数
+_MAGIC = b'MRPCSR\x00\x01'
+_HEADER = struct.Struct('<8sI4x')
+_SECTION = struct.Struct('<16sc7xQQ')
+# 只使用在各平台上大小固定的类型码
+_ITEM_SIZES = {'B': 1, 'H': 2, 'i': 4, 'I': 4, 'q': 8, 'Q': 8, 'd': 8}
+
+EARTH_RADIUS_M = 6371008.8
+
+# 边的类型 (CSR 文件中的 kinds 区段)
+EDGE_RIDE = 0       # 乘车: 同一趟车相邻两站
+EDGE_TRANSFER = 1   # 显式换乘: transfers.txt
+EDGE_WALK = 2       # 同一父站下站台之间的步行换乘
+EDGE_KIND_NAMES = {EDGE_RIDE: '乘车', EDGE_TRANSFER: '换乘', EDGE_WALK: '站内步行'}
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """两个经纬度坐标之间的大圆距离（米）"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def write_sections(filename, sections):
+    """把若干个 array.array 区段写入一个可 mmap 的二进制文件
+
+    sections: {名称 (不超过 16 个 ASCII 字符): array.array 或 bytes}，每个区段按 8 字节对齐。
+    """
+    items = []
+    for name, data in sections.items():
+        if isinstance(data, (bytes, bytearray)):
+            data = array('B', data)
+        if len(name.encode('ascii')) > 16:
+            raise ValueError(f"区段名 {name!r} 超过 16 个字符")
+        if data.typecode not in _ITEM_SIZES or data.itemsize != _ITEM_SIZES[data.typecode]:
+            raise ValueError(f"区段 {name!r} 的类型码 {data.typecode!r} 不受支持")
+        items.append((name, data))
+
+    position = _HEADER.size + _SECTION.size * len(items)
+    directory = []
+    for name, data in items:
+        position = (position + 7) // 8 * 8
+        directory.append(_SECTION.pack(name.encode('ascii'), data.typecode.encode('ascii'), position, len(data)))
+        position += len(data) * data.itemsize
+
+    # 先写到同一目录下的临时文件，再整体替换：正在 mmap 旧文件的进程继续使用旧的 inode，
+    # 不会读到写了一半的数组，也不会因文件被截断而收到 SIGBUS。
+    # 临时文件名由 mkstemp 生成，同时写同一个文件的多个进程不会互相覆盖对方的临时文件
+    descriptor, temporary = tempfile.mkstemp(prefix=os.path.basename(filename) + '.',
+                                             suffix='.tmp', dir=os.path.dirname(filename) or '.')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
+            # mkstemp 创建的文件只有属主可读，沿用旧文件的权限（没有旧文件时为 0644）
+            try:
+                mode = os.stat(filename).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            os.chmod(temporary, mode)
+            f.write(_HEADER.pack(_MAGIC, len(items)))
+            for entry in directory:
+                f.write(entry)
+            for (name, data), entry in zip(items, directory):
+                offset = _SECTION.unpack(entry)[2]
+                f.write(b'\x00' * (offset - f.tell()))
+                data.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def read_sections(filename):
+    """以只读 mmap 打开 write_sections 写出的文件，返回 {名称: memoryview}
+
+    memoryview 直接指向映射的文件页，不复制数据。
+    文件被截断或损坏时抛出 ValueError。
+    """
+    with open(filename, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise ValueError(f"{filename} 是空文件") from None
+
+    try:
+        magic, count = _HEADER.unpack_from(mapped, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{filename} 不是有效的图数据文件")
+
+        view = memoryview(mapped)
+        sections = {}
+        for k in range(count):
+            name, typecode, offset, length = _SECTION.unpack_from(mapped, _HEADER.size + k * _SECTION.size)
+            typecode = typecode.decode('ascii')
+            end = offset + length * _ITEM_SIZES[typecode]
+            if end > len(mapped) or offset % 8:
+                raise ValueError(f"{filename} 已损坏（区段超出文件末尾）")
+            sections[name.rstrip(b'\x00').decode('ascii')] = view[offset:end].cast(typecode)
+    except (struct.error, KeyError, UnicodeDecodeError):
+        raise ValueError(f"{filename} 已损坏") from None
+    return sections
+
+
+class CSRGraph:
+    """以整数下标存储的地铁网络图
+
+    同时提供与旧版 dict 邻接表相同的接口 (len / in / keys / graph[stop_id])，
+    因此原来的 dijkstra() 可以直接在它上面运行。
+
+    lat / lon 是每个站点的坐标（缺失为 NaN），max_speed 是全网所有边中
+    "直线距离 / 耗时" 的最大值（米/秒），用作 A* 启发函数的速度上限。
+    没有坐标数据时三者均为 None。
+    kinds[e] 是边 e 的类型 (EDGE_RIDE / EDGE_TRANSFER / EDGE_WALK)，没有类型数据时为 None。
+
+    加载后的图可以原地修改（见 set_weights / rebuild_edges / restore，封站等操作在 Disruption.py）：
+    第一次修改时把 mmap 只读区段复制为可写数组，文件本身不变。
+    version 每次修改加一；modified 表示与文件中的图不同；shortened 表示有修改可能缩短了
+    某些站点间的最短时间（降低权重或新增边）。预计算的结构据此判断是否仍然可用。
+    """
+
+    def __init__(self, stop_ids, offsets, targets, weights, lat=None, lon=None, max_speed=None, kinds=None):
+        self.stop_ids = stop_ids
+        self.index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.lat = lat
+        self.lon = lon
+        self.max_speed = max_speed
+        self.kinds = kinds
+        self._reverse = None
+        self._transpose = None
+        self.version = 0
+        self.modified = False
+        self.shortened = False
+        self.loaded_edge_count = len(targets)
+        self._base = None  # 第一次修改前的 (offsets, targets, weights, kinds, max_speed)
+        self._fingerprint = None
+
+    @classmethod
+    def from_adjacency(cls, graph, coords=None, edge_kinds=None):
+        """从 dict 邻接表 graph[from] = [(to, weight), ...] 构建
+
+        coords: 可选的 {stop_id: (lat, lon)}，用于 A* 启发函数。
+        edge_kinds: 可选的 {from: [每条出边的类型, ...]}，顺序与 graph[from] 一致。
+        """
+        stop_ids = sorted(set(graph) | {to for edges in graph.values() for to, _ in edges})
+        index = {stop_id: i for i, stop_id in enumerate(stop_ids)}
+
+        offsets = array('I', [0])
+        targets = array('I')
+        weights = array('I')
+        kinds = array('B') if edge_kinds is not None else None
+        for stop_id in stop_ids:
+            edges = graph.get(stop_id, ())
+            for to_stop_id, weight in edges:
+                targets.append(index[to_stop_id])
+                weights.append(int(weight))
+            if kinds is not None:
+                kinds.extend(edge_kinds.get(stop_id, [EDGE_RIDE] * len(edges)))
+            offsets.append(len(targets))
+
+        csr = cls(stop_ids, offsets, targets, weights, kinds=kinds)
+        if coords is not None:
+            nan = float('nan')
+            csr.lat = array('d', (coords.get(stop_id, (nan, nan))[0] for stop_id in stop_ids))
+            csr.lon = array('d', (coords.get(stop_id, (nan, nan))[1] for stop_id in stop_ids))
+            csr.max_speed = csr.compute_max_speed()
+        return csr
+
+    def edge_distance(self, e, u):
+        """边 e (起点 u) 两端站点的直线距离（米），坐标缺失时返回 None"""
+        v = self.targets[e]
+        lat, lon = self.lat, self.lon
+        if math.isnan(lat[u]) or math.isnan(lat[v]) or math.isnan(lon[u]) or math.isnan(lon[v]):
+            return None
+        return haversine(lat[u], lon[u], lat[v], lon[v])
+
+    def compute_max_speed(self):
+        """全网最大 "直线距离 / 耗时"（米/秒）
+
+        存在耗时为 0 但两端不在同一位置的边时返回 inf，A* 启发函数随之退化为 0，
+        保证结果仍然是精确最短路径。有边经过缺少坐标的站点时同样返回 inf：
+        经过这类站点的路线不受速度上限约束，直线距离 / 最大速度不再是下界。
+        """
+        best = 0.0
+        for u in range(len(self.stop_ids)):
+            for e in range(self.offsets[u], self.offsets[u + 1]):
+                distance = self.edge_distance(e, u)
+                if distance is None:
+                    return math.inf
+                if distance < 1.0:
+                    continue
+                if self.weights[e] == 0:
+                    return math.inf
+                best = max(best, distance / self.weights[e])
+        return best
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def __contains__(self, stop_id):
+        return stop_id in self.index
+
+    def __iter__(self):
+        return iter(self.stop_ids)
+
+    def keys(self):
+        return self.stop_ids
+
+    def __getitem__(self, stop_id):
+        i = self.index[stop_id]
+        stop_ids, targets, weights = self.stop_ids, self.targets, self.weights
+        return [(stop_ids[targets[e]], weights[e]) for e in range(self.offsets[i], self.offsets[i + 1])]
+
+    def edge_count(self):
+        return len(self.targets)
+
+    def reverse(self):
+        """反向邻接表 (rev_offsets, rev_sources, rev_edges)，只在第一次调用时构建
+
+        节点 v 的入边来自 rev_sources[rev_offsets[v]:rev_offsets[v+1]]，
+        rev_edges 记录对应正向边的下标，权重统一从 weights[rev_edges[k]] 读取。
+        """
+        if self._reverse is None:
+            n = len(self.stop_ids)
+            offsets, targets = self.offsets, self.targets
+
+            rev_offsets = array('I', [0]) * (n + 1)
+            for v in targets:
+                rev_offsets[v + 1] += 1
+            for v in range(n):
+                rev_offsets[v + 1] += rev_offsets[v]
+
+            position = array('I', rev_offsets[:n])
+            rev_sources = array('I', [0]) * len(targets)
+            rev_edges = array('I', [0]) * len(targets)
+            for u in range(n):
+                for e in range(offsets[u], offsets[u + 1]):
+                    k = position[targets[e]]
+                    rev_sources[k] = u
+                    rev_edges[k] = e
+                    position[targets[e]] = k + 1
+
+            self._reverse = (rev_offsets, rev_sources, rev_edges)
+        return self._reverse
+
+    def edge_source(self, e):
+        """边 e 的起点下标"""
+        return bisect_right(self.offsets, e) - 1
+
+    def edges_between(self, u, v):
+        """u 到 v 的所有边的下标"""
+        targets = self.targets
+        return [e for e in range(self.offsets[u], self.offsets[u + 1]) if targets[e] == v]
+
+    def fingerprint(self):
+        """文件中的图（不含之后的修改）的指纹：站点ID、offsets、targets、weights 的哈希 (16 字节)
+
+        预计算文件 (地标、收缩层次、耗时矩阵) 保存计算时的指纹。重新运行 Dataprocess.py 后
+        站点数和边数往往不变而耗时变了，只比较规模无法发现文件已经过期。
+        """
+        if self._fingerprint is None:
+            offsets, targets, weights = (self._base or (self.offsets, self.targets, self.weights))[:3]
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update('\n'.join(map(str, self.stop_ids)).encode('utf-8'))
+            for values in (offsets, targets, weights):
+                # 统一为 uint32，mmap 区段与 pickle 构建的数组得到相同的结果
+                digest.update(len(values).to_bytes(8, 'little'))
+                digest.update(array('I', values).tobytes())
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def _make_writable(self):
+        """第一次修改前保存原始区段，并复制为可写数组"""
+        if self._base is None:
+            self._base = (self.offsets, self.targets, self.weights, self.kinds, self.max_speed)
+            self.offsets = array('I', self.offsets)
+            self.targets = array('I', self.targets)
+            self.weights = array('I', self.weights)
+            if self.kinds is not None:
+                self.kinds = array('B', self.kinds)
+
+    def _changed(self, shortened):
+        """记录一次修改：版本号加一，丢弃根据旧边构建的反向图"""
+        self.version += 1
+        self.modified = True
+        self.shortened = self.shortened or shortened
+        self._reverse = None
+        self._transpose = None
+
+    def _raise_max_speed(self, e, u):
+        """边 e 变快后，A* 的速度上限可能需要提高（只看这一条边，不用重新扫描全网）"""
+        if self.lat is None:
+            return
+        distance = self.edge_distance(e, u)
+        if distance is None:
+            # 连到缺少坐标的站点，启发函数不再可靠（见 compute_max_speed）
+            self.max_speed = math.inf
+        elif distance < 1.0:
+            return
+        elif self.weights[e] == 0:
+            self.max_speed = math.inf
+        else:
+            self.max_speed = max(self.max_speed, distance / self.weights[e])
+
+    def set_weights(self, changes):
+        """修改边的耗时，changes: {边下标: 新耗时}；边的编号不变"""
+        self._make_writable()
+        weights = self.weights
+        shortened = False
+        for e, weight in changes.items():
+            weight = int(weight)
+            faster = weight < weights[e]
+            weights[e] = weight
+            if faster:
+                shortened = True
+                self._raise_max_speed(e, self.edge_source(e))
+        self._changed(shortened)
+
+    def rebuild_edges(self, removed=(), added=(), shortened=None):
+        """删除和新增边后重建 CSR 数组（O(边数)，不需要重新读取 GTFS）
+
+        removed: 要删除的边下标；added: [(起点下标, 终点下标, 耗时, 类型), ...]。
+        shortened: 新增的边是否可能缩短最短时间，默认有新增边即视为可能；
+        恢复之前删除的原有边时传入 False。重建后边的编号会改变。
+        """
+        self._make_writable()
+        removed = set(removed)
+        extra = defaultdict(list)
+        for u, v, weight, kind in added:
+            extra[u].append((v, int(weight), kind))
+
+        offsets, targets, weights, kinds = self.offsets, self.targets, self.weights, self.kinds
+        new_offsets = array('I', [0])
+        new_targets = array('I')
+        new_weights = array('I')
+        new_kinds = array('B') if kinds is not None else None
+        for u in range(len(self.stop_ids)):
+            for e in range(offsets[u], offsets[u + 1]):
+                if e not in removed:
+                    new_targets.append(targets[e])
+                    new_weights.append(weights[e])
+                    if new_kinds is not None:
+                        new_kinds.append(kinds[e])
+            for v, weight, kind in extra.get(u, ()):
+                new_targets.append(v)
+                new_weights.append(weight)
+                if new_kinds is not None:
+                    new_kinds.append(kind)
+            new_offsets.append(len(new_targets))
+
+        self.offsets, self.targets, self.weights, self.kinds = new_offsets, new_targets, new_weights, new_kinds
+        for u in extra:
+            for e in range(new_offsets[u + 1] - len(extra[u]), new_offsets[u + 1]):
+                self._raise_max_speed(e, u)
+        self._changed(bool(added) if shortened is None else shortened)
+
+    def restore(self):
+        """撤销所有修改，恢复为文件中的图"""
+        if self._base is None:
+            return
+        self.offsets, self.targets, self.weights, self.kinds, self.max_speed = self._base
+        self._base = None
+        self._changed(False)
+        self.modified = False
+        self.shortened = False
+
+    def transpose(self):
+        """所有边反向后的图（CSRGraph），用于计算 "各站点到某站点" 的距离，只构建一次"""
+        if self._transpose is None:
+            rev_offsets, rev_sources, rev_edges = self.reverse()
+            weights = self.weights
+            self._transpose = CSRGraph(
+                self.stop_ids, rev_offsets, rev_sources,
+                array('I', (weights[e] for e in rev_edges)),
+                kinds=None if self.kinds is None else array('B', (self.kinds[e] for e in rev_edges)),
+            )
+        return self._transpose
+
+
+def save_csr(graph, filename=GRAPH_CSR, coords=None, edge_kinds=None):
+    """把 dict 邻接表 (或 CSRGraph) 保存为 CSR 二进制文件
+
+    coords: 可选的 {stop_id: (lat, lon)}，会连同最大速度一起写入文件。
+    edge_kinds: 可选的 {from: [每条出边的类型, ...]}（见 CSRGraph.from_adjacency）。
+    """
+    if not isinstance(graph, CSRGraph):
+        graph = CSRGraph.from_adjacency(graph, coords, edge_kinds)
+    sections = {
+        'offsets': graph.offsets,
+        'targets': graph.targets,
+        'weights': graph.weights,
+        'stop_ids': '\n'.join(map(str, graph.stop_ids)).encode('utf-8'),
+    }
+    if graph.lat is not None:
+        sections['lat'] = array('d', graph.lat)
+        sections['lon'] = array('d', graph.lon)
+        sections['max_speed'] = array('d', [graph.max_speed])
+    if graph.kinds is not None:
+        sections['kinds'] = array('B', graph.kinds)
+    write_sections(filename, sections)
+
+
+def open_csr(filename=GRAPH_CSR):
+    """用 mmap 打开 CSR 图文件"""
+    sections = read_sections(filename)
+    stop_ids = bytes(sections['stop_ids']).decode('utf-8').split('\n')
+    graph = CSRGraph(stop_ids, sections['offsets'], sections['targets'], sections['weights'])
+    if 'lat' in sections:
+        graph.lat = sections['lat']
+        graph.lon = sections['lon']
+        graph.max_speed = sections['max_speed'][0]
+        if not math.isinf(graph.max_speed) and any(map(math.isnan, graph.lat)):
+            # 旧版文件的速度上限忽略了缺少坐标的站点，重新计算
+            graph.max_speed = graph.compute_max_speed()
+    if 'kinds' in sections:
+        graph.kinds = sections['kinds']
+    return graph
+
+
+def load_graph(csr_filename=GRAPH_CSR, pickle_filename=GRAPH_PICKLE):
+    """加载地铁网络图：优先 mmap 打开 CSR 文件，没有时回退到 pickle 文件
+
+    两个文件都不存在时抛出 FileNotFoundError。
+    """
+    try:
+        return open_csr(csr_filename)
+    except FileNotFoundError:
+        pass
+    with open(pickle_filename, 'rb') as f:
+        return CSRGraph.from_adjacency(pickle.load(f))
+
+
+def load_station_names(graph, filename=STATION_NAMES):
+    """加载 stop_id -> stop_name 映射，没有名称文件时用站点ID代替"""
+    try:
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {stop_id: stop_id for stop_id in graph.keys()}
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+前 k 条最短路线与备选路线 (Yen 算法)
+K shortest loopless paths and sufficiently different alternatives
+
+Yen 算法: 第 k 条路线由前面某条路线在某个 "偏离站点" (spur) 处改走另一条路得到。
+对已接受路线上的每个偏离站点，屏蔽前缀上的站点以及前缀相同的已接受路线的下一站，
+求偏离站点到终点的最短路，拼成候选路线；每次从候选中取出最短的一条。
+
+偏离路径的计算在整次查询中共享同一棵反向最短路径树（从终点在反向图上做一次完整搜索）:
+  1. 树上的距离 h(v) 在屏蔽站点后仍是到终点的下界，用作 A* 启发函数；
+  2. 搜索到一个 "树上通往终点的路径没有被屏蔽" 的站点就可以停止，剩下的路直接沿树走；
+     偏离站点本身的树路径没有被屏蔽时完全不需要搜索；
+  3. 偏离站点先按 "边权 + 下一站的树距离" 的下界排队，排到候选堆顶时才真正搜索，
+     比第 k 条路线长得多的偏离站点永远不会被搜索。
+再加上 Lawler 的改进（新路线只从它的偏离位置之后开始找偏离站点），
+k=5 的耗时远小于经典 Yen 算法（每个偏离站点一次完整的 Dijkstra）。
+
+备选路线: 依次取最短路线，只保留与已选路线重合的行驶时间不超过一定比例的路线。
+
+使用方法:
+    python3 KShortest.py 起点ID 终点ID [k]
+"""
+
+import heapq
+import sys
+from array import array
+
+from GraphStore import load_graph, load_station_names
+from Dijkstra import IndexedDijkstra, get_kernel
+
+# 默认返回的路线条数
+K_PATHS = 5
+
+# 备选路线: 条数、与已选路线重合时间的最大比例、最多检查的候选路线数
+ALTERNATIVE_COUNT = 3
+MAX_OVERLAP = 0.5
+MAX_CANDIDATES = 30
+
+
+class KShortestPaths(IndexedDijkstra):
+    """Yen 算法内核：偏离路径共享反向最短路径树（一个实例同一时间只能执行一个查询）"""
+
+    def __init__(self, graph):
+        super().__init__(graph)
+        n = len(graph)
+        self.reverse = IndexedDijkstra(graph.transpose())
+        self.to_target = array('q', [-1]) * n   # 反向树: 到终点的最短时间，不可达为 -1
+        self.next_hop = array('i', [-1]) * n    # 反向树: 去终点的下一站
+        # 屏蔽标记与 "树路径未被屏蔽" 的缓存，按偏离站点分代
+        self.blocked = array('I', [0]) * n
+        self.clean_stamp = array('I', [0]) * n
+        self.clean_value = array('B', [0]) * n
+        self.block_generation = 0
+        self.target = -1
+        # 为 True 时按经典 Yen 算法：每个偏离站点立即做一次普通 Dijkstra（供 benchmark.py 对比）
+        self.classic = False
+        self.spur_nodes = 0      # 最近一次查询考虑过的偏离站点数
+        self.spur_searches = 0   # 其中需要搜索的偏离站点数
+        self.spur_reused = 0     # 其中直接沿反向树得到偏离路径的偏离站点数
+
+    def _build_tree(self, target):
+        """在反向图上从终点做一次完整搜索，得到所有站点到终点的最短时间和下一站"""
+        reverse = self.reverse
+        reverse.search(target)
+        to_target, next_hop = self.to_target, self.next_hop
+        for v in range(len(to_target)):
+            d = reverse.distance_to(v)
+            to_target[v] = -1 if d is None else d
+            next_hop[v] = reverse.previous[v] if d is not None else -1
+        self.target = target
+        self.settled = reverse.settled
+
+    def _block(self, nodes):
+        """开始一个新的偏离站点：屏蔽 nodes，清空树路径缓存"""
+        self.block_generation += 1
+        if self.block_generation > 0xFFFFFFFF:
+            self.blocked = array('I', [0]) * len(self.blocked)
+            self.clean_stamp = array('I', [0]) * len(self.clean_stamp)
+            self.block_generation = 1
+        generation, blocked = self.block_generation, self.blocked
+        for v in nodes:
+            blocked[v] = generation
+
+    def _clean(self, v):
+        """v 沿反向树到终点的路径上是否没有被屏蔽的站点"""
+        generation = self.block_generation
+        blocked, clean_stamp, clean_value, next_hop = (
+            self.blocked, self.clean_stamp, self.clean_value, self.next_hop)
+        chain = []
+        while True:
+            if clean_stamp[v] == generation:
+                value = clean_value[v]
+                break
+            if blocked[v] == generation:
+                value = 0
+                break
+            if v == self.target:
+                value = 1
+                break
+            chain.append(v)
+            v = next_hop[v]
+        for u in chain:
+            clean_stamp[u] = generation
+            clean_value[u] = value
+        return value
+
+    def _tree_path(self, v):
+        path = [v]
+        while v != self.target:
+            v = self.next_hop[v]
+            path.append(v)
+        return path
+
+    def _spur_bound(self, spur, banned_next):
+        """偏离站点到终点耗时的下界: min(边权 + 下一站的树距离)，没有可走的边时返回 None"""
+        offsets, targets, weights = self.graph.offsets, self.graph.targets, self.graph.weights
+        blocked, generation, to_target = self.blocked, self.block_generation, self.to_target
+        bound = None
+        for e in range(offsets[spur], offsets[spur + 1]):
+            v = targets[e]
+            if blocked[v] == generation or to_target[v] < 0 or v in banned_next:
+                continue
+            d = weights[e] + to_target[v]
+            if bound is None or d < bound:
+                bound = d
+        return bound
+
+    def _spur(self, spur, banned_next):
+        """偏离站点到终点的最短路 (耗时, 路径, 沿路累计耗时)，不可达时返回 None
+
+        前缀站点（含偏离站点）已由 _block() 屏蔽；banned_next 是偏离站点不能走的下一站。
+        """
+        to_target, next_hop, share_tree = self.to_target, self.next_hop, not self.classic
+        first = next_hop[spur]
+        if share_tree and first >= 0 and first not in banned_next and self._clean(first):
+            # 反向树上的路径没有被屏蔽，不需要搜索
+            self.spur_reused += 1
+            path = self._tree_path(spur)
+            return to_target[spur], path, [to_target[spur] - to_target[v] for v in path]
+
+        self.spur_searches += 1
+        generation = self._next_generation()
+        distance, previous, stamp, blocked = self.distance, self.previous, self.stamp, self.blocked
+        block_generation = self.block_generation
+        offsets, targets, weights = self.graph.offsets, self.graph.targets, self.graph.weights
+        heappush, heappop = heapq.heappush, heapq.heappop
+
+        distance[spur] = 0
+        previous[spur] = -1
+        stamp[spur] = generation
+        settled = 0
+        target = self.target
+        pq = [(to_target[spur] if share_tree else 0, 0, spur)]
+        found = -1
+        while pq:
+            _, g, u = heappop(pq)
+            if g > distance[u]:
+                continue
+            settled += 1
+            if u == target or (share_tree and u != spur and self._clean(u)):
+                # 出队的 f 值最小且 u 之后沿树走的路径可行，所以这就是最短偏离路径
+                found = u
+                break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                if blocked[v] == block_generation or to_target[v] < 0:
+                    continue
+                if u == spur and v in banned_next:
+                    continue
+                newtime = g + weights[e]
+                if stamp[v] != generation:
+                    stamp[v] = generation
+                elif newtime >= distance[v]:
+                    continue
+                distance[v] = newtime
+                previous[v] = u
+                heappush(pq, (newtime + to_target[v] if share_tree else newtime, newtime, v))
+        self.settled += settled
+        if found < 0:
+            return None
+
+        head = []
+        v = found
+        while v != -1:
+            head.append(v)
+            v = previous[v]
+        head.reverse()
+        tail = self._tree_path(found)
+        g = distance[found]
+        costs = [distance[v] for v in head] + [g + to_target[found] - to_target[v] for v in tail[1:]]
+        return g + to_target[found], head + tail[1:], costs
+
+    def _deviate(self, path, costs, i, banned_next):
+        """在 path 的第 i 站偏离，返回 (候选路线, 累计耗时)，没有可行的偏离时返回 None"""
+        self._block(path[:i + 1])
+        spur = self._spur(path[i], banned_next)
+        if spur is None:
+            return None
+        _, spur_path, spur_costs = spur
+        return path[:i] + spur_path, costs[:i] + [costs[i] + c for c in spur_costs]
+
+    def paths(self, source, target):
+        """按耗时从短到长依次产生 (耗时, 节点下标路径, 沿路累计耗时)，路线中没有重复站点
+
+        偏离站点先以下界放入候选堆，只有下界排到堆顶时才真正计算偏离路径：
+        耗时明显更长的偏离站点在取出前 k 条路线之前根本不会被搜索。
+        """
+        self.spur_nodes = self.spur_searches = self.spur_reused = 0
+        self._build_tree(target)
+        if self.to_target[source] < 0:
+            return
+        path = self._tree_path(source)
+        costs = [self.to_target[source] - self.to_target[v] for v in path]
+        accepted = [path]
+        yield costs[-1], path, costs
+
+        # 候选堆: (耗时或下界, 类型, 序号, 内容)；类型 0 为已算出的路线，1 为待计算的偏离站点
+        candidates = []
+        seen = {tuple(path)}
+        sequence = 0
+        deviation = 0
+
+        def push_route(route, i):
+            nonlocal sequence
+            new_path, new_costs = route
+            key = tuple(new_path)
+            if key not in seen:
+                seen.add(key)
+                sequence += 1
+                heapq.heappush(candidates, (new_costs[-1], 0, sequence, (new_path, new_costs, i)))
+
+        while True:
+            for i in range(deviation, len(path) - 1):
+                root = path[:i + 1]
+                banned_next = {p[i + 1] for p in accepted if len(p) > i + 1 and p[:i + 1] == root}
+                self.spur_nodes += 1
+                if self.classic:
+                    route = self._deviate(path, costs, i, banned_next)
+                    if route is not None:
+                        push_route(route, i)
+                    continue
+                self._block(root)
+                bound = self._spur_bound(path[i], banned_next)
+                if bound is not None:
+                    sequence += 1
+                    heapq.heappush(candidates, (costs[i] + bound, 1, sequence, (path, costs, i, banned_next)))
+
+            while candidates:
+                _, kind, _, item = heapq.heappop(candidates)
+                if kind == 0:
+                    path, costs, deviation = item
+                    break
+                spur_path, spur_costs, i, banned_next = item
+                route = self._deviate(spur_path, spur_costs, i, banned_next)
+                if route is not None:
+                    push_route(route, i)
+            else:
+                return
+            accepted.append(path)
+            yield costs[-1], path, costs
+
+
+def _overlap(edges, path, costs):
+    """path 中属于 edges 的路段的总耗时"""
+    return sum(costs[j + 1] - costs[j] for j in range(len(path) - 1) if (path[j], path[j + 1]) in edges)
+
+
+def k_shortest_paths(graph, start_node, end_node, k=K_PATHS, stats=None):
+    """返回前 k 条无环最短路线 [(总时间, stop_id 路径), ...]，按耗时升序
+
+    传入 stats 字典时写入 settled（出队节点总数，含反向树）、spur_nodes（考虑过的偏离站点数）、
+    spur_searches（其中做了搜索的）和 spur_reused（其中直接沿反向树得到的）。
+    """
+    kernel = get_kernel(graph, KShortestPaths)
+    routes = []
+    for total_time, path, _ in kernel.paths(graph.index[start_node], graph.index[end_node]):
+        routes.append((total_time, [graph.stop_ids[i] for i in path]))
+        if len(routes) >= k:
+            break
+    _record_stats(kernel, stats)
+    return routes
+
+
+def alternative_routes(graph, start_node, end_node, count=ALTERNATIVE_COUNT, max_overlap=MAX_OVERLAP,
+                       max_candidates=MAX_CANDIDATES, stats=None):
+    """返回最多 count 条 "足够不同" 的路线 [(总时间, stop_id 路径), ...]
+
+    第一条是最短路线；之后按耗时依次检查前 max_candidates 条最短路线，
+    与每条已选路线重合的行驶时间都不超过自身耗时的 max_overlap 时才选用。
+    """
+    kernel = get_kernel(graph, KShortestPaths)
+    chosen = []  # (总时间, 路径, 路段集合)
+    for examined, (total_time, path, costs) in enumerate(
+            kernel.paths(graph.index[start_node], graph.index[end_node])):
+        if examined >= max_candidates:
+            break
+        if all(_overlap(edges, path, costs) <= max_overlap * total_time for _, _, edges in chosen):
+            chosen.append((total_time, path, set(zip(path, path[1:]))))
+            if len(chosen) >= count:
+                break
+    _record_stats(kernel, stats)
+    return [(total_time, [graph.stop_ids[i] for i in path]) for total_time, path, _ in chosen]
+
+
+def _record_stats(kernel, stats):
+    if stats is not None:
+        stats['settled'] = kernel.settled
+        stats['spur_nodes'] = kernel.spur_nodes
+        stats['spur_searches'] = kernel.spur_searches
+        stats['spur_reused'] = kernel.spur_reused
+
+
+def main():
+    if len(sys.argv) not in (3, 4):
+        print("用法: python3 KShortest.py 起点ID 终点ID [k]")
+        sys.exit(1)
+    start, end = sys.argv[1], sys.argv[2]
+    k = int(sys.argv[3]) if len(sys.argv) == 4 else K_PATHS
+
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    if start not in graph or end not in graph:
+        print("错误: 无效的站点ID")
+        return
+    station_names = load_station_names(graph)
+
+    stats = {}
+    routes = k_shortest_paths(graph, start, end, k, stats)
+    if not routes:
+        print(f"无法从 {start} 到达 {end}。")
+        return
+    print(f"{start} → {end} 前 {len(routes)} 条最短路线 (出队 {stats['settled']} 个节点，"
+          f"{stats['spur_nodes']} 个偏离站点中 {stats['spur_searches']} 个需要搜索，"
+          f"{stats['spur_reused']} 个直接沿反向树):")
+    for total_time, path in routes:
+        print(f"  {total_time // 60}分{total_time % 60}秒, 经过 {len(path)} 站: "
+              + " → ".join(station_names.get(sid, sid) for sid in path))
+
+    alternatives = alternative_routes(graph, start, end)
+    print(f"\n其中足够不同的备选路线 (重合时间不超过 {MAX_OVERLAP:.0%}):")
+    for total_time, path in alternatives:
+        print(f"  {total_time // 60}分{total_time % 60}秒, 经过 {len(path)} 站")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+ALT 预处理与查询 (A*, Landmarks, Triangle inequality)
+Landmark preprocessing and exact goal-directed search
+
+离线步骤（在 Dataprocess.py 之后运行一次）:
+    python3 Landmarks.py
+
+选出 k 个地标站点 L，计算每个站点到地标的正向距离 d(L, v) 和反向距离 d(v, L)，
+保存到 metro_landmarks.bin。查询时由三角不等式得到 v 到终点 t 的下界:
+    d(v, t) >= d(L, t) - d(L, v)
+    d(v, t) >= d(v, L) - d(t, L)
+作为 A* 的启发函数，结果仍然是精确最短路径。
+
+文件中保存计算时图的指纹 (CSRGraph.fingerprint)；重新运行 Dataprocess.py 后指纹不同，
+距离表自动停用（查询退化为普通 A*），需要重新运行本脚本。
+"""
+
+import random
+import weakref
+from array import array
+
+from GraphStore import load_graph, read_sections, write_sections
+from Dijkstra import AStarSearch, get_kernel, run_kernel
+
+LANDMARKS_FILE = 'metro_landmarks.bin'
+
+# 地标数量与选取策略 ('farthest' 最远点 / 'avoid' Goldberg-Harrelson avoid 策略)
+LANDMARK_COUNT = 8
+LANDMARK_STRATEGY = 'avoid'
+# 每次查询只使用对起点下界最大的几个地标
+ACTIVE_LANDMARKS = 4
+
+# 不可达距离的标记值
+UNREACHABLE = 0xFFFFFFFF
+
+
+class LandmarkTable:
+    """k 个地标的距离表: dist_from[i*n + v] = d(L_i, v)，dist_to[i*n + v] = d(v, L_i)"""
+
+    def __init__(self, landmarks, dist_from, dist_to, node_count, edge_count, fingerprint=None):
+        self.landmarks = landmarks
+        self.dist_from = dist_from
+        self.dist_to = dist_to
+        self.node_count = node_count
+        self.edge_count = edge_count
+        self.fingerprint = fingerprint
+
+    def matches(self, graph):
+        """距离表是否是为这张图计算的，并且下界仍然有效
+
+        图被修改后，只要没有降低权重或新增边，所有最短时间只增不减，
+        按原图计算的三角不等式下界仍然成立，距离表可以继续使用。
+        文件中的图本身变了（指纹不同，例如重新运行了 Dataprocess.py）时不再使用。
+        """
+        return (self.node_count == len(graph) and self.edge_count == graph.loaded_edge_count
+                and self.fingerprint == graph.fingerprint() and not graph.shortened)
+
+    def lower_bound(self, i, v, t):
+        """第 i 个地标给出的 d(v, t) 下界"""
+        n = self.node_count
+        bound = 0
+        from_v, from_t = self.dist_from[i * n + v], self.dist_from[i * n + t]
+        if from_v != UNREACHABLE and from_t != UNREACHABLE:
+            bound = from_t - from_v
+        to_v, to_t = self.dist_to[i * n + v], self.dist_to[i * n + t]
+        if to_v != UNREACHABLE and to_t != UNREACHABLE and to_v - to_t > bound:
+            bound = to_v - to_t
+        return bound
+
+
+def _one_to_all(graph, source):
+    """从 source 出发到所有站点的距离数组，不可达为 UNREACHABLE"""
+    kernel = get_kernel(graph)
+    kernel.search(source)
+    result = array('I', [UNREACHABLE]) * len(graph)
+    for v in range(len(graph)):
+        d = kernel.distance_to(v)
+        if d is not None:
+            result[v] = d
+    return result
+
+
+def largest_component(graph):
+    """最大强连通分量的站点列表 (Kosaraju 算法，迭代实现)"""
+    n = len(graph)
+    offsets, targets = graph.offsets, graph.targets
+
+    # 第一遍: 在原图上记录 DFS 完成顺序
+    visited = bytearray(n)
+    finish_order = []
+    for root in range(n):
+        if visited[root]:
+            continue
+        visited[root] = 1
+        stack = [(root, offsets[root])]
+        while stack:
+            u, e = stack[-1]
+            if e < offsets[u + 1]:
+                stack[-1] = (u, e + 1)
+                v = targets[e]
+                if not visited[v]:
+                    visited[v] = 1
+                    stack.append((v, offsets[v]))
+            else:
+                stack.pop()
+                finish_order.append(u)
+
+    # 第二遍: 按完成顺序逆序在反向图上收集分量
+    transpose = graph.transpose()
+    component = array('i', [-1]) * n
+    best = []
+    for root in reversed(finish_order):
+        if component[root] != -1:
+            continue
+        component[root] = root
+        members = [root]
+        for u in members:
+            for e in range(transpose.offsets[u], transpose.offsets[u + 1]):
+                v = transpose.targets[e]
+                if component[v] == -1:
+                    component[v] = root
+                    members.append(v)
+        if len(members) > len(best):
+            best = members
+    return sorted(best)
+
+
+def _farthest_node(dist_rows, candidates):
+    """候选站点中离已选地标最远的一个"""
+    return max(candidates, key=lambda v: min(row[v] for row in dist_rows))
+
+
+def _avoid_node(graph, table_rows, landmarks, candidates, rng):
+    """avoid 策略: 在随机根的最短路径树里，找现有地标下界最差且不含地标的子树，取其叶子"""
+    n = len(graph)
+    root = rng.choice(candidates)
+    kernel = get_kernel(graph)
+    kernel.search(root)
+
+    # weight(v) = 真实距离 - 现有地标给出的下界，越大说明现有地标越照顾不到 v
+    partial = LandmarkTable(landmarks, table_rows[0], table_rows[1], n, graph.edge_count())
+    children = [[] for _ in range(n)]
+    weight = array('q', [0]) * n
+    for v in range(n):
+        d = kernel.distance_to(v)
+        if d is None:
+            continue
+        if v != root:
+            children[kernel.previous[v]].append(v)
+        weight[v] = d - max(partial.lower_bound(i, root, v) for i in range(len(landmarks)))
+
+    # 后序遍历计算子树大小，含有地标的子树大小记为 0
+    is_landmark = set(landmarks)
+    has_landmark = [False] * n
+    size = array('q', [0]) * n
+    order = [root]
+    for v in order:
+        order.extend(children[v])
+    for v in reversed(order):
+        has_landmark[v] = v in is_landmark or any(has_landmark[c] for c in children[v])
+        if not has_landmark[v]:
+            size[v] = weight[v] + sum(size[c] for c in children[v])
+
+    # 根节点的子树总含地标，从根往下沿 size 最大的子节点走到叶子
+    v = root
+    while children[v]:
+        child = max(children[v], key=lambda c: size[c])
+        if size[child] <= 0:
+            break
+        v = child
+    return None if v == root else v
+
+
+def build_landmarks(graph, count=LANDMARK_COUNT, strategy=LANDMARK_STRATEGY, seed=0):
+    """选出地标并计算正反向距离表
+
+    地标只从最大强连通分量中选取：父站这类只有少数换乘边的孤立节点
+    到不了网络的大部分站点，作为地标几乎提供不了下界。
+    """
+    n = len(graph)
+    transpose = graph.transpose()
+    rng = random.Random(seed)
+    candidates = largest_component(graph)
+    count = min(count, len(candidates))
+
+    landmarks = []
+    from_rows, to_rows = [], []
+
+    def add(v):
+        landmarks.append(v)
+        from_rows.append(_one_to_all(graph, v))
+        to_rows.append(_one_to_all(transpose, v))
+
+    # 第一个地标: 离随机起点最远的站点
+    add(_farthest_node([_one_to_all(graph, rng.choice(candidates))], candidates))
+
+    while len(landmarks) < count:
+        candidate = None
+        if strategy == 'avoid':
+            flat_from = array('I', [x for row in from_rows for x in row])
+            flat_to = array('I', [x for row in to_rows for x in row])
+            candidate = _avoid_node(graph, (flat_from, flat_to), landmarks, candidates, rng)
+        elif strategy != 'farthest':
+            raise ValueError(f"未知的地标策略: {strategy}")
+        if candidate is None or candidate in landmarks:
+            candidate = _farthest_node(from_rows + to_rows, candidates)
+        if candidate in landmarks:
+            break
+        add(candidate)
+
+    dist_from = array('I', [x for row in from_rows for x in row])
+    dist_to = array('I', [x for row in to_rows for x in row])
+    return LandmarkTable(array('I', landmarks), dist_from, dist_to, n, graph.edge_count(), graph.fingerprint())
+
+
+def save_landmarks(table, filename=LANDMARKS_FILE):
+    write_sections(filename, {
+        'landmarks': table.landmarks,
+        'dist_from': table.dist_from,
+        'dist_to': table.dist_to,
+        'shape': array('Q', [table.node_count, table.edge_count]),
+        'fingerprint': table.fingerprint,
+    })
+
+
+def open_landmarks(filename=LANDMARKS_FILE):
+    """用 mmap 打开地标距离表，文件损坏时抛出 ValueError 或 KeyError"""
+    sections = read_sections(filename)
+    node_count, edge_count = sections['shape']
+    landmarks = sections['landmarks']
+    for name in ('dist_from', 'dist_to'):
+        if len(sections[name]) != len(landmarks) * node_count:
+            raise ValueError(f"{filename} 已损坏（{name} 长度不符）")
+    # 没有指纹的旧文件无法确认是为哪张图计算的，视为过期
+    fingerprint = bytes(sections['fingerprint']) if 'fingerprint' in sections else None
+    return LandmarkTable(landmarks, sections['dist_from'], sections['dist_to'],
+                         node_count, edge_count, fingerprint)
+
+
+_loaded = weakref.WeakKeyDictionary()
+
+
+def get_landmarks(graph, filename=LANDMARKS_FILE):
+    """第一次使用时加载与该图匹配的地标表，文件不存在、损坏或已过期时返回 None"""
+    if graph not in _loaded:
+        try:
+            table = open_landmarks(filename)
+        except (OSError, ValueError, KeyError):
+            table = None
+        _loaded[graph] = table
+    table = _loaded[graph]
+    # 图被修改后可能不再匹配，每次都重新检查
+    if table is None or not table.matches(graph):
+        return None
+    return table
+
+
+class ALTSearch(AStarSearch):
+    """以地标三角不等式下界为启发函数的 A*；没有地标表时退化为普通 Dijkstra"""
+
+    def make_estimate(self, source, target):
+        table = get_landmarks(self.graph)
+        if table is None:
+            return None
+
+        # 选出对起点下界最大的几个地标参与本次查询
+        active = sorted(range(len(table.landmarks)),
+                        key=lambda i: table.lower_bound(i, source, target),
+                        reverse=True)[:ACTIVE_LANDMARKS]
+        lower_bound = table.lower_bound
+
+        def estimate(v):
+            return max(lower_bound(i, v, target) for i in active)
+
+        return estimate
+
+
+def alt_search(graph, start_node, end_node, stats=None):
+    """ALT 点到点查询"""
+    return run_kernel(graph, start_node, end_node, ALTSearch, stats)
+
+
+def main():
+    print("正在加载地铁网络图...")
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    print(f"图加载成功！总节点数: {len(graph)}")
+
+    print(f"\n正在选取 {LANDMARK_COUNT} 个地标 (策略: {LANDMARK_STRATEGY}) 并计算距离表...")
+    table = build_landmarks(graph)
+    save_landmarks(table)
+
+    print(f"地标: {', '.join(graph.stop_ids[v] for v in table.landmarks)}")
+    print(f"已保存到: {LANDMARKS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+多目标路线查询: 耗时 与 换乘次数
+Multi-criteria Pareto routing (duration vs. transfers)
+
+Dataprocess.py 在 metro_graph.csr 中为每条边记录了类型 (GraphStore.EDGE_RIDE /
+EDGE_TRANSFER / EDGE_WALK)。这里把路径上每条非乘车边（显式换乘或同站台间步行）
+计为一次换乘，求 (耗时, 换乘次数) 的帕累托最优集合: 集合中每条路线都不存在
+另一条路线耗时不更长、换乘也不更多。
+
+标签设定 (label-setting) 搜索: 每个节点可以有多个标签 (耗时, 换乘次数)，
+按 (耗时, 换乘次数) 的字典序出队。由于出队顺序中耗时不减，
+一个标签只有在换乘次数少于该节点所有已确定标签时才不被支配；
+换乘次数不少于终点已确定标签的标签也可以直接丢弃。
+
+使用方法:
+    python3 Pareto.py 起点ID 终点ID [最多换乘次数]
+"""
+
+import heapq
+import sys
+from array import array
+
+from GraphStore import load_graph, load_station_names, EDGE_RIDE
+
+# 最多允许的换乘次数
+MAX_TRANSFERS = 6
+
+
+class ParetoSearch:
+    """在一张带边类型的 CSRGraph 上执行 (耗时, 换乘次数) 帕累托查询"""
+
+    def __init__(self, graph):
+        if graph.kinds is None:
+            raise ValueError("图文件中没有边类型，请重新运行 Dataprocess.py 生成 metro_graph.csr")
+        self.graph = graph
+        self.settled = 0  # 最近一次查询确定的标签数
+
+    def search(self, source, target, max_transfers=MAX_TRANSFERS):
+        """返回按耗时升序的 [(耗时, 换乘次数, 节点下标路径), ...]，不可达时返回空列表"""
+        graph = self.graph
+        offsets, targets, weights, kinds = graph.offsets, graph.targets, graph.weights, graph.kinds
+        n = len(graph)
+        # 每个节点已确定标签中的最少换乘次数
+        best_transfers = array('i', [max_transfers + 1]) * n
+
+        # 标签以平铺列表存储: 所在节点 / 父标签下标
+        label_node = [source]
+        label_parent = [-1]
+        heap = [(0, 0, 0)]  # (耗时, 换乘次数, 标签下标)
+        found = []
+        settled = 0
+        while heap:
+            t, x, label = heapq.heappop(heap)
+            v = label_node[label]
+            if x >= best_transfers[v] or x >= best_transfers[target]:
+                continue
+            best_transfers[v] = x
+            settled += 1
+            if v == target:
+                found.append((t, x, label))
+                continue
+            for e in range(offsets[v], offsets[v + 1]):
+                w = targets[e]
+                x2 = x if kinds[e] == EDGE_RIDE else x + 1
+                if x2 >= best_transfers[w] or x2 >= best_transfers[target]:
+                    continue
+                label_node.append(w)
+                label_parent.append(label)
+                heapq.heappush(heap, (t + weights[e], x2, len(label_node) - 1))
+        self.settled = settled
+
+        routes = []
+        for t, x, label in found:
+            path = []
+            while label >= 0:
+                path.append(label_node[label])
+                label = label_parent[label]
+            path.reverse()
+            routes.append((t, x, path))
+        return routes
+
+
+def pareto_routes(graph, start_node, end_node, max_transfers=MAX_TRANSFERS, stats=None):
+    """返回 start_node 到 end_node 的帕累托最优路线 [(耗时, 换乘次数, stop_id 路径), ...]
+
+    按耗时升序（换乘次数随之递减）排列，第一条就是最短时间路线。
+    图中没有边类型时抛出 ValueError。
+    """
+    search = ParetoSearch(graph)
+    routes = search.search(graph.index[start_node], graph.index[end_node], max_transfers)
+    if stats is not None:
+        stats['settled'] = search.settled
+    stop_ids = graph.stop_ids
+    return [(t, x, [stop_ids[i] for i in path]) for t, x, path in routes]
+
+
+def main():
+    if len(sys.argv) not in (3, 4):
+        print("用法: python3 Pareto.py 起点ID 终点ID [最多换乘次数]")
+        sys.exit(1)
+    start, end = sys.argv[1], sys.argv[2]
+    max_transfers = int(sys.argv[3]) if len(sys.argv) == 4 else MAX_TRANSFERS
+
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    if start not in graph or end not in graph:
+        print("错误: 无效的站点ID")
+        return
+    station_names = load_station_names(graph)
+
+    stats = {}
+    try:
+        routes = pareto_routes(graph, start, end, max_transfers, stats)
+    except ValueError as e:
+        print(f"错误: {e}")
+        return
+    if not routes:
+        print(f"在 {max_transfers} 次换乘以内无法从 {start} 到达 {end}。")
+        return
+    print(f"{start} → {end} 共 {len(routes)} 条帕累托最优路线 (确定 {stats['settled']} 个标签):")
+    for total_time, transfers, path in routes:
+        print(f"  {total_time // 60}分{total_time % 60}秒, 换乘 {transfers} 次, 经过 {len(path)} 站: "
+              f"{station_names.get(path[0], path[0])} → {station_names.get(path[-1], path[-1])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+按出发时间查询最早到达 (RAPTOR: Round-bAsed Public Transit Optimized Router)
+Time-dependent earliest-arrival routing on the real timetable
+
+静态图把每段行驶时间合并成固定权重，忽略了发车间隔和候车时间。
+这里直接使用 Dataprocess.py 生成的时刻表 metro_timetable.bin：
+第 k 轮找出 "乘坐 k 趟车" 能到达各站点的最早时刻 ——
+  1. 扫描经过上一轮被改进站点的所有线路，在每一站上车时选最早赶得上的车次；
+  2. 从本轮被改进的站点步行换乘到相邻站台。
+一轮中没有站点被改进时结束。结果是精确的最早到达时刻，候车时间也计算在内。
+时刻表带有运营日历时只乘坐查询日期当天运行的车次；凌晨出发时也考虑前一运营日
+跨过午夜的车次，取两者中较早的到达。
+
+使用方法:
+    python3 Raptor.py 起点ID 终点ID 出发时间(HH:MM) [日期(YYYY-MM-DD)，默认今天]
+"""
+
+import datetime
+import sys
+from array import array
+
+from Timetable import get_timetable, parse_clock, parse_date, format_clock
+
+# 最多乘坐的车次数（换乘次数 + 1）
+MAX_ROUNDS = 8
+
+# 未到达的时刻
+INF = 0x7FFFFFFF
+
+# 到达标记的类型
+NOT_REACHED, RIDE, WALK = 0, 1, 2
+
+
+class _RoundLabels:
+    """某一轮中每个站点是怎样到达的（用于还原行程）"""
+
+    def __init__(self, n):
+        self.kind = array('B', [NOT_REACHED]) * n
+        self.from_stop = array('i', [-1]) * n
+        self.trip = array('i', [-1]) * n
+        self.board_position = array('i', [-1]) * n
+        self.alight_position = array('i', [-1]) * n
+
+
+class RaptorQuery:
+    """在一份时刻表上执行 RAPTOR 查询"""
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        self.rounds = 0          # 最近一次查询执行的轮数
+        self.routes_scanned = 0  # 最近一次查询扫描的线路数
+
+    def _earliest_trip(self, base, length, trip_count, position, time, first_trip=0, active=None):
+        """线路中在第 position 站出发时刻 >= time 的第一趟运行的车（本线路内的编号），没有时返回 -1
+
+        active: 按全局车次编号的运行标记 (Timetable.active_trips)，None 为全部运行；
+        first_trip 为本线路第一趟车的全局编号。
+        """
+        departure = self.timetable.departure
+        lo, hi = 0, trip_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if departure[base + mid * length + position] < time:
+                lo = mid + 1
+            else:
+                hi = mid
+        if active is not None:
+            # 线路内的车次在每一站都按时间排序，跳过当天不运行的车次后仍是最早赶得上的一趟
+            while lo < trip_count and not active[first_trip + lo]:
+                lo += 1
+        return lo if lo < trip_count else -1
+
+    def search(self, source, target, departure_time, max_rounds=MAX_ROUNDS, active=None):
+        """返回 (最早到达时刻, 行程段列表)，不可达时返回 (None, None)
+
+        source / target 为站点下标，departure_time 为运营日 0 点起的秒数。
+        active: 只乘坐标记为 1 的车次 (Timetable.active_trips)，None 为全部车次。
+        """
+        tt = self.timetable
+        n = len(tt)
+        route_stop_offsets, route_stops = tt.route_stop_offsets, tt.route_stops
+        route_trip_offsets, route_time_offsets = tt.route_trip_offsets, tt.route_time_offsets
+        arrival, departure = tt.arrival, tt.departure
+        stop_route_offsets, stop_routes = tt.stop_route_offsets, tt.stop_routes
+        stop_route_positions = tt.stop_route_positions
+        transfer_offsets, transfer_targets, transfer_times = (
+            tt.transfer_offsets, tt.transfer_targets, tt.transfer_times)
+
+        # best[p]: 任意轮数下到达 p 的最早时刻，用于剪枝
+        best = array('i', [INF]) * n
+        taus = [array('i', [INF]) * n]
+        labels = [_RoundLabels(n)]
+        taus[0][source] = best[source] = departure_time
+        marked = [source]
+
+        def relax_transfers(tau, label, stops):
+            """从 stops 步行换乘到相邻站台，返回新改进的站点"""
+            improved = []
+            for p in stops:
+                for j in range(transfer_offsets[p], transfer_offsets[p + 1]):
+                    q = transfer_targets[j]
+                    t = tau[p] + transfer_times[j]
+                    if t < best[q] and t < best[target]:
+                        tau[q] = best[q] = t
+                        label.kind[q] = WALK
+                        label.from_stop[q] = p
+                        improved.append(q)
+            return improved
+
+        marked += relax_transfers(taus[0], labels[0], [source])
+
+        self.routes_scanned = 0
+        k = 0
+        while marked and k < max_rounds:
+            k += 1
+            previous = taus[k - 1]
+            tau = array('i', previous)
+            label = _RoundLabels(n)
+            taus.append(tau)
+            labels.append(label)
+
+            # 需要扫描的线路，以及从哪个位置开始扫描
+            queue = {}
+            for p in marked:
+                for j in range(stop_route_offsets[p], stop_route_offsets[p + 1]):
+                    r, position = stop_routes[j], stop_route_positions[j]
+                    if position < queue.get(r, INF):
+                        queue[r] = position
+            self.routes_scanned += len(queue)
+
+            ridden = []
+            for r, start in queue.items():
+                first_stop = route_stop_offsets[r]
+                length = route_stop_offsets[r + 1] - first_stop
+                trip_count = route_trip_offsets[r + 1] - route_trip_offsets[r]
+                base = route_time_offsets[r]
+
+                trip = -1  # 当前乘坐的车次（本线路内编号）
+                board_stop = board_position = -1
+                for i in range(start, length):
+                    p = route_stops[first_stop + i]
+                    if trip >= 0:
+                        t = arrival[base + trip * length + i]
+                        if t < best[p] and t < best[target]:
+                            tau[p] = best[p] = t
+                            label.kind[p] = RIDE
+                            label.from_stop[p] = board_stop
+                            label.trip[p] = route_trip_offsets[r] + trip
+                            label.board_position[p] = board_position
+                            label.alight_position[p] = i
+                            ridden.append(p)
+
+                    # 上一轮已经到达 p 时，看能否改乘更早的车次
+                    ready = previous[p]
+                    if ready < INF and (trip < 0 or ready <= departure[base + trip * length + i]):
+                        earlier = self._earliest_trip(base, length, trip if trip >= 0 else trip_count, i, ready,
+                                                      route_trip_offsets[r], active)
+                        if earlier >= 0 and earlier != trip:
+                            trip = earlier
+                            board_stop, board_position = p, i
+
+            marked = ridden + relax_transfers(tau, label, ridden)
+
+        self.rounds = k
+        if best[target] == INF:
+            return None, None
+
+        # 乘车次数最少的那一轮
+        k = next(k for k, tau in enumerate(taus) if tau[target] == best[target])
+        return best[target], self._legs(taus, labels, source, target, k)
+
+    def _legs(self, taus, labels, source, target, k):
+        """从终点沿到达标记回溯，得到按时间顺序的行程段"""
+        tt = self.timetable
+        legs = []
+        p = target
+        while p != source:
+            label = labels[k]
+            kind = label.kind[p]
+            if kind == NOT_REACHED:
+                k -= 1
+                continue
+            q = label.from_stop[p]
+            if kind == WALK:
+                legs.append({
+                    'type': 'walk',
+                    'from': tt.stop_ids[q],
+                    'to': tt.stop_ids[p],
+                    'departure': taus[k][q],
+                    'arrival': taus[k][p],
+                })
+            else:
+                trip = label.trip[p]
+                r = tt.route_of_trip(trip)
+                length = tt.route_stop_offsets[r + 1] - tt.route_stop_offsets[r]
+                base = tt.route_time_offsets[r] + (trip - tt.route_trip_offsets[r]) * length
+                board, alight = label.board_position[p], label.alight_position[p]
+                legs.append({
+                    'type': 'ride',
+                    'trip': tt.trip_ids[trip],
+                    'from': tt.stop_ids[q],
+                    'to': tt.stop_ids[p],
+                    'departure': tt.departure[base + board],
+                    'arrival': tt.arrival[base + alight],
+                    'stops': tt.trip_stops(trip, board, alight),
+                })
+                k -= 1
+            p = q
+        legs.reverse()
+        return legs
+
+
+def shift_legs(legs, offset):
+    """行程段的时刻减去 offset 秒（把前一运营日的 24:30 换算成当天的 00:30）"""
+    if not offset:
+        return legs
+    return [dict(leg, departure=leg['departure'] - offset, arrival=leg['arrival'] - offset) for leg in legs]
+
+
+def journey_path(start_node, legs):
+    """把行程段展开成依次经过的站点列表"""
+    path = [start_node]
+    for leg in legs:
+        stops = leg['stops'] if leg['type'] == 'ride' else [leg['from'], leg['to']]
+        path.extend(stops[1:])
+    return path
+
+
+def earliest_arrival(start_node, end_node, departure_time, max_rounds=MAX_ROUNDS, stats=None, timetable=None,
+                     service_date=None):
+    """从 start_node 在 departure_time（秒）出发，返回 (最早到达时刻, 行程段列表)
+
+    service_date: 运营日 (datetime.date)，只乘坐当天运行的车次；None 为不按日历筛选。
+    凌晨出发时另外在前一运营日的车次中查询 (Timetable.service_days)，返回到达较早的结果。
+    找不到路线时返回 (None, None)。没有时刻表文件时抛出 FileNotFoundError，
+    站点不在时刻表中时抛出 KeyError。
+    """
+    if timetable is None:
+        timetable = get_timetable()
+        if timetable is None:
+            raise FileNotFoundError("找不到时刻表文件 metro_timetable.bin，请先运行 Dataprocess.py")
+    source, target = timetable.index[start_node], timetable.index[end_node]
+    query = RaptorQuery(timetable)
+    result = (None, None)
+    rounds = routes_scanned = 0
+    for active, offset in timetable.service_days(service_date, departure_time):
+        arrival_time, legs = query.search(source, target, departure_time + offset, max_rounds, active)
+        rounds += query.rounds
+        routes_scanned += query.routes_scanned
+        if arrival_time is not None and (result[0] is None or arrival_time - offset < result[0]):
+            result = (arrival_time - offset, shift_legs(legs, offset))
+    if stats is not None:
+        stats['rounds'] = rounds
+        stats['routes_scanned'] = routes_scanned
+    return result
+
+
+def describe_legs(legs, station_names=None):
+    """行程段的文字描述（每段一行），供 CLI 显示"""
+    station_names = station_names or {}
+    lines = []
+    for leg in legs:
+        start = station_names.get(leg['from'], leg['from'])
+        end = station_names.get(leg['to'], leg['to'])
+        if leg['type'] == 'ride':
+            lines.append(f"{format_clock(leg['departure'])} 乘坐 {leg['trip']}: {start} → {end} "
+                         f"(到达 {format_clock(leg['arrival'])}, {len(leg['stops']) - 1} 站)")
+        else:
+            lines.append(f"{format_clock(leg['departure'])} 步行换乘: {start} → {end} "
+                         f"({leg['arrival'] - leg['departure']} 秒)")
+    return lines
+
+
+def main():
+    if len(sys.argv) not in (4, 5):
+        print("用法: python3 Raptor.py 起点ID 终点ID 出发时间(HH:MM) [日期(YYYY-MM-DD)]")
+        sys.exit(1)
+    start, end = sys.argv[1], sys.argv[2]
+    departure_time = parse_clock(sys.argv[3])
+    service_date = parse_date(sys.argv[4]) if len(sys.argv) == 5 else datetime.date.today()
+
+    stats = {}
+    try:
+        arrival_time, legs = earliest_arrival(start, end, departure_time, stats=stats, service_date=service_date)
+    except FileNotFoundError as e:
+        print(f"错误: {e}")
+        return
+    except KeyError as e:
+        print(f"错误: 时刻表中没有站点 {e}")
+        return
+
+    if arrival_time is None:
+        print(f"{format_clock(departure_time)} 之后无法从 {start} 到达 {end}。")
+        return
+    print(f"{service_date} 出发 {format_clock(departure_time)}，最早 {format_clock(arrival_time)} 到达 "
+          f"(用时 {arrival_time - departure_time} 秒，{stats['rounds']} 轮，扫描 {stats['routes_scanned']} 条线路)")
+    for line in describe_legs(legs):
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
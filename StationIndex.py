@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+站点搜索索引 - 按站点ID和站名自动补全
+Station search index for autocomplete (sorted prefix arrays + n-gram inverted index)
+
+加载时只构建一次，之后每次按键的查询不再扫描全部站点:
+
+  前缀数组    站点ID、完整站名、站名中每个单词（小写）排序后的列表，二分查找前缀所在的区间
+  n-gram 索引 站点ID与站名的所有 1~3 字符片段 -> 包含它的站点序号（升序）；
+              3 个字符以内的子串直接取对应的列表，更长的子串在其中最短的 3-gram 列表里逐个确认
+
+结果按匹配程度排序: 完全相同 > 站点ID前缀 > 站名前缀 > 站名中单词的前缀 > 其他位置的子串，
+同一档内按站点ID排序。收集到 limit 个结果后立即停止，查询耗时只与返回的结果数有关。
+
+以上都不足 limit 个结果时，再按单词做容错匹配（"86 st" 找到 "86th St"，"Rectr" 找到 "Rector St"）:
+查询中的每个单词可以是站名中某个单词的前缀，或与它的编辑距离不超过允许值
+（站名单词为 4~6 个字符时允许 1 处错误，7 个字符以上允许 2 处；查询单词至多少一个字符）。候选单词用 SymSpell 删除字典查找:
+构建时为站名中的每个单词生成删除若干字符后的所有字符串，查询时只需生成查询单词的删除串
+并查表，不需要与全部单词逐个计算编辑距离。
+
+使用方法:
+    python3 StationIndex.py 关键词 [结果数]
+"""
+
+import heapq
+import re
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+from GraphStore import load_graph, load_station_names
+
+# 默认返回的结果数
+SEARCH_LIMIT = 100
+
+# n-gram 的最大长度
+NGRAM = 3
+
+# 容错匹配: 允许的最大编辑距离，以及允许 1 / 2 处错误的最短单词长度
+MAX_EDIT_DISTANCE = 2
+TYPO_MIN_LENGTH = (4, 7)
+
+# 容错匹配时每个查询单词最多考虑的候选单词数（按匹配程度、长度排序）
+FUZZY_CANDIDATES = 50
+
+
+def _words(text):
+    return re.findall(r'\w+', text)
+
+
+def _allowed_distance(length):
+    """长度为 length 的单词允许的编辑距离"""
+    return sum(length >= minimum for minimum in TYPO_MIN_LENGTH)
+
+
+def _deletes(word, distance):
+    """word 删除至多 distance 个字符后得到的所有字符串（包括 word 本身）"""
+    result = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:k] + w[k + 1:] for w in frontier for k in range(len(w))}
+        result |= frontier
+    return result
+
+
+def edit_distance(a, b, limit):
+    """a 与 b 的编辑距离（插入、删除、替换、相邻字符交换各算 1），大于 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class StationIndex:
+    """站点ID与站名的搜索索引（只读，可被多个线程同时查询）"""
+
+    def __init__(self, stop_ids, station_names=None):
+        station_names = station_names or {}
+        self.stop_ids = sorted(stop_ids)
+        self.names = [station_names.get(s, s) for s in self.stop_ids]
+
+        ids = [s.lower() for s in self.stop_ids]
+        names = [name.lower() for name in self.names]
+        self._texts = [f"{i}\n{n}" for i, n in zip(ids, names)]
+
+        # 前缀数组: [(小写键, 站点序号), ...]，按键排序
+        self._id_prefix = sorted((key, i) for i, key in enumerate(ids))
+        self._name_prefix = sorted((key, i) for i, key in enumerate(names))
+        self._word_prefix = sorted({(word, i) for i, name in enumerate(names) for word in _words(name)})
+
+        # n-gram 倒排表: 片段 -> 站点序号数组（升序，每个站点只出现一次）
+        grams = {}
+        for i, text in enumerate(self._texts):
+            seen = set()
+            for n in range(1, NGRAM + 1):
+                for k in range(len(text) - n + 1):
+                    seen.add(text[k:k + n])
+            seen.discard('\n')
+            for gram in seen:
+                grams.setdefault(gram, array('I')).append(i)
+        self._grams = grams
+
+        # 容错匹配: 站名中的单词 -> 包含它的站点序号，以及 SymSpell 删除字典 (删除串 -> 单词)
+        self._station_words = [frozenset(_words(name)) for name in names]
+        vocabulary = {}
+        for i, words in enumerate(self._station_words):
+            for word in words:
+                vocabulary.setdefault(word, array('I')).append(i)
+        self._vocabulary = vocabulary
+        self._sorted_words = sorted(vocabulary)
+        deletes = {}
+        for word in vocabulary:
+            for key in _deletes(word, _allowed_distance(len(word))):
+                deletes.setdefault(key, []).append(word)
+        self._deletes = deletes
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    @staticmethod
+    def _prefix_range(keys, prefix, exact=False):
+        """前缀数组中以 prefix 开头（exact 时等于 prefix）的站点序号"""
+        k = bisect_left(keys, (prefix,))
+        while k < len(keys) and (keys[k][0] == prefix if exact else keys[k][0].startswith(prefix)):
+            yield keys[k][1]
+            k += 1
+
+    def _substring(self, query):
+        """站点ID或站名包含 query 的站点序号（升序）"""
+        if len(query) <= NGRAM:
+            yield from self._grams.get(query, ())
+            return
+        # 只需遍历最短的一个 3-gram 列表，逐个确认是否真的包含整个子串
+        shortest = None
+        for k in range(len(query) - NGRAM + 1):
+            posting = self._grams.get(query[k:k + NGRAM])
+            if posting is None:
+                return
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+        texts = self._texts
+        for i in shortest:
+            if query in texts[i]:
+                yield i
+
+    def _matches(self, query):
+        """按排序档次依次产生匹配的站点序号（可能重复）"""
+        yield from self._prefix_range(self._id_prefix, query, exact=True)
+        yield from self._prefix_range(self._name_prefix, query, exact=True)
+        yield from self._prefix_range(self._id_prefix, query)
+        yield from self._prefix_range(self._name_prefix, query)
+        yield from self._prefix_range(self._word_prefix, query)
+        yield from self._substring(query)
+
+    def _word_candidates(self, token):
+        """与查询单词 token 匹配的站名单词 {单词: 代价}：相同 0，前缀 0.5，拼写错误为编辑距离"""
+        candidates = {}
+        words = self._sorted_words
+        k = bisect_left(words, token)
+        while k < len(words) and words[k].startswith(token):
+            candidates[words[k]] = 0 if words[k] == token else 0.5
+            k += 1
+        # 漏输一个字符的单词仍按原长度允许错误（如 "wll" 对 "wall"）；
+        # 删除字典按站名单词的长度生成，所以也不能超过站名单词的允许值
+        distance = _allowed_distance(len(token) + 1)
+        if distance:
+            checked = set(candidates)
+            for key in _deletes(token, distance):
+                for word in self._deletes.get(key, ()):
+                    if word not in checked:
+                        checked.add(word)
+                        limit = min(distance, _allowed_distance(len(word)))
+                        d = edit_distance(token, word, limit)
+                        if d <= limit:
+                            candidates[word] = d
+        best = sorted(candidates.items(), key=lambda item: (item[1], len(item[0]), item[0]))
+        return dict(best[:FUZZY_CANDIDATES])
+
+    def _fuzzy(self, query, limit, typos_only=False):
+        """容错匹配，返回按总代价排序的站点序号
+
+        typos_only: 只有一个单词时不再返回前缀匹配（精确匹配的单词前缀一档已经包含）。
+        """
+        tokens = _words(query)
+        if not tokens:
+            return []
+        per_token = [self._word_candidates(token) for token in tokens]
+        if typos_only and len(tokens) == 1:
+            per_token = [{w: c for w, c in per_token[0].items() if c >= 1}]
+        if not all(per_token):
+            return []
+        # 从候选站点最少的单词开始，其余单词只在这些站点的站名中检查
+        sizes = [sum(len(self._vocabulary[w]) for w in candidates) for candidates in per_token]
+        first = min(range(len(tokens)), key=sizes.__getitem__)
+        others = [candidates for t, candidates in enumerate(per_token) if t != first]
+
+        costs = {}
+        for word, cost in per_token[first].items():
+            for i in self._vocabulary[word]:
+                if cost < costs.get(i, 3):
+                    costs[i] = cost
+        scored = []
+        station_words = self._station_words
+        for i, cost in costs.items():
+            words = station_words[i]
+            for candidates in others:
+                best = min((c for w, c in candidates.items() if w in words), default=None)
+                if best is None:
+                    break
+                cost += best
+            else:
+                scored.append((cost, len(self.names[i]), self.stop_ids[i], i))
+        scored = heapq.nsmallest(limit, scored) if limit is not None else sorted(scored)
+        return [i for _, _, _, i in scored]
+
+    def fuzzy_search(self, query, limit=SEARCH_LIMIT):
+        """只做容错匹配，返回按匹配代价排序的站点ID列表"""
+        return [self.stop_ids[i] for i in self._fuzzy(query.strip().lower(), limit)]
+
+    def search(self, query, limit=SEARCH_LIMIT, fuzzy=True):
+        """返回匹配 query 的站点ID列表（按匹配程度排序），limit 为 None 时返回全部，不大于 0 时返回空列表
+
+        query 为空时按站点ID顺序返回所有站点。fuzzy 为 True 时，精确匹配不足 limit 个
+        （limit 为 None 时为一个都没有）的部分用容错匹配的结果补足。
+        """
+        if limit is not None and limit <= 0:
+            return []
+        query = query.strip().lower()
+        if not query:
+            return self.stop_ids[:limit]
+        result = []
+        seen = set()
+        for i in self._matches(query):
+            if i in seen:
+                continue
+            seen.add(i)
+            result.append(self.stop_ids[i])
+            if limit is not None and len(result) >= limit:
+                return result
+        if fuzzy and (limit is not None or not result):
+            for i in self._fuzzy(query, None if limit is None else limit + len(result), typos_only=True):
+                if i not in seen:
+                    seen.add(i)
+                    result.append(self.stop_ids[i])
+                    if limit is not None and len(result) >= limit:
+                        break
+        return result
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("用法: python3 StationIndex.py 关键词 [结果数]")
+        sys.exit(1)
+    query = sys.argv[1]
+    limit = int(sys.argv[2]) if len(sys.argv) == 3 else 20
+
+    try:
+        graph = load_graph()
+    except FileNotFoundError:
+        print("错误: 找不到图文件，请先运行 Dataprocess.py。")
+        return
+    station_names = load_station_names(graph)
+
+    start = time.perf_counter()
+    index = StationIndex(graph.keys(), station_names)
+    print(f"索引 {len(index)} 个站点用时 {(time.perf_counter() - start) * 1000:.1f} 毫秒")
+
+    start = time.perf_counter()
+    result = index.search(query, limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"“{query}” 的前 {len(result)} 个结果 ({elapsed:.3f} 毫秒):")
+    for stop_id in result:
+        print(f"  {stop_id:10s} {station_names.get(stop_id, stop_id)}")
+
+
+if __name__ == "__main__":
+    main()
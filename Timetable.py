@@ -0,0 +1,200 @@
+"""
+时刻表的存储与加载 - 供按出发时间查询的引擎 (Raptor.py) 使用
+Timetable storage shared by the time-dependent routing engines
+
+Dataprocess.py 把 stop_times.txt 中停靠站序列相同、且互不超车的行程归为一条 "线路"
+(route)，写入 metro_timetable.bin（与 metro_graph.csr 相同的 mmap 区段格式）：
+
+    route_stops[route_stop_offsets[r]:route_stop_offsets[r+1]]   线路 r 依次停靠的站点
+    route_trip_offsets[r] .. route_trip_offsets[r+1]             线路 r 的行程（按出发时间排序）
+    arrival / departure[route_time_offsets[r] + k * 站数 + i]     线路 r 第 k 趟车在第 i 站的时刻
+    stop_routes / stop_route_positions                           经过每个站点的线路及其在线路中的位置
+    transfer_targets / transfer_times                            站点之间的步行换乘
+    conn_*[c]                                                    第 c 个连接（车次相邻两站间的一段行驶），
+                                                                 按出发时刻排序: 出发/到达站点、出发/到达时刻、
+                                                                 车次编号、出发站在线路中的位置
+
+    service_ids / trip_service                                   运营日历 (trips.txt 的 service_id) 名称及每个车次的日历编号
+    cal_weekdays / cal_start / cal_end                           calendar.txt: 每个日历周一至周日是否运行 (位 0-6) 及起止日期
+    cal_exc_service / cal_exc_date / cal_exc_type                calendar_dates.txt: 单日增开 (1) 或停运 (2)
+
+时刻以运营日 0 点起的秒数表示，可以超过 24:00:00（跨午夜的行程属于前一个运营日）。
+日期以 YYYYMMDD 形式的整数存储。没有 trips.txt 时不写入日历区段，所有行程都视为每天运行。
+凌晨的查询同时考虑前一运营日 24:00 以后的车次（见 Timetable.service_days）。
+"""
+
+import datetime
+
+from GraphStore import read_sections, write_sections
+
+TIMETABLE_FILE = 'metro_timetable.bin'
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+class Timetable:
+    """以平铺数组存储的时刻表"""
+
+    def __init__(self, sections):
+        self.stop_ids = bytes(sections['stop_ids']).decode('utf-8').split('\n')
+        self.trip_ids = bytes(sections['trip_ids']).decode('utf-8').split('\n')
+        self.index = {stop_id: i for i, stop_id in enumerate(self.stop_ids)}
+        self.route_stop_offsets = sections['route_stop_offs']
+        self.route_stops = sections['route_stops']
+        self.route_trip_offsets = sections['route_trip_offs']
+        self.route_time_offsets = sections['route_time_offs']
+        self.arrival = sections['arrival']
+        self.departure = sections['departure']
+        self.stop_route_offsets = sections['stop_route_offs']
+        self.stop_routes = sections['stop_routes']
+        self.stop_route_positions = sections['stop_route_pos']
+        self.transfer_offsets = sections['transfer_offsets']
+        self.transfer_targets = sections['transfer_targets']
+        self.transfer_times = sections['transfer_times']
+        self.conn_dep_stop = sections['conn_dep_stop']
+        self.conn_arr_stop = sections['conn_arr_stop']
+        self.conn_dep_time = sections['conn_dep_time']
+        self.conn_arr_time = sections['conn_arr_time']
+        self.conn_trip = sections['conn_trip']
+        self.conn_position = sections['conn_position']
+        # 运营日历（旧版时刻表文件没有这些区段）
+        self.trip_service = sections.get('trip_service')
+        if self.trip_service is not None:
+            self.service_ids = bytes(sections['service_ids']).decode('utf-8').split('\n')
+            self.calendar_weekdays = sections['cal_weekdays']
+            self.calendar_start = sections['cal_start']
+            self.calendar_end = sections['cal_end']
+            self.exception_services = sections['cal_exc_service']
+            self.exception_dates = sections['cal_exc_date']
+            self.exception_types = sections['cal_exc_type']
+        self._active = {}
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def __contains__(self, stop_id):
+        return stop_id in self.index
+
+    def route_count(self):
+        return len(self.route_stop_offsets) - 1
+
+    def trip_count(self):
+        return len(self.trip_ids)
+
+    def connection_count(self):
+        return len(self.conn_dep_time)
+
+    def active_services(self, date):
+        """date (datetime.date) 当天运行的日历: 按日历编号的 bytearray，1 为运行
+
+        最后多出的一项对应 trips.txt 中找不到的车次，视为每天运行。
+        """
+        key = date.year * 10000 + date.month * 100 + date.day
+        weekday = 1 << date.weekday()
+        count = len(self.calendar_weekdays)
+        running = bytearray(count + 1)
+        for s in range(count):
+            if self.calendar_weekdays[s] & weekday and self.calendar_start[s] <= key <= self.calendar_end[s]:
+                running[s] = 1
+        running[-1] = 1
+        for s, exception_date, exception_type in zip(
+                self.exception_services, self.exception_dates, self.exception_types):
+            if exception_date == key:
+                running[s] = 1 if exception_type == 1 else 0
+        return running
+
+    def active_trips(self, date):
+        """date 当天运行的车次: 按车次编号的 bytearray，1 为运行；没有运营日历时返回 None（全部运行）"""
+        if self.trip_service is None or date is None:
+            return None
+        mask = self._active.get(date)
+        if mask is None:
+            running = self.active_services(date)
+            mask = bytearray(running[s] for s in self.trip_service)
+            if len(self._active) >= 8:
+                self._active.clear()
+            self._active[date] = mask
+        return mask
+
+    def service_days(self, date, time):
+        """date 当天 time 时刻出发要查询的运营日: [(车次运行标记, 时刻偏移), ...]
+
+        先是当天（偏移 0）；前一运营日还有 time + 24:00 以后出发的车次时，再加上前一天
+        （偏移 86400，查询时刻加上偏移，结果减去偏移）。date 为 None 时只查询一次，不按日历筛选。
+        """
+        days = [(self.active_trips(date), 0)]
+        if (date is not None and self.connection_count()
+                and time + SECONDS_PER_DAY <= self.conn_dep_time[-1]):
+            days.append((self.active_trips(date - datetime.timedelta(days=1)), SECONDS_PER_DAY))
+        return days
+
+    def route_of_trip(self, trip):
+        """车次所属的线路（在 route_trip_offsets 上二分查找）"""
+        offsets = self.route_trip_offsets
+        lo, hi = 0, len(offsets) - 2
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if offsets[mid] <= trip:
+                lo = mid
+            else:
+                hi = mid - 1
+        return lo
+
+    def trip_stops(self, trip, board_position, alight_position):
+        """车次从第 board_position 站到第 alight_position 站依次经过的 stop_id"""
+        first_stop = self.route_stop_offsets[self.route_of_trip(trip)]
+        return [self.stop_ids[self.route_stops[first_stop + i]]
+                for i in range(board_position, alight_position + 1)]
+
+
+def save_timetable(sections, filename=TIMETABLE_FILE):
+    """sections: Dataprocess.build_timetable() 返回的 {名称: array.array 或 bytes}"""
+    write_sections(filename, sections)
+
+
+def open_timetable(filename=TIMETABLE_FILE):
+    """用 mmap 打开时刻表文件"""
+    return Timetable(read_sections(filename))
+
+
+_loaded = {}
+
+
+def get_timetable(filename=TIMETABLE_FILE):
+    """加载时刻表（同一文件在进程内只打开一次），文件不存在时返回 None"""
+    timetable = _loaded.get(filename)
+    if timetable is None:
+        try:
+            timetable = open_timetable(filename)
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+        _loaded[filename] = timetable
+    return timetable
+
+
+def parse_clock(text):
+    """'HH:MM' 或 'HH:MM:SS' 转为秒，格式错误时抛出 ValueError"""
+    parts = text.strip().split(':')
+    if len(parts) not in (2, 3) or not all(p.isdigit() for p in parts):
+        raise ValueError(f"无效的时间: {text!r} (格式 HH:MM 或 HH:MM:SS)")
+    h, m = int(parts[0]), int(parts[1])
+    s = int(parts[2]) if len(parts) == 3 else 0
+    if m >= 60 or s >= 60:
+        raise ValueError(f"无效的时间: {text!r} (格式 HH:MM 或 HH:MM:SS)")
+    return h * 3600 + m * 60 + s
+
+
+def parse_date(text):
+    """'YYYY-MM-DD' 或 'YYYYMMDD' 转为 datetime.date，格式错误时抛出 ValueError"""
+    digits = text.strip().replace('-', '')
+    try:
+        if len(digits) != 8 or not digits.isdigit():
+            raise ValueError
+        return datetime.date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+    except ValueError:
+        raise ValueError(f"无效的日期: {text!r} (格式 YYYY-MM-DD)") from None
+
+
+def format_clock(seconds):
+    """秒数转为 'HH:MM:SS'（超过 24 点时保留 GTFS 的写法，如 25:10:00）"""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
@@ -5,22 +5,226 @@ Simple Web Interface Version (无需GUI库)
 使用http.server创建简单的Web服务
 """
 
-import pickle
+import datetime
+import gc
 import json
+import os
+import queue
+import signal
+import socket
+import time
 import urllib.parse
+from collections import OrderedDict
+from contextlib import contextmanager
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from Dijkstra import dijkstra
+from Dijkstra import find_route, one_to_many, tree_cache_stats, ROUTING_ALGORITHMS, DEFAULT_ALGORITHM
+from GraphStore import load_graph, load_station_names
+from StationIndex import StationIndex, SEARCH_LIMIT
+from ContractionHierarchy import get_hierarchy
+from DistanceMatrix import get_matrix, travel_time
+from Raptor import earliest_arrival, journey_path
+from ConnectionScan import earliest_arrival_csa, arrival_profile
+from Pareto import pareto_routes
+from KShortest import alternative_routes
+from Disruption import apply_disruptions, get_state
+from Timetable import parse_clock, parse_date, format_clock
 import threading
 import sys
 
 
+# 管理接口的口令（环境变量 METRO_ADMIN_TOKEN）；未设置时只接受本机请求
+ADMIN_TOKEN = os.environ.get('METRO_ADMIN_TOKEN')
+
+# 并发处理请求的工作线程数，以及排队等待的连接上限（超过时直接返回 503）
+WORKER_THREADS = 8
+QUEUE_LIMIT = 64
+
+# 工作进程数（python3 Web.py 进程数）；大于 1 时预先 fork 多个进程共用同一个监听套接字，
+# 路线计算不再受 GIL 限制，可以用满多个 CPU 核心
+WORKER_PROCESSES = 1
+
+# /api/route 结果缓存：最多保存的响应数（0 为不缓存）与有效期（秒）
+ROUTE_CACHE_SIZE = 1024
+ROUTE_CACHE_TTL = 600
+
+# 管理接口请求体（中断文件）的最大字节数，超过时返回 413，不读入内存
+MAX_POST_BYTES = 1024 * 1024
+
+
+class GraphLock:
+    """读写锁：路线查询之间可以并发，修改图（管理接口）时独占"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self):
+        with self._condition:
+            # 有修改在等待时不再放行新的查询，避免修改一直等不到
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def writing(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
+class RouteCache:
+    """路线查询结果的 LRU 缓存，保存序列化后的 JSON 响应
+
+    键中包含图的版本号 (graph.version)：应用中断文件等修改图之后旧结果自然不再命中，
+    随后按最近最少使用被淘汰；换了一张图（重新加载）时整个清空。
+    """
+
+    def __init__(self, size=ROUTE_CACHE_SIZE, ttl=ROUTE_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (查询参数, 图版本) -> (过期时刻, 响应字节)
+        self._graph = None
+        self._lock = threading.Lock()
+
+    def _check_graph(self, graph):
+        if graph is not self._graph:
+            self._entries.clear()
+            self._graph = graph
+
+    def get(self, graph, key):
+        """返回缓存的响应字节，没有或已过期时返回 None"""
+        with self._lock:
+            self._check_graph(graph)
+            key = (key, graph.version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, graph, key, body):
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._check_graph(graph)
+            self._entries[(key, graph.version)] = (time.monotonic() + self.ttl, body)
+            self._entries.move_to_end((key, graph.version))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'size': self.size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else None,
+            }
+
+
+class BoundedThreadingHTTPServer(HTTPServer):
+    """固定数量工作线程的 HTTP 服务器
+
+    主线程只负责接受连接并放入有界队列，由工作线程处理；
+    队列已满时立即返回 503 和 Retry-After，而不是让请求无限排队。
+    一个耗时的路线计算只占用一个工作线程，站点搜索等请求仍可由其他线程处理。
+    """
+
+    def __init__(self, server_address, handler_class, threads=WORKER_THREADS, queue_limit=QUEUE_LIMIT,
+                 listener=None):
+        # 内核的 listen 队列默认只有 5，并发稍高时连接会被丢弃并在 1 秒后重传
+        self.request_queue_size = max(queue_limit, 5)
+        if listener is None:
+            super().__init__(server_address, handler_class)
+        else:
+            # 使用父进程创建好的监听套接字（预 fork 模式）
+            super().__init__(listener.getsockname(), handler_class, bind_and_activate=False)
+            self.socket.close()
+            self.socket = listener
+            self.server_name, self.server_port = self.server_address[:2]
+        self.requests = queue.Queue(queue_limit)
+        self.rejected = 0  # 因队列已满返回 503 的请求数
+        self.workers = [threading.Thread(target=self._work, daemon=True) for _ in range(threads)]
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        try:
+            self.requests.put_nowait((request, client_address))
+        except queue.Full:
+            self.rejected += 1
+            self._reject(request)
+
+    def _reject(self, request):
+        body = json.dumps({'error': '服务器繁忙，请稍后重试'}, ensure_ascii=False).encode('utf-8')
+        try:
+            request.sendall(b'HTTP/1.0 503 Service Unavailable\r\n'
+                            b'Content-Type: application/json; charset=utf-8\r\n'
+                            b'Retry-After: 1\r\n'
+                            b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n'
+                            b'Connection: close\r\n\r\n' + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _work(self):
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+
 class RouteHandler(BaseHTTPRequestHandler):
     # 类变量，所有实例共享
     graph = None
     station_names = {}
+    station_index = None
+    # 有耗时矩阵或收缩层次文件时默认使用 'matrix' / 'ch'，见 main()
+    default_algorithm = DEFAULT_ALGORITHM
+    graph_lock = GraphLock()
+    route_cache = RouteCache()
+    # 多进程模式下每个进程各有一份图，修改只会作用于收到请求的那个进程
+    worker_processes = 1
     
     def do_GET(self):
-        """处理GET请求"""
+        """处理GET请求（查询之间可以并发，与修改图的管理请求互斥）"""
+        with self.graph_lock.reading():
+            self.handle_get()
+    
+    def handle_get(self):
         if self.path == '/':
             self.send_response(200)
             self.send_header('Content-type', 'text/html; charset=utf-8')
@@ -35,11 +239,12 @@ class RouteHandler(BaseHTTPRequestHandler):
             # 获取查询参数
             query = urllib.parse.urlparse(self.path).query
             params = urllib.parse.parse_qs(query)
-            search = params.get('search', [''])[0].lower()
+            search = params.get('search', [''])[0]
+            limit = params.get('limit', [''])[0]
+            limit = min(int(limit), 1000) if limit.isdigit() else SEARCH_LIMIT
             
-            stations = sorted(self.graph.keys())
-            if search:
-                stations = [s for s in stations if search in s.lower()]
+            # 加载时构建的索引，按匹配程度排序（站点ID与站名都参与匹配）
+            stations = self.station_index.search(search, limit)
             
             response = {
                 'stations': [
@@ -47,12 +252,69 @@ class RouteHandler(BaseHTTPRequestHandler):
                         'id': sid,
                         'name': self.station_names.get(sid, sid)
                     }
-                    for sid in stations[:100]  # 限制返回100个
+                    for sid in stations
                 ]
             }
             self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
         
-        elif self.path.startswith('/api/route'):
+        elif self.path.startswith('/api/admin/disruptions'):
+            # 查看当前生效的中断
+            if self.check_admin():
+                self.send_json(get_state(self.graph).describe(self.graph))
+        
+        elif self.path.startswith('/api/algorithms'):
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json; charset=utf-8')
+            self.end_headers()
+            
+            response = {
+                'default': self.default_algorithm,
+                'algorithms': [
+                    {'id': name, 'name': desc}
+                    for name, desc in ROUTING_ALGORITHMS.items()
+                ]
+            }
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        
+        elif self.path.startswith('/api/isochrone'):
+            # /api/isochrone?start=...&max=秒数&targets=ID1,ID2,... (max 和 targets 可选)
+            query = urllib.parse.urlparse(self.path).query
+            params = urllib.parse.parse_qs(query)
+            start = params.get('start', [''])[0].upper()
+            max_time = params.get('max', [''])[0]
+            targets = [t.strip().upper() for t in params.get('targets', [''])[0].split(',') if t.strip()]
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json; charset=utf-8')
+            self.end_headers()
+            
+            if start not in self.graph or any(t not in self.graph for t in targets):
+                response = {'error': '无效的站点ID'}
+            elif max_time and not max_time.isdigit():
+                response = {'error': 'max 必须是非负整数（秒）'}
+            else:
+                # 一次搜索得到所有 (或指定) 站点的最短时间
+                times = one_to_many(self.graph, start, targets or None,
+                                    int(max_time) if max_time else None)
+                response = {
+                    'success': True,
+                    'start': start,
+                    'max': int(max_time) if max_time else None,
+                    'count': len(times),
+                    'stations': [
+                        {
+                            'id': sid,
+                            'name': self.station_names.get(sid, sid),
+                            'duration': duration
+                        }
+                        for sid, duration in sorted(times.items(), key=lambda item: (item[1], item[0]))
+                    ]
+                }
+            
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        
+        elif self.path.startswith('/api/profile'):
+            # /api/profile?start=...&end=...&from=HH:MM&to=HH:MM[&date=YYYY-MM-DD]  一段时间内各时刻出发的最早到达
             query = urllib.parse.urlparse(self.path).query
             params = urllib.parse.parse_qs(query)
             start = params.get('start', [''])[0].upper()
@@ -62,45 +324,320 @@ class RouteHandler(BaseHTTPRequestHandler):
             self.send_header('Content-type', 'application/json; charset=utf-8')
             self.end_headers()
             
-            if not start or not end:
-                response = {'error': '起点和终点不能为空'}
-            elif start == end:
-                response = {'error': '起点和终点不能相同'}
-            elif start not in self.graph or end not in self.graph:
+            try:
+                start_time = parse_clock(params.get('from', [''])[0])
+                end_time = parse_clock(params.get('to', [''])[0])
+                date = params.get('date', [''])[0]
+                service_date = parse_date(date) if date else datetime.date.today()
+                pairs = arrival_profile(start, end, start_time, end_time, service_date=service_date)
+            except ValueError as e:
+                response = {'error': str(e)}
+            except FileNotFoundError as e:
+                response = {'error': str(e)}
+            except KeyError:
                 response = {'error': '无效的站点ID'}
             else:
-                total_time, path = dijkstra(self.graph, start, end)
-                
-                if total_time is None or path is None:
+                response = {
+                    'success': True,
+                    'start': start,
+                    'end': end,
+                    'date': service_date.isoformat(),
+                    'profile': [
+                        {
+                            'departure': format_clock(departure),
+                            'arrival': format_clock(arrival),
+                            'duration': arrival - departure
+                        }
+                        for departure, arrival in pairs
+                    ]
+                }
+            
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+        
+        elif self.path.startswith('/api/duration'):
+            query = urllib.parse.urlparse(self.path).query
+            params = urllib.parse.parse_qs(query)
+            start = params.get('start', [''])[0].upper()
+            end = params.get('end', [''])[0].upper()
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json; charset=utf-8')
+            self.end_headers()
+            
+            if start not in self.graph or end not in self.graph:
+                response = {'error': '无效的站点ID'}
+            else:
+                # 有耗时矩阵时只读一个数组元素
+                total_time = travel_time(self.graph, start, end)
+                if total_time is None:
                     response = {'error': '无法找到路线'}
                 else:
-                    minutes = int(total_time // 60)
-                    seconds = int(total_time % 60)
                     response = {
                         'success': True,
                         'start': start,
                         'end': end,
                         'duration': total_time,
-                        'duration_text': f'{minutes}分{seconds}秒',
-                        'stations': len(path),
-                        'path': [
-                            {
-                                'id': sid,
-                                'name': self.station_names.get(sid, sid),
-                                'order': i + 1
-                            }
-                            for i, sid in enumerate(path)
-                        ]
+                        'duration_text': f'{int(total_time // 60)}分{int(total_time % 60)}秒',
                     }
             
             self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
         
+        elif self.path.startswith('/api/cache'):
+            # 路线结果缓存与最短路径树缓存 (algorithm=cached) 的命中统计
+            response = self.route_cache.stats()
+            response['spt'] = tree_cache_stats(self.graph)
+            self.send_json(response)
+        
+        elif self.path.startswith('/api/route'):
+            query = urllib.parse.urlparse(self.path).query
+            params = urllib.parse.parse_qs(query)
+            options = (
+                params.get('start', [''])[0].upper(),
+                params.get('end', [''])[0].upper(),
+                params.get('algorithm', [''])[0] or self.default_algorithm,
+                params.get('departure', [''])[0],
+                params.get('engine', ['raptor'])[0],
+                params.get('pareto', [''])[0] in ('1', 'true'),
+                params.get('alternatives', ['0'])[0],
+                # 运营日（不填为今天），只乘坐当天运行的车次；写进缓存键，跨天后不会返回前一天的结果
+                params.get('date', [''])[0] or datetime.date.today().isoformat(),
+            )
+            
+            body = self.route_cache.get(self.graph, options)
+            cache_status = 'HIT'
+            if body is None:
+                cache_status = 'MISS'
+                body = json.dumps(self.get_route(*options), ensure_ascii=False).encode('utf-8')
+                self.route_cache.put(self.graph, options, body)
+            
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json; charset=utf-8')
+            self.send_header('X-Cache', cache_status)
+            self.end_headers()
+            self.wfile.write(body)
+        
         else:
             self.send_response(404)
             self.send_header('Content-type', 'text/html; charset=utf-8')
             self.end_headers()
             self.wfile.write(b'<h1>404 - Not Found</h1>')
     
+    def do_POST(self):
+        """处理POST请求: /api/admin/disruptions 应用中断文件（请求体为文件内容）
+
+        例如: curl --data-binary @disruptions.txt http://localhost:8888/api/admin/disruptions
+        """
+        if not self.path.startswith('/api/admin/disruptions'):
+            self.send_response(404)
+            self.send_header('Content-type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(b'<h1>404 - Not Found</h1>')
+            return
+        if not self.check_admin():
+            return
+        if self.worker_processes > 1:
+            self.send_json({'error': '多进程模式下不支持修改图，请以单进程方式启动 Web.py'}, 409)
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            self.send_json({'error': '无效的 Content-Length'}, 400)
+            return
+        if length > MAX_POST_BYTES:
+            # 不读取请求体，处理完后关闭连接
+            self.close_connection = True
+            self.send_json({'error': f'请求体超过 {MAX_POST_BYTES} 字节'}, 413)
+            return
+        try:
+            text = self.rfile.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            self.send_json({'error': '请求体不是有效的 UTF-8 文本'}, 400)
+            return
+        with self.graph_lock.writing():
+            try:
+                count = apply_disruptions(self.graph, text)
+            except ValueError as e:
+                response, status = {'error': str(e)}, 400
+            else:
+                response, status = {'success': True, 'applied': count}, 200
+            response.update(get_state(self.graph).describe(self.graph))
+        self.send_json(response, status)
+    
+    def check_admin(self):
+        """管理接口的权限检查，不通过时直接返回 403"""
+        if ADMIN_TOKEN is not None:
+            allowed = self.headers.get('X-Admin-Token') == ADMIN_TOKEN
+        else:
+            allowed = self.client_address[0] in ('127.0.0.1', '::1')
+        if not allowed:
+            self.send_json({'error': '没有权限'}, 403)
+        return allowed
+    
+    def send_json(self, response, status=200):
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.end_headers()
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8'))
+    
+    def get_route(self, start, end, algorithm, departure, engine, pareto, alternatives, date):
+        """/api/route 的结果（参数已规范化，结果只取决于参数和图的版本，可以缓存）"""
+        if not start or not end:
+            response = {'error': '起点和终点不能为空'}
+        elif start == end:
+            response = {'error': '起点和终点不能相同'}
+        elif start not in self.graph or end not in self.graph:
+            response = {'error': '无效的站点ID'}
+        elif departure:
+            # 指定出发时间时按真实时刻表计算最早到达
+            response = self.get_journey(start, end, departure, engine, date)
+        elif pareto:
+            # 返回 (耗时, 换乘次数) 的帕累托最优路线集合
+            response = self.get_pareto(start, end)
+        elif algorithm not in ROUTING_ALGORITHMS:
+            response = {'error': f'未知的算法: {algorithm}'}
+        elif not alternatives.isdigit():
+            response = {'error': f'无效的备选路线数: {alternatives}'}
+        else:
+            stats = {}
+            total_time, path = find_route(self.graph, start, end, algorithm, stats)
+            
+            if total_time is None or path is None:
+                response = {'error': '无法找到路线'}
+            else:
+                minutes = int(total_time // 60)
+                seconds = int(total_time % 60)
+                response = {
+                    'success': True,
+                    'start': start,
+                    'end': end,
+                    'algorithm': algorithm,
+                    'settled': stats.get('settled'),
+                    'duration': total_time,
+                    'duration_text': f'{minutes}分{seconds}秒',
+                    'stations': len(path),
+                    'path': [
+                        {
+                            'id': sid,
+                            'name': self.station_names.get(sid, sid),
+                            'order': i + 1
+                        }
+                        for i, sid in enumerate(path)
+                    ]
+                }
+                if int(alternatives) > 0:
+                    # 与最短路线足够不同的备选路线（线路中断时可供选择）
+                    routes = alternative_routes(self.graph, start, end, int(alternatives) + 1)
+                    response['alternatives'] = [
+                        {
+                            'duration': alt_time,
+                            'duration_text': f'{alt_time // 60}分{alt_time % 60}秒',
+                            'stations': len(alt_path),
+                            'path': [
+                                {'id': sid, 'name': self.station_names.get(sid, sid)}
+                                for sid in alt_path
+                            ]
+                        }
+                        for alt_time, alt_path in routes[1:]
+                    ]
+        return response
+    
+    def get_journey(self, start, end, departure, engine='raptor', date=''):
+        """/api/route?departure=HH:MM&date=YYYY-MM-DD 的结果：按时刻表计算的最早到达路线
+
+        engine: 'raptor' (Raptor.py) 或 'csa' (ConnectionScan.py)，两者结果相同。
+        date: 运营日，只乘坐当天运行的车次；空字符串为今天。
+        """
+        engines = {'raptor': earliest_arrival, 'csa': earliest_arrival_csa}
+        if engine not in engines:
+            return {'error': f'未知的引擎: {engine}'}
+        try:
+            departure_time = parse_clock(departure)
+            service_date = parse_date(date) if date else datetime.date.today()
+        except ValueError as e:
+            return {'error': str(e)}
+        try:
+            arrival_time, legs = engines[engine](start, end, departure_time, service_date=service_date)
+        except FileNotFoundError as e:
+            return {'error': str(e)}
+        except KeyError:
+            return {'error': '时刻表中没有该站点'}
+        if arrival_time is None:
+            return {'error': f'{service_date} {format_clock(departure_time)} 之后无法找到路线'}
+        
+        total_time = arrival_time - departure_time
+        path = journey_path(start, legs)
+        minutes = int(total_time // 60)
+        seconds = int(total_time % 60)
+        return {
+            'success': True,
+            'start': start,
+            'end': end,
+            'algorithm': engine,
+            'date': service_date.isoformat(),
+            'departure_time': format_clock(departure_time),
+            'arrival_time': format_clock(arrival_time),
+            'duration': total_time,
+            'duration_text': f'{minutes}分{seconds}秒 ({format_clock(departure_time)} → {format_clock(arrival_time)})',
+            'stations': len(path),
+            'legs': [
+                dict(leg, departure=format_clock(leg['departure']), arrival=format_clock(leg['arrival']))
+                for leg in legs
+            ],
+            'path': [
+                {
+                    'id': sid,
+                    'name': self.station_names.get(sid, sid),
+                    'order': i + 1
+                }
+                for i, sid in enumerate(path)
+            ]
+        }
+    
+    def get_pareto(self, start, end):
+        """/api/route?pareto=1 的结果：耗时与换乘次数的帕累托最优路线集合（按耗时升序）"""
+        stats = {}
+        try:
+            routes = pareto_routes(self.graph, start, end, stats=stats)
+        except ValueError as e:
+            return {'error': str(e)}
+        if not routes:
+            return {'error': '无法找到路线'}
+        
+        total_time, transfers, path = routes[0]
+        return {
+            'success': True,
+            'start': start,
+            'end': end,
+            'algorithm': 'pareto',
+            'settled': stats['settled'],
+            'duration': total_time,
+            'duration_text': f'{total_time // 60}分{total_time % 60}秒',
+            'stations': len(path),
+            'path': [
+                {
+                    'id': sid,
+                    'name': self.station_names.get(sid, sid),
+                    'order': i + 1
+                }
+                for i, sid in enumerate(path)
+            ],
+            'pareto': [
+                {
+                    'duration': total_time,
+                    'duration_text': f'{total_time // 60}分{total_time % 60}秒',
+                    'transfers': transfers,
+                    'stations': len(path),
+                    'path': [
+                        {'id': sid, 'name': self.station_names.get(sid, sid)}
+                        for sid in path
+                    ]
+                }
+                for total_time, transfers, path in routes
+            ]
+        }
+    
     def get_home_page(self):
         """返回主页HTML"""
         return '''<!DOCTYPE html>
@@ -313,6 +850,17 @@ class RouteHandler(BaseHTTPRequestHandler):
                 <datalist id="endSuggestions"></datalist>
             </div>
             
+            <div class="form-group">
+                <label for="algorithm">算法:</label>
+                <select id="algorithm"></select>
+            </div>
+            
+            <div class="form-group">
+                <label for="departure">出发时间 (可选，填写后按真实时刻表计算):</label>
+                <input type="time" id="departure" step="60" />
+                <input type="date" id="date" title="运营日期 (不填为今天)" />
+            </div>
+            
             <button type="submit">查询最短路线</button>
         </form>
         
@@ -370,12 +918,29 @@ class RouteHandler(BaseHTTPRequestHandler):
         updateSuggestions(startInput, 'startSuggestions');
         updateSuggestions(endInput, 'endSuggestions');
         
+        // 加载可选算法
+        (async () => {
+            const response = await fetch('/api/algorithms');
+            const data = await response.json();
+            const select = document.getElementById('algorithm');
+            data.algorithms.forEach(algorithm => {
+                const option = document.createElement('option');
+                option.value = algorithm.id;
+                option.textContent = algorithm.name;
+                option.selected = algorithm.id === data.default;
+                select.appendChild(option);
+            });
+        })();
+        
         // 表单提交
         document.getElementById('routeForm').addEventListener('submit', async (e) => {
             e.preventDefault();
             
             const start = document.getElementById('start').value.toUpperCase();
             const end = document.getElementById('end').value.toUpperCase();
+            const algorithm = document.getElementById('algorithm').value;
+            const departure = document.getElementById('departure').value;
+            const date = document.getElementById('date').value;
             
             const loading = document.getElementById('loading');
             const error = document.getElementById('error');
@@ -386,7 +951,14 @@ class RouteHandler(BaseHTTPRequestHandler):
             result.style.display = 'none';
             
             try {
-                const response = await fetch(`/api/route?start=${start}&end=${end}`);
+                let url = `/api/route?start=${start}&end=${end}&algorithm=${encodeURIComponent(algorithm)}`;
+                if (departure) {
+                    url += `&departure=${encodeURIComponent(departure)}`;
+                    if (date) {
+                        url += `&date=${encodeURIComponent(date)}`;
+                    }
+                }
+                const response = await fetch(url);
                 const data = await response.json();
                 
                 loading.style.display = 'none';
@@ -426,43 +998,112 @@ class RouteHandler(BaseHTTPRequestHandler):
 def load_data():
     """加载图数据"""
     try:
-        with open('metro_graph.pkl', 'rb') as f:
-            graph = pickle.load(f)
+        graph = load_graph()
     except FileNotFoundError:
-        print("错误：找不到 metro_graph.pkl")
+        print("错误：找不到 metro_graph.csr 或 metro_graph.pkl")
         print("请先运行 Dataprocess.py")
         sys.exit(1)
     
-    try:
-        with open('station_names.pkl', 'rb') as f:
-            station_names = pickle.load(f)
-    except:
-        station_names = {sid: sid for sid in graph.keys()}
+    station_names = load_station_names(graph)
     
     return graph, station_names
 
 
+def serve_prefork(port, processes):
+    """预 fork 多个工作进程，共用父进程创建的监听套接字
+
+    图和预处理结果在 fork 之前加载：mmap 映射的 CSR 数组、收缩层次、耗时矩阵等
+    由所有进程共享同一份物理内存页，进程数增加时常驻内存基本不变。
+    父进程只负责在工作进程意外退出时重新启动它，Ctrl+C 时结束所有进程。
+    """
+    listener = socket.create_server(('localhost', port), backlog=QUEUE_LIMIT * processes)
+    # 所有进程都会被同一个新连接唤醒，没抢到的进程 accept 时立即返回而不是阻塞
+    listener.setblocking(False)
+    # fork 之前加载的对象不再被垃圾回收器扫描，避免写时复制把共享页面逐渐复制到各进程
+    gc.freeze()
+    # kill 父进程时与 Ctrl+C 一样结束所有工作进程（工作进程也继承这一处理）
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                BoundedThreadingHTTPServer(None, RouteHandler, listener=listener).serve_forever()
+            except KeyboardInterrupt:
+                pass
+            except BaseException:
+                code = 1
+                import traceback
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        return pid
+
+    workers = {spawn() for _ in range(processes)}
+    try:
+        while True:
+            pid, status = os.wait()
+            workers.discard(pid)
+            print(f"工作进程 {pid} 已退出 (状态 {status})，重新启动")
+            time.sleep(1)
+            workers.add(spawn())
+    except KeyboardInterrupt:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+
+
 def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else WORKER_PROCESSES
+    if processes > 1 and not hasattr(os, 'fork'):
+        print("提示: 当前系统不支持 fork，改为单进程运行")
+        processes = 1
+
     # 加载数据
     print("正在加载数据...")
     RouteHandler.graph, RouteHandler.station_names = load_data()
-    print(f"✓ 已加载 {len(RouteHandler.graph)} 个站点\n")
+    RouteHandler.station_index = StationIndex(RouteHandler.graph.keys(), RouteHandler.station_names)
+    print(f"✓ 已加载 {len(RouteHandler.graph)} 个站点")
+    if get_matrix(RouteHandler.graph) is not None:
+        RouteHandler.default_algorithm = 'matrix'
+        print("✓ 已加载全站点对耗时矩阵，默认使用 'matrix' 查表")
+    elif get_hierarchy(RouteHandler.graph) is not None:
+        RouteHandler.default_algorithm = 'ch'
+        print("✓ 已加载收缩层次，默认使用 'ch' 算法")
+    print()
     
     # 启动Web服务器
     port = 8888
-    server = HTTPServer(('localhost', port), RouteHandler)
+    RouteHandler.worker_processes = processes
+    server = BoundedThreadingHTTPServer(('localhost', port), RouteHandler) if processes == 1 else None
     
     print("=" * 60)
     print("🚀 NYC Metro Route Planner - Web 版本")
     print("=" * 60)
-    print(f"\n✓ 服务器已启动")
+    if processes == 1:
+        print(f"\n✓ 服务器已启动 ({WORKER_THREADS} 个工作线程, 最多排队 {QUEUE_LIMIT} 个请求)")
+    else:
+        print(f"\n✓ 服务器已启动 ({processes} 个工作进程 × {WORKER_THREADS} 个线程, "
+              f"每个进程最多排队 {QUEUE_LIMIT} 个请求)")
     print(f"✓ 请在浏览器中打开: http://localhost:{port}\n")
     print("按 Ctrl+C 停止服务器\n")
     
     try:
-        server.serve_forever()
+        if server is not None:
+            server.serve_forever()
+        else:
+            serve_prefork(port, processes)
     except KeyboardInterrupt:
-        print("\n\n👋 服务器已停止")
+        pass
+    print("\n\n👋 服务器已停止")
 
 
 if __name__ == '__main__':
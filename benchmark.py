@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+"""
+性能测试脚本 - 对比不同实现的耗时
+Benchmark script for the graph build and route search
+
+使用方法:
+    python3 benchmark.py build    # 对比乘车边的循环构建与向量化构建
+    python3 benchmark.py search   # 对比各路线算法的查询耗时
+    python3 benchmark.py journey  # 对比按出发时间查询的 RAPTOR 与连接扫描
+    python3 benchmark.py kpaths   # 对比前 k 条最短路线的经典 Yen 算法与共享反向树的实现
+    python3 benchmark.py repair   # 对比边耗时改变后最短路径树的增量修复与完整重新搜索
+    python3 benchmark.py stations # 对比站点搜索的逐个扫描与索引（站点数放大后的每次按键耗时）
+    python3 benchmark.py fuzzy    # 带拼写错误的站名逐字输入时容错匹配的耗时与找回率
+    python3 benchmark.py ingest [GTFS目录]  # 对比一次读入与分块流式读取 stop_times.txt 的内存峰值 (Linux / macOS)
+    python3 benchmark.py parallel [GTFS目录]  # 对比单进程与多进程构建乘车边、换乘边的耗时
+"""
+
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+# 随机抽取的起终点对数量
+QUERY_PAIRS = 200
+
+# 增量修复测试: 保存的最短路径树数量、修改的边数、每次修改增加的秒数
+REPAIR_TREES = 20
+REPAIR_EDGES = 50
+REPAIR_DELAY = 300
+
+# 站点搜索测试: 把站点复制成几倍，观察每次按键的耗时是否随站点数增长；模拟输入的站点数
+STATION_SCALES = [1, 10, 100]
+STATION_QUERIES = 50
+
+# 容错匹配测试: 模拟输入的站名数，以及检查前几个结果中是否包含正确站点
+FUZZY_QUERIES = 200
+FUZZY_TOP_K = 5
+
+# 流式读取测试: 每块读取的行数
+INGEST_CHUNK_ROWS = 100000
+
+# 多进程构建测试的最大进程数（从 2 开始逐级翻倍），None 为 CPU 核数
+PARALLEL_MAX_PROCESSES = None
+
+
+def bench_build():
+    """对比 Dataprocess.py 中循环版与向量化版乘车边构建的耗时"""
+    import Dataprocess
+
+    print(f"正在从 {Dataprocess.gtfs_path} 加载 GTFS 数据...")
+    stops, stop_times, transfers = Dataprocess.load_gtfs(Dataprocess.gtfs_path)
+    print(f"共 {len(stop_times)} 条停靠记录\n")
+
+    aggregate = Dataprocess.EDGE_AGGREGATE
+
+    start = time.perf_counter()
+    loop_edges = Dataprocess.collapse_parallel_edges(
+        Dataprocess.build_ride_edges(stop_times), aggregate
+    )
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized_edges = Dataprocess.build_ride_edges_vectorized(stop_times, aggregate)
+    vectorized_seconds = time.perf_counter() - start
+
+    print(f"合并方式: '{aggregate}'")
+    print(f"  循环版:   {loop_seconds:8.3f} 秒, {len(loop_edges)} 条边")
+    print(f"  向量化版: {vectorized_seconds:8.3f} 秒, {len(vectorized_edges)} 条边")
+    print(f"  加速比:   {loop_seconds / vectorized_seconds:8.1f}x")
+    print(f"  结果一致: {'是' if loop_edges == vectorized_edges else '否'}")
+
+
+def random_pairs(graph, count=QUERY_PAIRS, seed=42):
+    """固定随机种子抽取起终点对，保证每次对比的查询相同"""
+    rng = random.Random(seed)
+    stop_ids = list(graph.keys())
+    return [tuple(rng.sample(stop_ids, 2)) for _ in range(count)]
+
+
+def bench_search():
+    """对比 Dijkstra.py 中各算法的查询耗时，并检查结果与经典 dijkstra() 一致"""
+    from GraphStore import load_graph
+    from Dijkstra import find_route, ROUTING_ALGORITHMS
+
+    graph = load_graph()
+    pairs = random_pairs(graph)
+    print(f"图: {len(graph)} 个站点, {graph.edge_count()} 条边, {len(pairs)} 组随机查询\n")
+
+    expected = [find_route(graph, s, t, 'dict') for s, t in pairs]
+    for algorithm, desc in ROUTING_ALGORITHMS.items():
+        settled = []
+        start = time.perf_counter()
+        results = []
+        for s, t in pairs:
+            stats = {}
+            results.append(find_route(graph, s, t, algorithm, stats))
+            if 'settled' in stats:
+                settled.append(stats['settled'])
+        elapsed = time.perf_counter() - start
+        same = all(r[0] == e[0] for r, e in zip(results, expected))
+        settled_text = f"{sum(settled) / len(settled):8.1f}" if settled else "       -"
+        print(f"  {algorithm:14s} {elapsed / len(pairs) * 1000:8.3f} 毫秒/次  "
+              f"平均出队节点: {settled_text}  结果一致: {'是' if same else '否'}  ({desc})")
+
+
+def bench_journey():
+    """对比 Raptor.py 与 ConnectionScan.py 的按出发时间查询耗时，并检查到达时刻一致"""
+    from Timetable import get_timetable, format_clock
+    from Raptor import earliest_arrival
+    from ConnectionScan import earliest_arrival_csa
+
+    timetable = get_timetable()
+    if timetable is None:
+        print("找不到时刻表文件 metro_timetable.bin，请先运行 Dataprocess.py")
+        return
+    # 只在有车停靠的站点之间查询，出发时间取时刻表中第一个和最后一个连接之间
+    stop_ids = [stop_id for i, stop_id in enumerate(timetable.stop_ids)
+                if timetable.stop_route_offsets[i + 1] > timetable.stop_route_offsets[i]]
+    first, last = timetable.conn_dep_time[0], timetable.conn_dep_time[-1]
+    rng = random.Random(42)
+    queries = [(*rng.sample(stop_ids, 2), rng.randint(first, last)) for _ in range(QUERY_PAIRS)]
+    print(f"时刻表: {timetable.route_count()} 条线路, {timetable.trip_count()} 趟车次, "
+          f"{timetable.connection_count()} 个连接, {len(queries)} 组随机查询 "
+          f"({format_clock(first)} - {format_clock(last)})\n")
+
+    results = {}
+    for name, engine in (('raptor', earliest_arrival), ('csa', earliest_arrival_csa)):
+        start = time.perf_counter()
+        results[name] = [engine(s, t, departure)[0] for s, t, departure in queries]
+        elapsed = time.perf_counter() - start
+        print(f"  {name:8s} {elapsed / len(queries) * 1000:8.3f} 毫秒/次")
+    same = results['raptor'] == results['csa']
+    print(f"\n  到达时刻一致: {'是' if same else '否'}")
+
+
+def bench_kpaths():
+    """对比 KShortest.py 中经典 Yen 算法与共享反向树实现的耗时，并检查各条路线耗时一致"""
+    from GraphStore import load_graph
+    from Dijkstra import dijkstra_indexed, get_kernel
+    from KShortest import KShortestPaths, k_shortest_paths, K_PATHS
+
+    graph = load_graph()
+    pairs = [(s, t) for s, t in random_pairs(graph) if dijkstra_indexed(graph, s, t)[0] is not None]
+    print(f"图: {len(graph)} 个站点, {graph.edge_count()} 条边, {len(pairs)} 组可达的随机查询, k = {K_PATHS}\n")
+
+    start = time.perf_counter()
+    for s, t in pairs:
+        dijkstra_indexed(graph, s, t)
+    single = (time.perf_counter() - start) / len(pairs) * 1000
+    print(f"  {'单条最短路':10s} {single:8.3f} 毫秒/次")
+
+    kernel = get_kernel(graph, KShortestPaths)
+    results = {}
+    for name, classic in (('经典 Yen', True), ('共享反向树', False)):
+        kernel.classic = classic
+        settled = searches = 0
+        start = time.perf_counter()
+        results[name] = []
+        for s, t in pairs:
+            stats = {}
+            results[name].append([total for total, _ in k_shortest_paths(graph, s, t, K_PATHS, stats)])
+            settled += stats['settled']
+            searches += stats['spur_searches']
+        elapsed = (time.perf_counter() - start) / len(pairs) * 1000
+        print(f"  {name:10s} {elapsed:8.3f} 毫秒/次 (单条的 {elapsed / single:5.1f} 倍)  "
+              f"平均出队节点: {settled / len(pairs):8.1f}  平均偏离搜索: {searches / len(pairs):6.1f}")
+    kernel.classic = False
+    same = results['经典 Yen'] == results['共享反向树']
+    print(f"\n  路线耗时一致: {'是' if same else '否'}")
+
+
+def bench_repair():
+    """对比 DynamicSSSP.py 的增量修复与完整重新搜索的耗时，并检查结果一致"""
+    from GraphStore import load_graph
+    from DynamicSSSP import ShortestPathTree
+
+    graph = load_graph()
+    rng = random.Random(42)
+    sources = rng.sample(range(len(graph)), REPAIR_TREES)
+    trees = [ShortestPathTree(graph, s) for s in sources]
+    print(f"图: {len(graph)} 个站点, {graph.edge_count()} 条边, {len(trees)} 棵最短路径树, "
+          f"依次把 {REPAIR_EDGES} 条随机边变慢 {REPAIR_DELAY} 秒再恢复\n")
+
+    repair_time = rebuild_time = 0.0
+    repair_settled = rebuild_settled = 0
+    same = True
+    for e in rng.sample(range(graph.edge_count()), REPAIR_EDGES):
+        pair = (graph.edge_source(e), graph.targets[e])
+        original = graph.weights[e]
+        for weight in (original + REPAIR_DELAY, original):
+            graph.set_weights({e: weight})
+            start = time.perf_counter()
+            for tree in trees:
+                repair_settled += tree.repair([pair])
+            repair_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            fresh = [ShortestPathTree(graph, s) for s in sources]
+            rebuild_time += time.perf_counter() - start
+            rebuild_settled += sum(tree.settled for tree in fresh)
+            same = same and all(a.distance == b.distance for a, b in zip(trees, fresh))
+
+    updates = REPAIR_EDGES * 2 * len(trees)
+    print(f"  {'完整重新搜索':8s} {rebuild_time / updates * 1000:8.3f} 毫秒/棵  平均出队节点: {rebuild_settled / updates:8.1f}")
+    print(f"  {'增量修复':8s} {repair_time / updates * 1000:8.3f} 毫秒/棵  平均出队节点: {repair_settled / updates:8.1f}")
+    print(f"\n  结果一致: {'是' if same else '否'}")
+
+
+def bench_stations():
+    """对比逐个扫描全部站点的子串匹配与 StationIndex 的每次按键耗时"""
+    from GraphStore import load_graph, load_station_names
+    from StationIndex import StationIndex, SEARCH_LIMIT
+
+    graph = load_graph()
+    station_names = load_station_names(graph)
+    rng = random.Random(42)
+    # 模拟逐字输入站点ID和站名：每个前缀算一次按键
+    keystrokes = []
+    for stop_id in rng.sample(list(graph.keys()), min(STATION_QUERIES, len(graph))):
+        for text in (stop_id, station_names.get(stop_id, stop_id)):
+            keystrokes.extend(text[:k].lower() for k in range(1, len(text) + 1))
+    print(f"{len(keystrokes)} 次按键，每次最多返回 {SEARCH_LIMIT} 个结果\n")
+
+    for scale in STATION_SCALES:
+        # 复制出的站点ID加上后缀，站名不变
+        names = {}
+        for k in range(scale):
+            for stop_id in graph.keys():
+                names[f"{stop_id}-{k}" if k else stop_id] = station_names.get(stop_id, stop_id)
+        stations = sorted(names)
+
+        start = time.perf_counter()
+        for query in keystrokes:
+            [s for s in stations if query in s.lower() or query in names[s].lower()][:SEARCH_LIMIT]
+        scan = (time.perf_counter() - start) / len(keystrokes) * 1000
+
+        start = time.perf_counter()
+        index = StationIndex(stations, names)
+        build = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for query in keystrokes:
+            index.search(query)
+        indexed = (time.perf_counter() - start) / len(keystrokes) * 1000
+
+        print(f"  {len(stations):7d} 个站点  逐个扫描 {scan:8.3f} 毫秒/次  "
+              f"索引 {indexed:6.3f} 毫秒/次  (构建索引 {build:8.1f} 毫秒)")
+
+
+def misspell(name, rng):
+    """在站名中一个不少于 4 个字符的单词里随机制造一处错误（删除、替换或交换相邻字符）"""
+    import re
+
+    spans = [m.span() for m in re.finditer(r'\w{4,}', name)]
+    if not spans:
+        return name
+    begin, end = rng.choice(spans)
+    i = rng.randrange(begin, end - 1)
+    kind = rng.randrange(3)
+    if kind == 0:
+        return name[:i] + name[i + 1:]
+    if kind == 1:
+        return name[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + name[i + 1:]
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def bench_fuzzy():
+    """逐字输入带一处拼写错误的站名，统计 StationIndex 每次按键的耗时和最终的找回率"""
+    from GraphStore import load_graph, load_station_names
+    from StationIndex import StationIndex
+
+    graph = load_graph()
+    station_names = load_station_names(graph)
+    index = StationIndex(graph.keys(), station_names)
+    rng = random.Random(42)
+    stops = [rng.choice(list(graph.keys())) for _ in range(FUZZY_QUERIES)]
+    typed = [misspell(station_names.get(s, s), rng) for s in stops]
+    print(f"{len(index)} 个站点, {len(typed)} 个带拼写错误的站名 (例如 {typed[0]!r})\n")
+
+    latencies = []
+    found = substring_found = 0
+    for stop_id, text in zip(stops, typed):
+        for k in range(1, len(text) + 1):
+            start = time.perf_counter()
+            result = index.search(text[:k], FUZZY_TOP_K)
+            latencies.append(time.perf_counter() - start)
+        # 同名的站台（如上下行）都算找到
+        name = station_names.get(stop_id, stop_id)
+        found += any(station_names.get(s, s) == name for s in result)
+        substring_found += text.lower() in name.lower()
+    latencies.sort()
+    print(f"  每次按键: 平均 {sum(latencies) / len(latencies) * 1000:6.3f} 毫秒, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.3f} 毫秒, "
+          f"最大 {latencies[-1] * 1000:6.3f} 毫秒 ({len(latencies)} 次按键)")
+    print(f"  前 {FUZZY_TOP_K} 个结果包含正确站点: 容错匹配 {found / len(typed):.0%}, "
+          f"子串匹配 {substring_found / len(typed):.0%}")
+
+
+def _peak_rss_mb():
+    """当前进程的内存峰值 (MB)"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def _ingest_child(mode, path):
+    """在子进程中按 mode 读取 GTFS 并构建乘车边与时刻表（'edges' 只构建乘车边），输出一行 JSON"""
+    import hashlib
+    import pickle
+    import Dataprocess
+
+    baseline = _peak_rss_mb()
+    aggregate = Dataprocess.EDGE_AGGREGATE
+    start = time.perf_counter()
+    if mode == 'full':
+        stops, stop_times, transfers = Dataprocess.load_gtfs(path)
+        ride_edges = Dataprocess.build_ride_edges_vectorized(stop_times, aggregate)
+    else:
+        stops, stop_times, transfers, ride_edges = Dataprocess.load_gtfs_streaming(
+            path, aggregate, INGEST_CHUNK_ROWS, keep_stop_times=mode != 'edges')
+    edges_peak = _peak_rss_mb()
+    edges_digest = hashlib.sha1(pickle.dumps(ride_edges)).hexdigest()
+    digest = None
+    if stop_times is not None:
+        timetable = Dataprocess.build_timetable(stops, stop_times, transfers)
+        digest = hashlib.sha1(edges_digest.encode('ascii'))
+        for name in sorted(timetable):
+            digest.update(bytes(timetable[name]))
+        digest = digest.hexdigest()
+    seconds = time.perf_counter() - start
+    print(json.dumps({
+        'rows': None if stop_times is None else len(stop_times), 'edges': len(ride_edges), 'seconds': seconds,
+        'baseline': baseline, 'edges_peak': edges_peak, 'peak': _peak_rss_mb(),
+        'edges_digest': edges_digest, 'digest': digest,
+    }))
+
+
+def bench_ingest():
+    """对比一次读入与分块流式读取 stop_times.txt 的内存峰值（各自在独立的子进程中运行）"""
+    import Dataprocess
+
+    if len(sys.argv) > 2 and sys.argv[2] == '--child':
+        _ingest_child(sys.argv[3], sys.argv[4])
+        return
+    if sys.platform == 'win32':
+        # 子进程用 resource 模块读取内存峰值，Windows 上没有
+        print("内存峰值测试需要 resource 模块（Linux / macOS）。")
+        return
+    path = sys.argv[2] if len(sys.argv) > 2 else Dataprocess.gtfs_path
+    if not path.endswith(('/', '\\')):
+        path += '/'
+
+    print(f"GTFS 目录: {path}, 流式读取每块 {INGEST_CHUNK_ROWS} 行, 合并方式 '{Dataprocess.EDGE_AGGREGATE}'\n")
+    results = {}
+    for mode, label in (('full', '一次读入'), ('stream', '流式读取'), ('edges', '流式只建边')):
+        output = subprocess.run([sys.executable, __file__, 'ingest', '--child', mode, path],
+                                capture_output=True, text=True)
+        if output.returncode != 0:
+            print(output.stderr)
+            return
+        result = results[mode] = json.loads(output.stdout.splitlines()[-1])
+        timetable_text = f", 构建时刻表 {result['peak']:.1f} MB" if result['digest'] else ''
+        print(f"  {label}: {result['seconds']:7.2f} 秒, 内存峰值: 导入模块后 {result['baseline']:.1f} MB, "
+              f"读取并构建乘车边 {result['edges_peak']:.1f} MB{timetable_text}")
+
+    full, stream, edges = results['full'], results['stream'], results['edges']
+    print(f"\n  {full['rows']} 条停靠记录, {full['edges']} 条乘车边")
+    for key, label in (('edges_peak', '读取并构建乘车边'), ('peak', '含时刻表')):
+        print(f"  {label}增加的内存峰值: {full[key] - full['baseline']:7.1f} MB -> "
+              f"{stream[key] - stream['baseline']:7.1f} MB")
+    print(f"  不保留停靠记录 (BUILD_TIMETABLE = False) 时构建乘车边增加的内存峰值: "
+          f"{edges['edges_peak'] - edges['baseline']:7.1f} MB")
+    print(f"  乘车边与时刻表一致: {'是' if full['digest'] == stream['digest'] else '否'}")
+    print(f"  只建边时乘车边一致: {'是' if full['edges_digest'] == edges['edges_digest'] else '否'}")
+
+
+def bench_parallel():
+    """对比单进程与多进程构建乘车边和换乘边的耗时，并检查结果是否完全相同"""
+    import Dataprocess
+
+    path = sys.argv[2] if len(sys.argv) > 2 else Dataprocess.gtfs_path
+    if not path.endswith(('/', '\\')):
+        path += '/'
+    print(f"正在从 {path} 加载 GTFS 数据...")
+    stops, stop_times, transfers = Dataprocess.load_gtfs(path)
+    aggregate = Dataprocess.EDGE_AGGREGATE
+    cores = os.cpu_count()
+    print(f"共 {len(stop_times)} 条停靠记录, 合并方式 '{aggregate}', CPU 核数 {cores}\n")
+
+    start = time.perf_counter()
+    serial_kinds = []
+    serial = (Dataprocess.build_ride_edges_vectorized(stop_times, aggregate),
+              Dataprocess.build_transfer_edges(stops, transfers, serial_kinds))
+    serial_seconds = time.perf_counter() - start
+    print(f"  单进程:    {serial_seconds:7.3f} 秒")
+
+    processes = 2
+    while processes <= max(2, PARALLEL_MAX_PROCESSES or cores):
+        start = time.perf_counter()
+        kinds = []
+        result = Dataprocess.build_edges_parallel(stops, stop_times, transfers, aggregate, processes,
+                                                  transfer_kinds=kinds)
+        seconds = time.perf_counter() - start
+        same = result == serial and kinds == serial_kinds
+        print(f"  {processes:2d} 个进程: {seconds:7.3f} 秒, 加速比 {serial_seconds / seconds:5.2f}x, "
+              f"结果一致: {'是' if same else '否'}")
+        processes *= 2
+
+
+BENCHMARKS = {
+    'build': bench_build,
+    'search': bench_search,
+    'journey': bench_journey,
+    'kpaths': bench_kpaths,
+    'repair': bench_repair,
+    'stations': bench_stations,
+    'fuzzy': bench_fuzzy,
+    'ingest': bench_ingest,
+    'parallel': bench_parallel,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"用法: python3 benchmark.py <{'|'.join(BENCHMARKS)}>")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Web.py 本地压力测试 - 逐级提高并发数，统计延迟分位数
+Local load test for Web.py: p50 / p99 latency at increasing concurrency
+
+先在另一个终端启动 python3 Web.py，然后:
+    python3 load_test.py [服务器地址] [每级请求数]
+
+请求按固定比例混合路线查询 (/api/route) 与站点搜索 (/api/stations)，
+起终点从 /api/stations 返回的站点中随机抽取。503 (服务器繁忙) 单独计数，不计入延迟。
+"""
+
+import json
+import math
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_URL = 'http://localhost:8888'
+
+# 逐级测试的并发数，以及每级发出的请求数
+CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32, 64]
+REQUESTS_PER_LEVEL = 400
+
+# 路线查询占全部请求的比例（其余为站点搜索）
+ROUTE_RATIO = 0.5
+
+TIMEOUT = 30
+
+
+def percentile(values, p):
+    """已排序列表的 p 分位数（最近秩法）"""
+    if not values:
+        return float('nan')
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def make_paths(base_url, count, seed=42):
+    """生成 count 个请求路径"""
+    with urllib.request.urlopen(f'{base_url}/api/stations', timeout=TIMEOUT) as response:
+        stations = [s['id'] for s in json.load(response)['stations']]
+    rng = random.Random(seed)
+    paths = []
+    for _ in range(count):
+        if rng.random() < ROUTE_RATIO:
+            start, end = rng.sample(stations, 2)
+            paths.append(f'/api/route?start={start}&end={end}')
+        else:
+            paths.append(f'/api/stations?search={rng.choice(stations)[:2].lower()}')
+    return paths
+
+
+def run_level(base_url, paths, concurrency):
+    """用 concurrency 个线程发完 paths，返回 (延迟列表, 503 数, 错误数, 总耗时)"""
+    latencies = []
+    rejected = errors = 0
+    lock = threading.Lock()
+    next_index = 0
+
+    def worker():
+        nonlocal next_index, rejected, errors
+        while True:
+            with lock:
+                if next_index >= len(paths):
+                    return
+                path = paths[next_index]
+                next_index += 1
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=TIMEOUT) as response:
+                    response.read()
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+            except urllib.error.HTTPError as e:
+                with lock:
+                    if e.code == 503:
+                        rejected += 1
+                    else:
+                        errors += 1
+            except OSError:
+                with lock:
+                    errors += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), rejected, errors, time.perf_counter() - start
+
+
+def main():
+    base_url = sys.argv[1].rstrip('/') if len(sys.argv) > 1 else DEFAULT_URL
+    per_level = int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS_PER_LEVEL
+
+    try:
+        paths = make_paths(base_url, per_level)
+    except OSError as e:
+        print(f"错误: 无法连接 {base_url} ({e})，请先运行 python3 Web.py")
+        sys.exit(1)
+
+    print(f"服务器: {base_url}, 每级 {per_level} 个请求 (路线查询 {ROUTE_RATIO:.0%})\n")
+    print(f"{'并发':>6} {'吞吐(次/秒)':>12} {'p50(毫秒)':>10} {'p99(毫秒)':>10} {'最大(毫秒)':>10} {'503':>6} {'错误':>6}")
+    for concurrency in CONCURRENCY_LEVELS:
+        latencies, rejected, errors, elapsed = run_level(base_url, paths, concurrency)
+        print(f"{concurrency:>6} {len(latencies) / elapsed:>12.1f} "
+              f"{percentile(latencies, 50) * 1000:>10.2f} {percentile(latencies, 99) * 1000:>10.2f} "
+              f"{(latencies[-1] if latencies else float('nan')) * 1000:>10.2f} {rejected:>6} {errors:>6}")
+
+
+if __name__ == "__main__":
+    main()